@@ -2,6 +2,9 @@ from flask import Flask
 from dotenv import load_dotenv
 import os
 from app.utils.logging_config import setup_logger
+from app.utils.compression import init_compression
+from app.utils.admission import init_admission, parse_class_settings
+from app.utils.deadlines import init_deadlines
 from app import db, api
 
 # Load environment variables from .env file
@@ -19,29 +22,108 @@ def create_app(test_config=None):
         app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     else:
         app.config.update(test_config)
+    app.config.setdefault('LEDGER_ARCHIVE_DIR', os.getenv('LEDGER_ARCHIVE_DIR', 'archive/movements'))
+    app.config.setdefault('CHANGES_POLL_INTERVAL', float(os.getenv('CHANGES_POLL_INTERVAL', 5)))
+    app.config.setdefault('CHANGES_HEARTBEAT_INTERVAL', float(os.getenv('CHANGES_HEARTBEAT_INTERVAL', 15)))
+    app.config.setdefault('CHANGES_STREAM_MAX_SECONDS', float(os.getenv('CHANGES_STREAM_MAX_SECONDS', 300)))
+    app.config.setdefault('NOTIFY_WEBHOOK_URLS', os.getenv('NOTIFY_WEBHOOK_URLS', ''))
+    app.config.setdefault('NOTIFY_BATCH_SIZE', int(os.getenv('NOTIFY_BATCH_SIZE', 100)))
+    app.config.setdefault('NOTIFY_POLL_INTERVAL', float(os.getenv('NOTIFY_POLL_INTERVAL', 2)))
+    app.config.setdefault('NOTIFY_TIMEOUT', float(os.getenv('NOTIFY_TIMEOUT', 5)))
+    app.config.setdefault('NOTIFY_BACKOFF_BASE', float(os.getenv('NOTIFY_BACKOFF_BASE', 1)))
+    app.config.setdefault('NOTIFY_BACKOFF_MAX', float(os.getenv('NOTIFY_BACKOFF_MAX', 300)))
+    app.config.setdefault('NOTIFY_LEASE_SECONDS', float(os.getenv('NOTIFY_LEASE_SECONDS', 60)))
+    app.config.setdefault('GROUP_COMMIT_ENABLED', os.getenv('GROUP_COMMIT_ENABLED', 'false').lower() == 'true')
+    app.config.setdefault('GROUP_COMMIT_WINDOW_MS', float(os.getenv('GROUP_COMMIT_WINDOW_MS', 2)))
+    app.config.setdefault('GROUP_COMMIT_MAX_BATCH', int(os.getenv('GROUP_COMMIT_MAX_BATCH', 64)))
+    app.config.setdefault('SHARD_DATABASE_URLS', os.getenv('SHARD_DATABASE_URLS', ''))
+    app.config.setdefault('SHARD_MAP', os.getenv('SHARD_MAP', ''))
+    app.config.setdefault('ADMISSION_ENABLED', os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true')
+    app.config.setdefault('ADMISSION_LIMITS', os.getenv('ADMISSION_LIMITS', ''))
+    app.config.setdefault('ADMISSION_QUEUES', os.getenv('ADMISSION_QUEUES', ''))
+    app.config.setdefault('ADMISSION_MAX_WAIT_MS', os.getenv('ADMISSION_MAX_WAIT_MS', ''))
+    app.config.setdefault('ADMISSION_POOL_WAIT_TARGET_MS', float(os.getenv('ADMISSION_POOL_WAIT_TARGET_MS', 50)))
+    app.config.setdefault('ADMISSION_RETRY_AFTER', int(os.getenv('ADMISSION_RETRY_AFTER', 1)))
+    app.config.setdefault('DEADLINE_DEFAULTS_MS', parse_class_settings(
+        os.getenv('DEADLINE_DEFAULTS_MS', 'transfers=5000,reads=2000,bulk=30000'), 'DEADLINE_DEFAULTS_MS'
+    ))
+    app.config.setdefault('DEADLINE_MAX_MS', int(os.getenv('DEADLINE_MAX_MS', 120000)))
+    app.config.setdefault('JOBS_PROCESSES', int(os.getenv('JOBS_PROCESSES', 2)))
+    app.config.setdefault('JOBS_POLL_INTERVAL', float(os.getenv('JOBS_POLL_INTERVAL', 1)))
+    app.config.setdefault('JOBS_LEASE_SECONDS', float(os.getenv('JOBS_LEASE_SECONDS', 300)))
+    app.config.setdefault('JOBS_MAX_ATTEMPTS', int(os.getenv('JOBS_MAX_ATTEMPTS', 3)))
+    app.config.setdefault('JOBS_CHUNK_SIZE', int(os.getenv('JOBS_CHUNK_SIZE', 1000)))
+    if str(app.config.get('SQLALCHEMY_DATABASE_URI') or '').startswith('postgresql'):
+        # gunicorn.conf.py sizes the pool from the worker's concurrency
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+            'pool_pre_ping': True,
+        })
 
     db.init_app(app)
     api.init_app(app)
+    init_compression(app)
+    init_admission(app)
+    init_deadlines(app, api)
 
     # Import routes
     from app.routes.inventory import inventory_bp, api as inventory_ns
     from app.routes.products import products_bp, api as products_ns
     from app.routes.store import store_bp, api as store_ns
+    from app.routes.reports import reports_bp, api as reports_ns
+    from app.routes.changes import changes_bp, api as changes_ns
+    from app.routes.sync import sync_bp, api as sync_ns
+    from app.routes.jobs import jobs_bp, api as jobs_ns
 
     # Register blueprints and namespaces
     app.register_blueprint(inventory_bp, url_prefix='/api/inventory')
     app.register_blueprint(products_bp, url_prefix='/api/products')
     app.register_blueprint(store_bp, url_prefix='/api/stores')
+    app.register_blueprint(reports_bp, url_prefix='/api/reports')
+    app.register_blueprint(changes_bp, url_prefix='/api/changes')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
     api.add_namespace(inventory_ns, path='/inventory')
     api.add_namespace(products_ns, path='/products')
     api.add_namespace(store_ns, path='/stores')
+    api.add_namespace(reports_ns, path='/reports')
+    api.add_namespace(changes_ns, path='/changes')
+    api.add_namespace(sync_ns, path='/sync')
+    api.add_namespace(jobs_ns, path='/jobs')
+
+    from app.utils.sharding import init_sharding
+    init_sharding(app)
+    from app.services.group_commit import init_group_commit
+    init_group_commit(app)
+
+    # Register maintenance commands
+    from app.services.ledger import ledger_cli
+    from app.services import checkpoints, rebuild  # noqa: F401 (register `ledger` subcommands)
+    from app.services import counters  # noqa: F401 (register `inventory` subcommands)
+    from app.services.rollups import reports_cli
+    from app.services.recommendations import inventory_cli
+    from app.services.notifications import notifications_cli
+    from app.services.shards import shards_cli
+    from app.services.jobs import jobs_cli
+    from app.services.stores import stores_cli
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(reports_cli)
+    app.cli.add_command(inventory_cli)
+    app.cli.add_command(notifications_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(stores_cli)
 
     return app
 
 
 def init_db(app):
+    from app.utils import sharding
     with app.app_context():
         db.create_all()
+        sharding.create_all(app)
 
 
 app = create_app()
@@ -0,0 +1,40 @@
+from app.main import db
+from datetime import datetime
+
+# SQLite only treats INTEGER primary keys as 64-bit rowids
+SequenceType = db.BigInteger().with_variant(db.Integer, 'sqlite')
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_store_seq', 'store_id', 'seq'),
+        db.Index('ix_change_log_product_seq', 'product_id', 'seq'),
+        db.Index('ix_change_log_entity_seq', 'entity', 'seq'),
+    )
+
+    seq = db.Column(SequenceType, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.String(36), nullable=False)
+    product_id = db.Column(db.String(36))
+    store_id = db.Column(db.String(36))
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'entity': self.entity,
+            'entity_id': self.entity_id,
+            'product_id': self.product_id,
+            'store_id': self.store_id,
+            'op': self.op,
+            'changed_at': self.changed_at.isoformat()
+        }
+
+
+class ChangeCounter(db.Model):
+    """Single-row counter handing out change sequence numbers at commit time."""
+    __tablename__ = 'change_counter'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    value = db.Column(SequenceType, nullable=False, default=0)
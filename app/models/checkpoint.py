@@ -0,0 +1,23 @@
+from app.main import db
+from datetime import datetime
+
+class StockCheckpoint(db.Model):
+    __table_args__ = (
+        db.Index('ix_stock_checkpoint_store_taken', 'store_id', 'taken_at'),
+        db.Index('ix_stock_checkpoint_product_taken', 'product_id', 'taken_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), nullable=False)
+    store_id = db.Column(db.String(36), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'store_id': self.store_id,
+            'quantity': self.quantity,
+            'taken_at': self.taken_at.isoformat()
+        }
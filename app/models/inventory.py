@@ -3,6 +3,10 @@ from datetime import datetime
 from app.models.product import Product
 
 class Inventory(db.Model):
+    __table_args__ = (
+        db.Index('ix_inventory_store_product', 'store_id', 'product_id'),
+    )
+
     id = db.Column(db.String(36), primary_key=True)
     product_id = db.Column(db.String(36), db.ForeignKey('product.id'), nullable=False)
     store_id = db.Column(db.String(36), nullable=False)
@@ -0,0 +1,16 @@
+from app.main import db
+
+class InventorySlot(db.Model):
+    """One counter slot of an inventory row in hot-row mode.
+
+    The row's quantity is the sum of its slots. No slot may go negative, so
+    neither can the sum.
+    """
+    __tablename__ = 'inventory_slot'
+    __table_args__ = (
+        db.CheckConstraint('quantity >= 0', name='ck_inventory_slot_quantity'),
+    )
+
+    inventory_id = db.Column(db.String(36), db.ForeignKey('inventory.id'), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
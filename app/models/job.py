@@ -0,0 +1,54 @@
+from app.main import db
+from datetime import datetime
+
+class Job(db.Model):
+    """A long-running operation queued for the job workers.
+
+    A job is ``queued`` until a worker claims it, ``running`` while a worker
+    holds its lease, and ends ``succeeded`` (with ``result``) or ``failed``
+    (with ``error``). ``checkpoint`` is written together with each finished
+    chunk of work, so a job whose worker died resumes where it left off.
+    ``attempts`` counts the claims and fences out a worker whose lease expired.
+    """
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_state_created', 'state', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    state = db.Column(db.String(10), nullable=False, default='queued')
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer)
+    checkpoint = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))
+    lease_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def params_summary(self):
+        """``params`` with each list (import lines, counts) replaced by its length."""
+        return {name: {'count': len(value)} if isinstance(value, list) else value
+                for name, value in (self.params or {}).items()}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params_summary(),
+            'state': self.state,
+            'progress': {'done': self.progress_done, 'total': self.progress_total},
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
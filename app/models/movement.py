@@ -8,14 +8,21 @@ class MovementType(Enum):
     TRANSFER = 'TRANSFER'
 
 class Movement(db.Model):
+    # The ledger is range-partitioned by month on PostgreSQL, which requires the
+    # partition key to be part of the table's primary key. The ORM identity stays
+    # on ``id`` alone so lookups by id keep working.
+    __table_args__ = {'postgresql_partition_by': 'RANGE (timestamp)'}
+
     id = db.Column(db.String(36), primary_key=True)
-    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), nullable=False)
-    source_store_id = db.Column(db.String(36))
-    target_store_id = db.Column(db.String(36))
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), nullable=False, index=True)
+    source_store_id = db.Column(db.String(36), index=True)
+    target_store_id = db.Column(db.String(36), index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, primary_key=True, nullable=False, default=datetime.utcnow, index=True)
     type = db.Column(db.Enum(MovementType), nullable=False)
 
+    __mapper_args__ = {'primary_key': [id]}
+
     product = db.relationship('Product', backref=db.backref('movements', lazy=True))
 
     def to_dict(self):
@@ -0,0 +1,41 @@
+from app.main import db
+from datetime import datetime
+
+class LowStockOutbox(db.Model):
+    """Undelivered low-stock notifications, at most one per (product, store).
+
+    A crossing for a pair that still has an undelivered row replaces its state
+    and ``event_id`` instead of queueing a second notification.
+    """
+    __tablename__ = 'low_stock_outbox'
+    __table_args__ = (
+        db.Index('ix_low_stock_outbox_next_attempt', 'next_attempt_at'),
+    )
+
+    product_id = db.Column(db.String(36), primary_key=True)
+    store_id = db.Column(db.String(36), primary_key=True)
+    event_id = db.Column(db.String(36), nullable=False)
+    inventory_id = db.Column(db.String(36), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    min_stock = db.Column(db.Integer, nullable=False)
+    occurrences = db.Column(db.Integer, nullable=False, default=1)
+    first_detected_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    detected_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+
+    def to_dict(self):
+        return {
+            'event_id': self.event_id,
+            'kind': self.kind,
+            'inventory_id': self.inventory_id,
+            'product_id': self.product_id,
+            'store_id': self.store_id,
+            'quantity': self.quantity,
+            'min_stock': self.min_stock,
+            'occurrences': self.occurrences,
+            'first_detected_at': self.first_detected_at.isoformat(),
+            'detected_at': self.detected_at.isoformat()
+        }
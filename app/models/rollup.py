@@ -0,0 +1,28 @@
+from app.main import db
+from app.models.movement import MovementType
+
+class MovementDailyRollup(db.Model):
+    __tablename__ = 'movement_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_movement_daily_rollup_store_day', 'store_id', 'day'),
+        db.Index('ix_movement_daily_rollup_product_day', 'product_id', 'day'),
+    )
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), primary_key=True)
+    store_id = db.Column(db.String(36), primary_key=True)
+    type = db.Column(db.Enum(MovementType), primary_key=True)
+    units_in = db.Column(db.Integer, nullable=False, default=0)
+    units_out = db.Column(db.Integer, nullable=False, default=0)
+    movement_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'product_id': self.product_id,
+            'store_id': self.store_id,
+            'type': self.type.value,
+            'units_in': self.units_in,
+            'units_out': self.units_out,
+            'movement_count': self.movement_count
+        }
@@ -0,0 +1,40 @@
+from app.main import db
+from datetime import datetime
+
+class ShardTransfer(db.Model):
+    """A transfer between stores on different shards, kept on the source shard.
+
+    The row is written together with the reservation that takes the stock out
+    of the source store. It stays ``reserved`` until the target shard has
+    applied the movement, then becomes ``committed``, or ``released`` when the
+    reserved stock went back to the source store.
+    """
+    __tablename__ = 'shard_transfer'
+    __table_args__ = (
+        db.Index('ix_shard_transfer_state_created', 'state', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)
+    product_id = db.Column(db.String(36), nullable=False)
+    source_store_id = db.Column(db.String(36), nullable=False)
+    target_store_id = db.Column(db.String(36), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.String(10), nullable=False, default='reserved')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AppliedTransfer(db.Model):
+    """A cross-shard transfer the target shard has taken in, kept on the target shard.
+
+    Written in the same transaction as the target's movement. Its primary key
+    lets step 2 run once per transfer: a second run, such as ``flask shards
+    recover`` racing the request that reserved the transfer, cannot insert it
+    and reports the first run's outcome instead of adding the stock again.
+    ``error`` is the target's rejection, None when the stock was added.
+    """
+    __tablename__ = 'applied_transfer'
+
+    id = db.Column(db.String(36), primary_key=True)
+    error = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,30 @@
+from app.main import db
+from datetime import datetime
+
+class Store(db.Model):
+    """A store and running totals over its inventory.
+
+    The row is created the first time the store is stocked. Its totals are
+    updated by ``app.services.stores`` in the same transaction as every stock,
+    threshold or price change, so reading them never scans the inventory.
+    """
+    __tablename__ = 'store'
+
+    id = db.Column(db.String(36), primary_key=True)
+    sku_count = db.Column(db.Integer, nullable=False, default=0)
+    total_units = db.Column(db.BigInteger, nullable=False, default=0)
+    total_value = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    low_stock_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sku_count': self.sku_count,
+            'total_units': self.total_units,
+            'total_value': float(self.total_value),
+            'low_stock_count': self.low_stock_count,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
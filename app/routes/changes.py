@@ -0,0 +1,127 @@
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from flask_restx import Namespace, Resource, fields
+from app.main import db
+from app.services import changes
+from app.utils import sharding
+from app.utils.admission import BULK, admit
+from app.utils.logging_config import log_endpoint
+from time import monotonic
+import json
+
+changes_bp = Blueprint('changes', __name__)
+api = Namespace('changes', description='Change feed operations')
+
+change_model = api.model('Change', {
+    'seq': fields.Integer(description='Monotonic change sequence number'),
+    'entity': fields.String(description='Changed entity', enum=[changes.PRODUCT, changes.INVENTORY]),
+    'entity_id': fields.String(description='Identifier of the changed row'),
+    'product_id': fields.String(description='Product ID'),
+    'store_id': fields.String(description='Store ID (inventory changes only)'),
+    'op': fields.String(description='Change operation', enum=[changes.UPSERT, changes.DELETE]),
+    'changed_at': fields.DateTime(description='Commit timestamp'),
+    'quantity': fields.Integer(description='Current quantity (inventory upserts only)'),
+    'min_stock': fields.Integer(description='Current minimum stock (inventory upserts only)')
+})
+
+change_page_model = api.model('ChangePage', {
+    'changes': fields.List(fields.Nested(change_model)),
+    'next_since': fields.Integer(description='Value to pass as `since` on the next poll'),
+    'has_more': fields.Boolean(description='Whether more changes are immediately available')
+})
+
+error_model = api.model('Error', {
+    'error': fields.String(required=True, description='Error message')
+})
+
+change_filter_params = {
+    'since': {'description': 'Return changes after this sequence number', 'type': 'integer', 'default': 0},
+    'store_id': {'description': 'Only inventory changes of this store'},
+    'product_id': {'description': 'Only changes of this product'},
+}
+
+
+def _since():
+    """Read the resume point from ``since`` or an SSE ``Last-Event-ID`` header."""
+    value = request.args.get('since', request.headers.get('Last-Event-ID', 0))
+    since = int(value)
+    if since < 0:
+        raise ValueError(value)
+    return since
+
+
+@api.route('')
+class ChangeFeed(Resource):
+    @api.doc('list_changes', params={
+        **change_filter_params,
+        'limit': {'description': 'Maximum number of changes', 'type': 'integer', 'default': 500},
+    })
+    @api.response(200, 'Success', change_page_model)
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    @sharding.store_scoped
+    def get(self):
+        """Poll for product and inventory changes since a sequence number"""
+        try:
+            since = _since()
+        except (TypeError, ValueError):
+            return {'error': 'since must be a non-negative integer'}, 400
+        limit = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+
+        items = changes.changes_since(
+            db.session, since, request.args.get('store_id'), request.args.get('product_id'), limit + 1
+        )
+        has_more = len(items) > limit
+        items = items[:limit]
+        return api.marshal({
+            'changes': items,
+            'next_since': items[-1]['seq'] if items else since,
+            'has_more': has_more
+        }, change_page_model), 200
+
+
+@api.route('/stream')
+class ChangeStream(Resource):
+    @api.doc('stream_changes', params=change_filter_params)
+    @api.response(200, 'Server-sent event stream of changes')
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @sharding.store_scoped
+    def get(self):
+        """Stream product and inventory changes as server-sent events"""
+        try:
+            since = _since()
+        except (TypeError, ValueError):
+            return {'error': 'since must be a non-negative integer'}, 400
+        store_id = request.args.get('store_id')
+        product_id = request.args.get('product_id')
+
+        poll_interval = current_app.config['CHANGES_POLL_INTERVAL']
+        heartbeat = current_app.config['CHANGES_HEARTBEAT_INTERVAL']
+        max_duration = current_app.config['CHANGES_STREAM_MAX_SECONDS']
+
+        def generate():
+            seen = since
+            started = last_sent = monotonic()
+            yield f'retry: {int(poll_interval * 1000)}\n\n'
+            while monotonic() - started < max_duration:
+                # Any commit after this mark wakes the wait below, even if it lands mid-query
+                mark = changes.notifier.latest
+                items = changes.changes_since(db.session, seen, store_id, product_id)
+                # Release the connection while idle so waiting clients hold no pool slot
+                db.session.remove()
+                if sharding.enabled():
+                    sharding.route(db.session, [store_id])
+                for item in items:
+                    seen = item['seq']
+                    yield f'id: {seen}\nevent: change\ndata: {json.dumps(item)}\n\n'
+                if items:
+                    last_sent = monotonic()
+                    continue
+                if monotonic() - last_sent >= heartbeat:
+                    last_sent = monotonic()
+                    yield ': keep-alive\n\n'
+                changes.notifier.wait(mark, poll_interval)
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -1,9 +1,19 @@
-from flask import Blueprint, request
+from flask import Blueprint, Response, current_app, request, stream_with_context
 from flask_restx import Namespace, Resource, fields
 from app.models.inventory import Inventory
 from app.models.movement import Movement, MovementType
+from app.models.product import Product
 from app.main import db
+from app.services import (
+    adjustments, bulk_updates, checkpoints, counters, group_commit, ledger, rebalance, recommendations, shards
+)
+from app.utils.fieldsets import requested_fields, requested_includes, serialize_value
+from app.utils import sharding
+from app.utils.admission import BULK, TRANSFERS, admit
 from app.utils.logging_config import log_endpoint
+from app.utils.params import parse_timestamp
+from sqlalchemy import tuple_
+import json
 import uuid
 
 inventory_bp = Blueprint('inventory', __name__)
@@ -69,9 +79,12 @@ class InventoryTransfer(Resource):
     @api.doc('transfer_inventory')
     @api.expect(transfer_request_model)
     @api.response(201, 'Transfer successful', movement_model)
+    @api.response(202, 'Reserved on the source shard; completed by `flask shards recover`')
     @api.response(400, 'Validation Error', error_model)
     @api.response(404, 'Source inventory not found', error_model)
+    @api.response(503, 'Group commit failed; nothing applied', error_model)
     @log_endpoint
+    @admit(TRANSFERS)
     def post(self):
         """Transfer inventory between stores"""
         data = request.get_json()
@@ -89,6 +102,20 @@ class InventoryTransfer(Resource):
         except (ValueError, TypeError):
             return {'error': 'Invalid quantity value'}, 400
 
+        if sharding.enabled():
+            try:
+                sharding.route(db.session, [data['source_store_id'], data['target_store_id']])
+            except sharding.CrossShardError:
+                return sharded_transfer(data, quantity)
+
+        scheduler = group_commit.scheduler(current_app)
+        if scheduler is not None:
+            return grouped_transfer(scheduler, data, quantity)
+
+        source_key = (data['product_id'], data['source_store_id'])
+        target_key = (data['product_id'], data['target_store_id'])
+        hot = counters.hot_rows(db.session, [source_key, target_key])
+
         # Check source inventory
         source_inventory = Inventory.query.filter_by(
             product_id=data['product_id'],
@@ -98,7 +125,13 @@ class InventoryTransfer(Resource):
         if not source_inventory:
             return {'error': 'Source inventory not found'}, 404
 
-        if source_inventory.quantity < data['quantity']:
+        if source_key in hot:
+            try:
+                counters.adjust(db.session, hot[source_key], *source_key, -quantity)
+            except counters.InsufficientStock:
+                db.session.rollback()
+                return {'error': 'Insufficient stock in source store'}, 400
+        elif source_inventory.quantity < data['quantity']:
             return {'error': 'Insufficient stock in source store'}, 400
 
         # Get or create target inventory
@@ -128,8 +161,12 @@ class InventoryTransfer(Resource):
         )
 
         # Update inventories
-        source_inventory.quantity -= data['quantity']
-        target_inventory.quantity += data['quantity']
+        if source_key not in hot:
+            source_inventory.quantity -= data['quantity']
+        if target_key in hot:
+            counters.adjust(db.session, hot[target_key], *target_key, quantity)
+        else:
+            target_inventory.quantity += data['quantity']
 
         db.session.add(movement)
         db.session.commit()
@@ -137,6 +174,172 @@ class InventoryTransfer(Resource):
         return api.marshal(movement.to_dict(), movement_model), 201
 
 
+TRANSFER_ERRORS = {
+    'Inventory not found': ({'error': 'Source inventory not found'}, 404),
+    'Insufficient stock': ({'error': 'Insufficient stock in source store'}, 400),
+    'Product not found': ({'error': 'Product not found'}, 404),
+}
+
+
+def grouped_transfer(scheduler, data, quantity):
+    """Apply a transfer through the group-commit scheduler."""
+    movement = {'product_id': data['product_id'], 'source_store_id': data['source_store_id'],
+                'target_store_id': data['target_store_id'], 'quantity': quantity, 'type': MovementType.TRANSFER}
+    try:
+        results, _ = group_commit.wait(scheduler.submit([[movement]]))
+    except adjustments.ConcurrentUpdateError as e:
+        return {'error': str(e)}, 409
+    except group_commit.BatchFailed as e:
+        return {'error': str(e)}, 503
+    result = results[0]
+    if result['errors']:
+        return TRANSFER_ERRORS[result['errors'][0][1]]
+    written = result['movements'][0]
+    return api.marshal({**written, 'type': written['type'].value}, movement_model), 201
+
+
+def sharded_transfer(data, quantity):
+    """Transfer between stores on different shards with the reserve/apply/complete protocol."""
+    movement, state, error = shards.transfer(data['product_id'], data['source_store_id'],
+                                             data['target_store_id'], quantity)
+    if error:
+        return TRANSFER_ERRORS[error]
+    if state == shards.RESERVED:
+        return {**movement, 'state': state}, 202
+    return api.marshal(movement, movement_model), 201
+
+
+adjustment_line_model = api.model('AdjustmentLine', {
+    'product_id': fields.String(required=True, description='Product ID'),
+    'store_id': fields.String(required=True, description='Store ID'),
+    'type': fields.String(required=True, description='IN for receipts, OUT for sales', enum=['IN', 'OUT']),
+    'quantity': fields.Integer(required=True, description='Units received or sold')
+})
+
+adjustment_request_model = api.model('AdjustmentRequest', {
+    'lines': fields.List(fields.Nested(adjustment_line_model), required=True),
+    'atomic': fields.Boolean(default=True, description='Reject the whole batch when any line is rejected')
+})
+
+rejected_line_model = api.model('RejectedAdjustmentLine', {
+    'index': fields.Integer(description='Position of the line in the request'),
+    'error': fields.String(description='Why the line was rejected')
+})
+
+adjusted_inventory_model = api.model('AdjustedInventory', {
+    'product_id': fields.String(description='Product ID'),
+    'store_id': fields.String(description='Store ID'),
+    'quantity': fields.Integer(description='Quantity after the batch')
+})
+
+adjustment_result_model = api.model('AdjustmentResult', {
+    'applied': fields.Integer(description='Number of lines applied'),
+    'rejected': fields.List(fields.Nested(rejected_line_model)),
+    'inventory': fields.List(fields.Nested(adjusted_inventory_model))
+})
+
+
+@api.route('/adjustments')
+class InventoryAdjustments(Resource):
+    @api.doc('adjust_inventory')
+    @api.expect(adjustment_request_model)
+    @api.response(201, 'Batch applied', adjustment_result_model)
+    @api.response(400, 'Validation Error', error_model)
+    @api.response(409, 'Lines rejected; nothing applied', adjustment_result_model)
+    @api.response(503, 'Group commit failed; nothing applied', error_model)
+    @log_endpoint
+    @admit(TRANSFERS)
+    def post(self):
+        """Apply a batch of stock receipts (IN) and sales (OUT)"""
+        data = request.get_json(silent=True) or {}
+        try:
+            lines = adjustments.parse_lines(data.get('lines'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        atomic = bool(data.get('atomic', True))
+        if sharding.enabled():
+            try:
+                sharding.route(db.session, {line['store_id'] for line in lines})
+            except sharding.CrossShardError as e:
+                return {'error': str(e)}, 400
+
+        scheduler = group_commit.scheduler(current_app)
+        try:
+            if scheduler is not None:
+                results, balances = group_commit.wait(scheduler.submit(adjustments.adjustment_groups(lines, atomic)))
+                applied, rejected = adjustments.adjustment_outcome(lines, atomic, results)
+            else:
+                applied, rejected, balances = adjustments.apply_adjustments(db.session, lines, atomic)
+        except adjustments.ConcurrentUpdateError as e:
+            db.session.rollback()
+            return {'error': str(e)}, 409
+        except group_commit.BatchFailed as e:
+            return {'error': str(e)}, 503
+        if not applied:
+            db.session.rollback()
+            return api.marshal({'applied': 0, 'rejected': rejected, 'inventory': []}, adjustment_result_model), 409
+        db.session.commit()
+
+        return api.marshal({
+            'applied': len(applied),
+            'rejected': rejected,
+            'inventory': [{'product_id': product_id, 'store_id': store_id, 'quantity': quantity}
+                          for (product_id, store_id), quantity in sorted(balances.items())]
+        }, adjustment_result_model), 201
+
+
+bulk_operation_model = api.model('InventoryBulkOperation', {
+    'op': fields.String(required=True, description='Operation', enum=['set', 'multiply', 'add']),
+    'value': fields.Float(required=True, description='Operand; integer for set and add')
+})
+
+inventory_bulk_filter_model = api.model('InventoryBulkFilter', {
+    'category': fields.String(description='Product category'),
+    'min_price': fields.Float(description='Minimum product price'),
+    'max_price': fields.Float(description='Maximum product price'),
+    'skus': fields.List(fields.String, description='Product SKUs'),
+    'store_ids': fields.List(fields.String, description='Store IDs')
+})
+
+inventory_bulk_update_model = api.model('InventoryBulkUpdate', {
+    'filter': fields.Nested(inventory_bulk_filter_model, required=True),
+    'operation': fields.Nested(bulk_operation_model, required=True)
+})
+
+bulk_update_result_model = api.model('InventoryBulkUpdateResult', {
+    'updated': fields.Integer(description='Number of rows updated')
+})
+
+
+@api.route('/bulk-update')
+class InventoryBulkUpdate(Resource):
+    @api.doc('bulk_update_min_stock')
+    @api.expect(inventory_bulk_update_model)
+    @api.response(200, 'Thresholds updated', bulk_update_result_model)
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    def post(self):
+        """Set, multiply or add to min_stock of every inventory row matching a filter"""
+        data = request.get_json(silent=True) or {}
+        try:
+            filters = bulk_updates.parse_filter(data.get('filter'), bulk_updates.INVENTORY_FILTERS)
+            op, value = bulk_updates.parse_operation(data.get('operation'), integer=True)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if sharding.enabled():
+            if 'store_ids' not in filters:
+                return {'error': 'filter.store_ids is required while sharding is on'}, 400
+            try:
+                sharding.route(db.session, filters['store_ids'])
+            except sharding.CrossShardError as e:
+                return {'error': str(e)}, 400
+
+        updated = bulk_updates.update_min_stock(db.session, filters, op, value)
+        db.session.commit()
+        return {'updated': updated}, 200
+
+
 @api.route('/stores/<store_id>/inventory')
 @api.param('store_id', 'The store identifier')
 class StoreInventoryCreate(Resource):
@@ -146,6 +349,7 @@ class StoreInventoryCreate(Resource):
     @api.response(400, 'Validation Error', error_model)
     @api.response(404, 'Product not found', error_model)
     @log_endpoint
+    @admit(TRANSFERS)
     def post(self, store_id):
         """Initialize store inventory for a product"""
         data = request.get_json()
@@ -183,7 +387,17 @@ class StoreInventoryCreate(Resource):
             min_stock=data['min_stock']
         )
 
+        # Record the initial stock as a receipt so the ledger can replay it
+        movement = Movement(
+            id=str(uuid.uuid4()),
+            product_id=data['product_id'],
+            target_store_id=store_id,
+            quantity=data['quantity'],
+            type=MovementType.IN
+        )
+
         db.session.add(inventory)
+        db.session.add(movement)
         db.session.commit()
 
         result = inventory.to_dict()
@@ -191,19 +405,396 @@ class StoreInventoryCreate(Resource):
         return api.marshal(result, inventory_model), 201
 
 
+INVENTORY_FIELDS = ('id', 'product_id', 'store_id', 'quantity', 'min_stock', 'created_at', 'updated_at')
+PRODUCT_EMBED_FIELDS = ('id', 'name', 'sku')
+
+
+def inventory_listing_args(allowed_fields):
+    """Read ``fields``/``include`` for an inventory listing.
+
+    Returns ``(fields, include_product, sparse)``. Without either parameter the
+    listing keeps its full legacy shape, product included.
+    """
+    fields = requested_fields(allowed_fields)
+    includes = requested_includes(['product'])
+    if fields is None and includes is None:
+        return None, True, False
+    return fields or [name for name in allowed_fields], 'product' in (includes or ()), True
+
+
+def select_inventory(criteria, fields, include_product, computed=None):
+    """Query only the requested inventory columns, joining products only when embedded."""
+    computed = {'quantity': counters.current_quantity(), **(computed or {})}
+    columns = [(computed[name] if name in computed else getattr(Inventory, name)).label(name) for name in fields]
+    if include_product:
+        columns += [getattr(Product, name).label(f'product__{name}') for name in PRODUCT_EMBED_FIELDS]
+    query = db.session.query(*columns).select_from(Inventory).filter(*criteria)
+    if include_product:
+        query = query.join(Product, Product.id == Inventory.product_id)
+    return query
+
+
+def inventory_row(row, fields, include_product, serialize=True):
+    convert = serialize_value if serialize else (lambda value: value)
+    item = {name: convert(getattr(row, name)) for name in fields}
+    if include_product:
+        item['product'] = {name: getattr(row, f'product__{name}') for name in PRODUCT_EMBED_FIELDS}
+    return item
+
+
+LOOKUP_MAX_PAIRS = 1000
+
+inventory_pair_model = api.model('InventoryPair', {
+    'product_id': fields.String(required=True, description='Product ID'),
+    'store_id': fields.String(required=True, description='Store ID')
+})
+
+inventory_lookup_request_model = api.model('InventoryLookupRequest', {
+    'pairs': fields.List(fields.Nested(inventory_pair_model), required=True,
+                         description='(product, store) pairs to look up')
+})
+
+inventory_lookup_item_model = api.model('InventoryLookupItem', {
+    'product_id': fields.String(description='Requested product ID'),
+    'store_id': fields.String(description='Requested store ID'),
+    'inventory': fields.Raw(description='Matching inventory row, or null when the pair has none')
+})
+
+inventory_lookup_model = api.model('InventoryLookup', {
+    'items': fields.List(fields.Nested(inventory_lookup_item_model)),
+    'missing': fields.Integer(description='Number of requested pairs without an inventory row')
+})
+
+
+@api.route('/lookup')
+class InventoryLookup(Resource):
+    @api.doc('lookup_inventory', params={'include': {'description': 'Set to "product" to embed the product'}})
+    @api.expect(inventory_lookup_request_model)
+    @api.response(200, 'Success', inventory_lookup_model)
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    def post(self):
+        """Fetch inventory rows for many (product, store) pairs in one query"""
+        try:
+            include_product = 'product' in (requested_includes(['product']) or ())
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        pairs = (request.get_json(silent=True) or {}).get('pairs')
+        if not isinstance(pairs, list) or not all(
+            isinstance(pair, dict) and isinstance(pair.get('product_id'), str) and isinstance(pair.get('store_id'), str)
+            for pair in pairs
+        ):
+            return {'error': 'pairs must be a list of {product_id, store_id} objects'}, 400
+        if len(pairs) > LOOKUP_MAX_PAIRS:
+            return {'error': f'pairs accepts at most {LOOKUP_MAX_PAIRS} items'}, 400
+
+        keys = [(pair['product_id'], pair['store_id']) for pair in pairs]
+        if sharding.enabled():
+            try:
+                sharding.route(db.session, {store_id for _, store_id in keys})
+            except sharding.CrossShardError as e:
+                return {'error': str(e)}, 400
+        found = {}
+        if keys:
+            query = select_inventory(
+                [tuple_(Inventory.product_id, Inventory.store_id).in_(set(keys))],
+                INVENTORY_FIELDS, include_product
+            )
+            found = {(row.product_id, row.store_id): inventory_row(row, INVENTORY_FIELDS, include_product)
+                     for row in query}
+        items = [{'product_id': product_id, 'store_id': store_id, 'inventory': found.get((product_id, store_id))}
+                 for product_id, store_id in keys]
+        return {'items': items, 'missing': sum(item['inventory'] is None for item in items)}, 200
+
+
+ALERT_FIELDS = INVENTORY_FIELDS + ('missing_quantity',)
+
+
 @api.route('/alerts')
 class InventoryAlerts(Resource):
-    @api.doc('get_inventory_alerts')
-    @api.marshal_list_with(inventory_alert_model)
+    @api.doc('get_inventory_alerts', params={
+        'fields': {'description': f'Comma-separated subset of: {", ".join(ALERT_FIELDS)}'},
+        'include': {'description': 'Set to "product" to embed the product'},
+    })
+    @api.response(200, 'Success', [inventory_alert_model])
+    @api.response(400, 'Validation Error', error_model)
     @log_endpoint
+    @admit(BULK)
     def get(self):
         """Get alerts for inventory items below minimum stock level"""
-        alerts = Inventory.query.filter(
-            Inventory.quantity <= Inventory.min_stock
-        ).all()
-
-        return [{
-            **item.to_dict(),
-            'product': item.product.to_dict(),
-            'missing_quantity': item.min_stock - item.quantity
-        } for item in alerts]
+        try:
+            fields, include_product, sparse = inventory_listing_args(ALERT_FIELDS)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        query = select_inventory(
+            [counters.current_quantity() <= Inventory.min_stock],
+            fields or list(ALERT_FIELDS), include_product,
+            computed={'missing_quantity': Inventory.min_stock - counters.current_quantity()}
+        )
+        if sharding.enabled():
+            query = sharding.fan_out(query)
+        if sparse:
+            return [inventory_row(row, fields, include_product) for row in query], 200
+        return api.marshal([inventory_row(row, ALERT_FIELDS, True, serialize=False) for row in query],
+                           inventory_alert_model), 200
+
+
+def _movement_filters():
+    """Read the ledger filters shared by the history and export endpoints."""
+    return {
+        'product_id': request.args.get('product_id'),
+        'store_id': request.args.get('store_id'),
+        'since': parse_timestamp(request.args.get('since')),
+        'until': parse_timestamp(request.args.get('until')),
+    }
+
+
+movement_filter_params = {
+    'product_id': {'description': 'Filter by product'},
+    'store_id': {'description': 'Filter by source or target store'},
+    'since': {'description': 'Inclusive lower bound (ISO 8601)'},
+    'until': {'description': 'Exclusive upper bound (ISO 8601)'},
+}
+
+
+@api.route('/movements')
+class MovementHistory(Resource):
+    @api.doc('list_movements', params={
+        **movement_filter_params,
+        'since': {'description': 'Inclusive lower bound (ISO 8601), defaults to the start of the hot period'},
+        'limit': {'description': 'Maximum number of movements', 'type': 'integer', 'default': 100},
+    })
+    @api.response(200, 'Success', [movement_model])
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    @sharding.store_scoped
+    def get(self):
+        """List ledger movements in chronological order"""
+        try:
+            filters = _movement_filters()
+        except ValueError:
+            return {'error': 'Invalid timestamp'}, 400
+        if filters['since'] is None:
+            filters['since'] = ledger.hot_cutoff()
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+
+        rows = []
+        for row in ledger.iter_movements(db.session.connection(), **filters):
+            rows.append(ledger.serialize(row))
+            if len(rows) >= limit:
+                break
+        return api.marshal(rows, movement_model), 200
+
+
+@api.route('/movements/export')
+class MovementExport(Resource):
+    @api.doc('export_movements', params=movement_filter_params)
+    @api.response(200, 'Newline-delimited JSON stream of movements')
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK, deadline_ms=0)  # streams for as long as the export takes
+    @sharding.store_scoped
+    def get(self):
+        """Export ledger movements, including archived periods, as NDJSON"""
+        try:
+            filters = _movement_filters()
+        except ValueError:
+            return {'error': 'Invalid timestamp'}, 400
+
+        def generate():
+            for row in ledger.iter_movements(db.session.connection(), **filters):
+                yield json.dumps(ledger.serialize(row)) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+stock_level_model = api.model('StockLevel', {
+    'product_id': fields.String(description='Product ID'),
+    'store_id': fields.String(description='Store ID'),
+    'quantity': fields.Integer(description='Quantity at the requested time')
+})
+
+stock_as_of_model = api.model('StockAsOf', {
+    'timestamp': fields.DateTime(description='Requested point in time'),
+    'checkpoint': fields.DateTime(description='Checkpoint the replay started from'),
+    'items': fields.List(fields.Nested(stock_level_model))
+})
+
+
+@api.route('/as-of')
+class InventoryAsOf(Resource):
+    @api.doc('get_inventory_as_of', params={
+        'timestamp': {'description': 'Point in time (ISO 8601)', 'required': True},
+        'store_id': {'description': 'Store to report on'},
+        'product_id': {'description': 'Product to report on'},
+    })
+    @api.response(200, 'Success', stock_as_of_model)
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    @sharding.store_scoped
+    def get(self):
+        """Get stock quantities at a point in time"""
+        try:
+            at = parse_timestamp(request.args.get('timestamp'))
+        except ValueError:
+            return {'error': 'Invalid timestamp'}, 400
+        if at is None:
+            return {'error': 'Missing required parameter: timestamp'}, 400
+
+        store_id = request.args.get('store_id')
+        product_id = request.args.get('product_id')
+        if not store_id and not product_id:
+            return {'error': 'Either store_id or product_id is required'}, 400
+
+        taken_at, quantities = checkpoints.quantities_as_of(
+            db.session, at, product_id=product_id, store_id=store_id
+        )
+        items = [{
+            'product_id': pid,
+            'store_id': sid,
+            'quantity': quantity
+        } for (pid, sid), quantity in sorted(quantities.items())]
+
+        return api.marshal({'timestamp': at, 'checkpoint': taken_at, 'items': items}, stock_as_of_model), 200
+
+
+recommendation_model = api.model('MinStockRecommendation', {
+    'inventory_id': fields.String(description='Inventory unique identifier'),
+    'product_id': fields.String(description='Product ID'),
+    'store_id': fields.String(description='Store ID'),
+    'min_stock': fields.Integer(description='Current minimum stock level'),
+    'recommended_min_stock': fields.Integer(description='Recommended minimum stock level'),
+    'daily_demand': fields.Float(description='Mean units leaving the store per day'),
+    'demand_std': fields.Float(description='Standard deviation of daily demand'),
+    'observed_days': fields.Integer(description='Days with demand in the window')
+})
+
+
+@api.route('/recommendations')
+class InventoryRecommendations(Resource):
+    @api.doc('get_min_stock_recommendations', params={
+        'store_id': {'description': 'Filter by store'},
+        'product_id': {'description': 'Filter by product'},
+        'window_days': {'description': 'Days of history', 'type': 'integer',
+                        'default': recommendations.DEFAULT_WINDOW_DAYS},
+        'lead_time_days': {'description': 'Replenishment lead time in days', 'type': 'integer',
+                           'default': recommendations.DEFAULT_LEAD_TIME_DAYS},
+        'z': {'description': 'Safety factor in standard deviations', 'type': 'number',
+              'default': recommendations.DEFAULT_SERVICE_Z},
+        'min_observed_days': {'description': 'Days with demand needed to change min_stock', 'type': 'integer',
+                              'default': recommendations.DEFAULT_MIN_OBSERVED_DAYS},
+        'changed_only': {'description': 'Only return rows whose recommendation differs', 'type': 'boolean'},
+        'limit': {'description': 'Maximum number of rows', 'type': 'integer', 'default': 1000},
+    })
+    @api.response(200, 'Success', [recommendation_model])
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    @sharding.store_scoped
+    def get(self):
+        """Recommend minimum stock levels from demand history"""
+        window_days = request.args.get('window_days', recommendations.DEFAULT_WINDOW_DAYS, type=int)
+        lead_time_days = request.args.get('lead_time_days', recommendations.DEFAULT_LEAD_TIME_DAYS, type=int)
+        z = request.args.get('z', recommendations.DEFAULT_SERVICE_Z, type=float)
+        min_observed_days = request.args.get('min_observed_days', recommendations.DEFAULT_MIN_OBSERVED_DAYS,
+                                             type=int)
+        limit = request.args.get('limit', 1000, type=int)
+        if window_days <= 0 or lead_time_days <= 0 or z < 0 or limit <= 0 or min_observed_days <= 0:
+            return {'error': 'window_days, lead_time_days, min_observed_days and limit must be positive '
+                             'and z non-negative'}, 400
+
+        result = recommendations.recommend(
+            db.session, window_days, lead_time_days, z,
+            store_id=request.args.get('store_id'), product_id=request.args.get('product_id'),
+            min_observed_days=min_observed_days
+        )
+        rows = range(len(result['inventory_id']))
+        if request.args.get('changed_only', '').lower() in ('1', 'true', 'yes'):
+            rows = (result['recommended'] != result['min_stock']).nonzero()[0]
+
+        return api.marshal([{
+            'inventory_id': result['inventory_id'][i],
+            'product_id': result['product_id'][i],
+            'store_id': result['store_id'][i],
+            'min_stock': int(result['min_stock'][i]),
+            'recommended_min_stock': int(result['recommended'][i]),
+            'daily_demand': round(float(result['daily_demand'][i]), 4),
+            'demand_std': round(float(result['demand_std'][i]), 4),
+            'observed_days': int(result['observed_days'][i])
+        } for i in rows[:limit]], recommendation_model), 200
+
+
+rebalance_request_model = api.model('RebalanceRequest', {
+    'product_ids': fields.List(fields.String, description='Only plan for these products'),
+    'store_ids': fields.List(fields.String, description='Only move stock between these stores'),
+    'apply': fields.Boolean(default=False, description='Apply the plan in one transaction')
+})
+
+planned_transfer_model = api.model('PlannedTransfer', {
+    'product_id': fields.String(description='Product ID'),
+    'source_store_id': fields.String(description='Store giving surplus stock'),
+    'target_store_id': fields.String(description='Store below minimum stock'),
+    'quantity': fields.Integer(description='Quantity to transfer')
+})
+
+unresolved_shortage_model = api.model('UnresolvedShortage', {
+    'product_id': fields.String(description='Product ID'),
+    'store_id': fields.String(description='Store ID'),
+    'missing_quantity': fields.Integer(description='Shortage left after the plan')
+})
+
+rebalance_plan_model = api.model('RebalancePlan', {
+    'applied': fields.Boolean(description='Whether the plan was applied'),
+    'moves': fields.Integer(description='Number of planned transfers'),
+    'units': fields.Integer(description='Total units moved'),
+    'transfers': fields.List(fields.Nested(planned_transfer_model)),
+    'unresolved': fields.List(fields.Nested(unresolved_shortage_model))
+})
+
+
+@api.route('/rebalance/plan')
+class InventoryRebalancePlan(Resource):
+    @api.doc('plan_rebalance')
+    @api.expect(rebalance_request_model)
+    @api.response(200, 'Plan computed', rebalance_plan_model)
+    @api.response(400, 'Validation Error', error_model)
+    @api.response(409, 'A hot source row was drained while applying', error_model)
+    @log_endpoint
+    @admit(BULK)
+    def post(self):
+        """Plan transfers that move surplus stock to stores below minimum stock"""
+        data = request.get_json(silent=True) or {}
+        product_ids = data.get('product_ids')
+        store_ids = data.get('store_ids')
+        for value in (product_ids, store_ids):
+            if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                return {'error': 'product_ids and store_ids must be lists of strings'}, 400
+        if sharding.enabled():
+            if not store_ids:
+                return {'error': 'store_ids is required while sharding is on'}, 400
+            try:
+                sharding.route(db.session, store_ids)
+            except sharding.CrossShardError as e:
+                return {'error': str(e)}, 400
+        apply = bool(data.get('apply', False))
+
+        transfers, unresolved = rebalance.plan(db.session, product_ids, store_ids, lock=apply)
+        if apply:
+            try:
+                rebalance.apply_plan(db.session, transfers)
+            except counters.InsufficientStock as e:
+                db.session.rollback()
+                return {'error': str(e)}, 409
+            db.session.commit()
+
+        return api.marshal({
+            'applied': apply,
+            'moves': len(transfers),
+            'units': sum(transfer['quantity'] for transfer in transfers),
+            'transfers': transfers,
+            'unresolved': unresolved
+        }, rebalance_plan_model), 200
@@ -0,0 +1,76 @@
+from flask import Blueprint, request
+from flask_restx import Namespace, Resource, fields
+from app.main import db
+from app.models.job import Job
+from app.services import jobs
+from app.utils import sharding
+from app.utils.admission import READS, admit
+from app.utils.logging_config import log_endpoint
+
+jobs_bp = Blueprint('jobs', __name__)
+api = Namespace('jobs', description='Background job operations')
+
+job_request_model = api.model('JobRequest', {
+    'kind': fields.String(required=True, description='Job kind', enum=sorted(jobs.KINDS)),
+    'params': fields.Raw(description='Parameters of the job kind')
+})
+
+job_progress_model = api.model('JobProgress', {
+    'done': fields.Integer(description='Units of work finished'),
+    'total': fields.Integer(description='Units of work in the job, once known')
+})
+
+job_model = api.model('Job', {
+    'id': fields.String(readonly=True, description='Job unique identifier'),
+    'kind': fields.String(description='Job kind'),
+    'params': fields.Raw(description='Validated job parameters, lists summarized as {"count": n}'),
+    'state': fields.String(description='Job state', enum=[jobs.QUEUED, jobs.RUNNING, jobs.SUCCEEDED, jobs.FAILED]),
+    'progress': fields.Nested(job_progress_model),
+    'result': fields.Raw(description='Result of a succeeded job'),
+    'error': fields.String(description='Error of a failed job'),
+    'attempts': fields.Integer(description='Times a worker claimed the job'),
+    'created_at': fields.DateTime(description='Submission timestamp'),
+    'started_at': fields.DateTime(description='First claim timestamp'),
+    'updated_at': fields.DateTime(description='Last progress timestamp'),
+    'finished_at': fields.DateTime(description='Completion timestamp')
+})
+
+error_model = api.model('Error', {
+    'error': fields.String(required=True, description='Error message')
+})
+
+
+@api.route('')
+class JobList(Resource):
+    @api.doc('submit_job')
+    @api.expect(job_request_model)
+    @api.response(202, 'Job queued', job_model)
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(READS)
+    @sharding.unsharded
+    def post(self):
+        """Queue a long-running operation for the job workers"""
+        data = request.get_json(silent=True) or {}
+        try:
+            job = jobs.submit(db.session, data.get('kind'), data.get('params'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        db.session.commit()
+        return job.to_dict(), 202, {'Location': f'{request.path.rstrip("/")}/{job.id}'}
+
+
+@api.route('/<id>')
+@api.param('id', 'The job identifier')
+class JobItem(Resource):
+    @api.doc('get_job')
+    @api.response(200, 'Success', job_model)
+    @api.response(404, 'Job not found', error_model)
+    @log_endpoint
+    @admit(READS)
+    def get(self, id):
+        """Get a job's state, progress and result"""
+        job = db.session.get(Job, id)
+        if job is None:
+            return {'error': 'Job not found'}, 404
+        return job.to_dict(), 200
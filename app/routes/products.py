@@ -3,7 +3,12 @@ from flask_restx import Namespace, Resource, fields
 from app.models.product import Product
 from app.models.inventory import Inventory
 from app.main import db
+from app.services import bulk_updates, counters
+from app.utils import sharding
+from app.utils.fieldsets import requested_fields, serialize_value
+from app.utils.admission import BULK, READS, admit
 from app.utils.logging_config import log_endpoint
+from app.utils.params import parse_key_list
 import uuid
 
 products_bp = Blueprint('products', __name__)
@@ -30,6 +35,40 @@ error_model = api.model('Error', {
     'error': fields.String(required=True, description='Error message')
 })
 
+PRODUCT_FIELDS = ('id', 'name', 'description', 'category', 'price', 'sku', 'created_at', 'updated_at')
+LOOKUP_MAX_KEYS = 1000
+
+product_lookup_request_model = api.model('ProductLookupRequest', {
+    'ids': fields.List(fields.String, description='Product IDs to look up'),
+    'skus': fields.List(fields.String, description='Product SKUs to look up (instead of ids)')
+})
+
+bulk_operation_model = api.model('BulkOperation', {
+    'op': fields.String(required=True, description='Operation', enum=['set', 'multiply', 'add']),
+    'value': fields.Float(required=True, description='Operand')
+})
+
+product_bulk_filter_model = api.model('ProductBulkFilter', {
+    'category': fields.String(description='Product category'),
+    'min_price': fields.Float(description='Minimum current price'),
+    'max_price': fields.Float(description='Maximum current price'),
+    'skus': fields.List(fields.String, description='Product SKUs')
+})
+
+product_bulk_update_model = api.model('ProductBulkUpdate', {
+    'filter': fields.Nested(product_bulk_filter_model, required=True),
+    'operation': fields.Nested(bulk_operation_model, required=True)
+})
+
+bulk_update_result_model = api.model('BulkUpdateResult', {
+    'updated': fields.Integer(description='Number of rows updated')
+})
+
+product_lookup_model = api.model('ProductLookup', {
+    'items': fields.Raw(description='Products keyed by the requested id or SKU; null when not found'),
+    'missing': fields.List(fields.String, description='Requested keys that matched no product')
+})
+
 @api.route('')
 class ProductList(Resource):
     @api.doc('list_products',
@@ -39,12 +78,20 @@ class ProductList(Resource):
                  'category': {'description': 'Filter by category'},
                  'min_price': {'description': 'Minimum price', 'type': 'number'},
                  'max_price': {'description': 'Maximum price', 'type': 'number'},
-                 'min_stock': {'description': 'Minimum stock level', 'type': 'integer'}
+                 'min_stock': {'description': 'Minimum stock level', 'type': 'integer'},
+                 'fields': {'description': f'Comma-separated subset of: {", ".join(PRODUCT_FIELDS)}'}
              })
-    @api.marshal_with(product_list_model)
+    @api.response(200, 'Success', product_list_model)
+    @api.response(400, 'Validation Error', error_model)
     @log_endpoint
+    @admit(BULK)
     def get(self):
         """List all products with optional filters"""
+        try:
+            fields = requested_fields(PRODUCT_FIELDS)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         category = request.args.get('category')
@@ -61,22 +108,38 @@ class ProductList(Resource):
         if max_price is not None:
             query = query.filter(Product.price <= max_price)
         if min_stock is not None:
-            query = query.join(Inventory).group_by(Product.id).having(db.func.sum(Inventory.quantity) >= min_stock)
+            if sharding.enabled():
+                # Stock lives on the shards; the catalog only holds products
+                return {'error': 'min_stock is not available while sharding is on'}, 400
+            query = query.join(Inventory).group_by(Product.id).having(
+                db.func.sum(counters.current_quantity()) >= min_stock
+            )
 
+        if fields is not None:
+            query = query.with_entities(*(getattr(Product, name) for name in fields))
         pagination = query.paginate(page=page, per_page=per_page)
 
-        return {
+        if fields is not None:
+            items = [{name: serialize_value(value) for name, value in zip(fields, row)} for row in pagination.items]
+            return {
+                'items': items,
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'current_page': pagination.page
+            }, 200
+        return api.marshal({
             'items': [item.to_dict() for item in pagination.items],
             'total': pagination.total,
             'pages': pagination.pages,
             'current_page': pagination.page
-        }
+        }, product_list_model), 200
 
     @api.doc('create_product')
     @api.expect(product_model)
     @api.response(201, 'Product created successfully', product_model)
     @api.response(400, 'Validation Error', error_model)
     @log_endpoint
+    @admit(READS)
     def post(self):
         """Create a new product"""
         data = request.get_json()
@@ -105,6 +168,58 @@ class ProductList(Resource):
 
         return product.to_dict(), 201
 
+@api.route('/bulk-update')
+class ProductBulkUpdate(Resource):
+    @api.doc('bulk_update_prices')
+    @api.expect(product_bulk_update_model)
+    @api.response(200, 'Prices updated', bulk_update_result_model)
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    def post(self):
+        """Set, multiply or add to the price of every product matching a filter"""
+        data = request.get_json(silent=True) or {}
+        try:
+            filters = bulk_updates.parse_filter(data.get('filter'), bulk_updates.PRODUCT_FILTERS)
+            op, value = bulk_updates.parse_operation(data.get('operation'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        updated = bulk_updates.update_prices(db.session, filters, op, value)
+        db.session.commit()
+        return {'updated': updated}, 200
+
+
+@api.route('/lookup')
+class ProductLookup(Resource):
+    @api.doc('lookup_products')
+    @api.expect(product_lookup_request_model)
+    @api.response(200, 'Success', product_lookup_model)
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    def post(self):
+        """Fetch many products by id or SKU in one query"""
+        data = request.get_json(silent=True) or {}
+        if ('ids' in data) == ('skus' in data):
+            return {'error': 'Provide exactly one of ids or skus'}, 400
+        key = 'ids' if 'ids' in data else 'skus'
+        try:
+            keys = parse_key_list(data[key], key, LOOKUP_MAX_KEYS)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        column = Product.id if key == 'ids' else Product.sku
+        found = {}
+        if keys:
+            found = {getattr(product, column.key): product.to_dict()
+                     for product in Product.query.filter(column.in_(set(keys)))}
+        return {
+            'items': {k: found.get(k) for k in keys},
+            'missing': [k for k in dict.fromkeys(keys) if k not in found]
+        }, 200
+
+
 @api.route('/<id>')
 @api.param('id', 'The product identifier')
 class ProductItem(Resource):
@@ -112,6 +227,7 @@ class ProductItem(Resource):
     @api.marshal_with(product_model)
     @api.response(404, 'Product not found', error_model)
     @log_endpoint
+    @admit(READS)
     def get(self, id):
         """Get a product by ID"""
         product = Product.query.get(id)
@@ -125,6 +241,7 @@ class ProductItem(Resource):
     @api.response(400, 'Validation Error', error_model)
     @api.response(404, 'Product not found', error_model)
     @log_endpoint
+    @admit(READS)
     def put(self, id):
         """Update a product"""
         product = Product.query.get(id)
@@ -151,6 +268,7 @@ class ProductItem(Resource):
     @api.response(400, 'Cannot delete product with inventory', error_model)
     @api.response(404, 'Product not found', error_model)
     @log_endpoint
+    @admit(READS)
     def delete(self, id):
         """Delete a product"""
         product = Product.query.get(id)
@@ -0,0 +1,103 @@
+from flask import Blueprint, request
+from flask_restx import Namespace, Resource, fields
+from app.models.movement import MovementType
+from app.models.rollup import MovementDailyRollup
+from app.main import db
+from app.services.rollups import bucket_start
+from app.utils import sharding
+from app.utils.admission import BULK, admit
+from app.utils.logging_config import log_endpoint
+from app.utils.params import parse_timestamp
+
+reports_bp = Blueprint('reports', __name__)
+api = Namespace('reports', description='Reporting operations')
+
+GRANULARITIES = ('day', 'week', 'month')
+GROUP_DIMENSIONS = ('product_id', 'store_id', 'type')
+
+movement_report_model = api.model('MovementReportRow', {
+    'period': fields.String(description='First day of the period'),
+    'product_id': fields.String(description='Product ID, when grouped by product'),
+    'store_id': fields.String(description='Store ID, when grouped by store'),
+    'type': fields.String(description='Movement type, when grouped by type', enum=['IN', 'OUT', 'TRANSFER']),
+    'units_in': fields.Integer(description='Units received'),
+    'units_out': fields.Integer(description='Units shipped'),
+    'movement_count': fields.Integer(description='Number of movement legs')
+})
+
+error_model = api.model('Error', {
+    'error': fields.String(required=True, description='Error message')
+})
+
+
+@api.route('/movements')
+class MovementReport(Resource):
+    @api.doc('movement_report',
+             params={
+                 'granularity': {'description': 'Bucket size', 'enum': list(GRANULARITIES), 'default': 'day'},
+                 'since': {'description': 'First day (inclusive, ISO 8601)'},
+                 'until': {'description': 'Last day (exclusive, ISO 8601)'},
+                 'store_id': {'description': 'Filter by store'},
+                 'product_id': {'description': 'Filter by product'},
+                 'type': {'description': 'Filter by movement type', 'enum': ['IN', 'OUT', 'TRANSFER']},
+                 'group_by': {'description': 'Comma-separated dimensions: product_id, store_id, type',
+                              'default': 'store_id,type'}
+             })
+    @api.response(200, 'Success', [movement_report_model])
+    @api.response(400, 'Validation Error', error_model)
+    @log_endpoint
+    @admit(BULK)
+    @sharding.store_scoped
+    def get(self):
+        """Report units moved per period from the daily rollups"""
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return {'error': f'granularity must be one of: {", ".join(GRANULARITIES)}'}, 400
+
+        group_by = [name for name in request.args.get('group_by', 'store_id,type').split(',') if name]
+        if any(name not in GROUP_DIMENSIONS for name in group_by):
+            return {'error': f'group_by must be a subset of: {", ".join(GROUP_DIMENSIONS)}'}, 400
+
+        try:
+            since = parse_timestamp(request.args.get('since'))
+            until = parse_timestamp(request.args.get('until'))
+            movement_type = MovementType(request.args['type']) if request.args.get('type') else None
+        except ValueError:
+            return {'error': 'Invalid since, until or type'}, 400
+
+        rollup = MovementDailyRollup
+        dimensions = [getattr(rollup, name) for name in group_by]
+        query = db.session.query(
+            rollup.day, *dimensions,
+            db.func.sum(rollup.units_in), db.func.sum(rollup.units_out), db.func.sum(rollup.movement_count)
+        )
+        if since is not None:
+            query = query.filter(rollup.day >= since.date())
+        if until is not None:
+            query = query.filter(rollup.day < until.date())
+        if request.args.get('store_id'):
+            query = query.filter(rollup.store_id == request.args['store_id'])
+        if request.args.get('product_id'):
+            query = query.filter(rollup.product_id == request.args['product_id'])
+        if movement_type is not None:
+            query = query.filter(rollup.type == movement_type)
+        query = query.group_by(rollup.day, *dimensions)
+
+        # Days are aggregated in SQL; weeks and months fold the (few) daily rows
+        buckets = {}
+        for row in query:
+            day, keys, totals = row[0], row[1:1 + len(group_by)], row[1 + len(group_by):]
+            keys = tuple(key.value if isinstance(key, MovementType) else key for key in keys)
+            bucket = buckets.setdefault((bucket_start(day, granularity), keys), [0, 0, 0])
+            for index, value in enumerate(totals):
+                bucket[index] += value or 0
+
+        return api.marshal([{
+            'period': period.isoformat(),
+            **dict(zip(group_by, keys)),
+            'units_in': units_in,
+            'units_out': units_out,
+            'movement_count': movement_count
+        } for (period, keys), (units_in, units_out, movement_count) in sorted(
+            buckets.items(), key=lambda item: (item[0][0], tuple(key or '' for key in item[0][1]))
+        )], movement_report_model), 200
@@ -1,11 +1,25 @@
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, stream_with_context
 from flask_restx import Namespace, Resource, fields
 from app.models.product import Product
 from app.models.inventory import Inventory
+from app.models.movement import Movement, MovementType
+from app.models.store import Store
 from app.main import db
+from app.utils.admission import BULK, READS, TRANSFERS, admit
+from app.utils import deadlines, sharding
 from app.utils.logging_config import log_endpoint
-from app.routes.inventory import inventory_model, inventory_create_model
+from app.utils.params import decode_cursor, encode_cursor
+from app.routes.inventory import (
+    INVENTORY_FIELDS, inventory_create_model, inventory_listing_args, inventory_model, inventory_row,
+    select_inventory
+)
+from app.routes.sync import sync_args, sync_page_model, sync_params, sync_response
+from app.services import reconcile, sync
+import io
+import json
 import uuid
+from sqlalchemy import tuple_
+from urllib.parse import urlencode
 
 store_bp = Blueprint('store', __name__)
 api = Namespace('store', description='Store operations')
@@ -14,19 +28,148 @@ error_model = api.model('Error', {
     'error': fields.String(required=True, description='Error message')
 })
 
+store_summary_model = api.model('StoreSummary', {
+    'id': fields.String(description='Store ID'),
+    'sku_count': fields.Integer(description='Inventory rows in the store'),
+    'total_units': fields.Integer(description='Units on hand'),
+    'total_value': fields.Float(description='Units on hand valued at current product prices'),
+    'low_stock_count': fields.Integer(description='Rows at or below their minimum stock'),
+    'created_at': fields.DateTime(description='When the store was first stocked'),
+    'updated_at': fields.DateTime(description='Last change to the totals')
+})
+
+
+@api.route('')
+class StoreList(Resource):
+    @api.doc('list_stores')
+    @api.response(200, 'Success', [store_summary_model])
+    @log_endpoint
+    @admit(BULK)
+    def get(self):
+        """List stores with their inventory totals"""
+        query = Store.query.order_by(Store.id)
+        if sharding.enabled():
+            query = sorted(sharding.fan_out(query), key=lambda store: store.id)
+        return [store.to_dict() for store in query], 200
+
+
+@api.route('/<store_id>/summary')
+@api.param('store_id', 'The store identifier')
+class StoreSummary(Resource):
+    @api.doc('get_store_summary')
+    @api.response(200, 'Success', store_summary_model)
+    @api.response(404, 'Store not found', error_model)
+    @log_endpoint
+    @admit(READS)
+    def get(self, store_id):
+        """Get a store's SKU count, units, valuation and low-stock count"""
+        store = db.session.get(Store, store_id)
+        if store is None:
+            return {'error': 'Store not found'}, 404
+        return store.to_dict(), 200
+
+
+STORE_PAGE_DEFAULT = 1000
+STORE_PAGE_MAX = 5000
+STREAM_FETCH_SIZE = 1000
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+
+def page_limit(value):
+    """Parse an optional ``limit``; raises ValueError unless it is a positive integer."""
+    if value is None:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        raise ValueError('limit must be a positive integer')
+    return limit
+
+
 @api.route('/<store_id>/inventory')
 @api.param('store_id', 'The store identifier')
 class StoreInventory(Resource):
-    @api.doc('get_store_inventory')
-    @api.marshal_list_with(inventory_model)
+    @api.doc('get_store_inventory', params={
+        'fields': {'description': f'Comma-separated subset of: {", ".join(INVENTORY_FIELDS)}'},
+        'include': {'description': 'Set to "product" to embed the product'},
+        'limit': {'description': f'Page size (at most {STORE_PAGE_MAX}); pages by product when set',
+                  'type': 'integer'},
+        'cursor': {'description': 'X-Next-Cursor of the previous page'},
+        'stream': {'description': 'Stream every row (after the cursor) as "json" or "ndjson"',
+                   'enum': sorted(STREAM_FORMATS)},
+    })
+    @api.response(200, 'Success', [inventory_model])
+    @api.response(400, 'Validation Error', error_model)
     @log_endpoint
+    @admit(BULK)
     def get(self, store_id):
-        """Get inventory for a specific store"""
-        inventory = Inventory.query.filter_by(store_id=store_id).all()
-        return [{
-            **item.to_dict(),
-            'product': item.product.to_dict()
-        } for item in inventory]
+        """Get inventory for a specific store, whole, by page or as a stream"""
+        try:
+            fields, include_product, sparse = inventory_listing_args(INVENTORY_FIELDS)
+            after = request.args.get('cursor')
+            if after is not None:
+                after = decode_cursor(after, 2)
+            limit = page_limit(request.args.get('limit'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        stream = request.args.get('stream')
+        if stream is not None and stream not in STREAM_FORMATS:
+            return {'error': f'stream must be one of: {", ".join(sorted(STREAM_FORMATS))}'}, 400
+        if stream and limit is not None:
+            return {'error': 'limit does not apply to streams'}, 400
+
+        query = select_inventory([Inventory.store_id == store_id], fields or list(INVENTORY_FIELDS),
+                                 include_product)
+
+        def render(row):
+            if sparse:
+                return inventory_row(row, fields, include_product)
+            return api.marshal(inventory_row(row, INVENTORY_FIELDS, True, serialize=False), inventory_model)
+
+        if not (stream or limit is not None or after is not None):
+            return [render(row) for row in query], 200
+
+        # Keyset order; the (store_id, product_id) index serves it without sorting the store
+        query = query.add_columns(Inventory.product_id.label('cursor__product_id'),
+                                  Inventory.id.label('cursor__id'))
+        if after is not None:
+            query = query.filter(tuple_(Inventory.product_id, Inventory.id) > tuple_(*after))
+        query = query.order_by(Inventory.product_id, Inventory.id)
+        if stream:
+            return self._stream(query, stream, render)
+
+        limit = min(STORE_PAGE_DEFAULT if limit is None else limit, STORE_PAGE_MAX)
+        rows = query.limit(limit + 1).all()
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            cursor = encode_cursor((rows[-1].cursor__product_id, rows[-1].cursor__id))
+            args = {**request.args.to_dict(), 'cursor': cursor, 'limit': limit}
+            headers['X-Next-Cursor'] = cursor
+            headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+        return [render(row) for row in rows], 200, headers
+
+    @staticmethod
+    def _stream(query, stream, render):
+        # Rows are fetched from a server-side cursor and sent as they arrive, so a
+        # store of any size is served in constant memory and for as long as it takes
+        deadlines.lift()
+
+        def generate():
+            rows = query.yield_per(STREAM_FETCH_SIZE)
+            if stream == 'ndjson':
+                for row in rows:
+                    yield json.dumps(render(row)) + '\n'
+                return
+            separator = '['
+            for row in rows:
+                yield separator + json.dumps(render(row))
+                separator = ','
+            yield ']' if separator == ',' else '[]'
+
+        return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[stream])
 
     @api.doc('create_store_inventory')
     @api.expect(inventory_create_model)
@@ -34,6 +177,7 @@ class StoreInventory(Resource):
     @api.response(400, 'Validation Error', error_model)
     @api.response(404, 'Product not found', error_model)
     @log_endpoint
+    @admit(TRANSFERS)
     def post(self, store_id):
         """Initialize store inventory for a product"""
         data = request.get_json()
@@ -71,10 +215,96 @@ class StoreInventory(Resource):
             min_stock=data['min_stock']
         )
 
+        # Record the initial stock as a receipt so the ledger can replay it
+        movement = Movement(
+            id=str(uuid.uuid4()),
+            product_id=data['product_id'],
+            target_store_id=store_id,
+            quantity=data['quantity'],
+            type=MovementType.IN
+        )
+
         db.session.add(inventory)
+        db.session.add(movement)
         db.session.commit()
 
         return {
             **inventory.to_dict(),
             'product': product.to_dict()
         }, 201
+
+
+synced_inventory_model = api.model('SyncedInventory', {
+    'id': fields.String(description='Inventory unique identifier'),
+    'product_id': fields.String(description='Product ID'),
+    'store_id': fields.String(description='Store ID'),
+    'quantity': fields.Integer(description='Current quantity'),
+    'min_stock': fields.Integer(description='Minimum stock level'),
+    'created_at': fields.DateTime(description='Creation timestamp'),
+    'updated_at': fields.DateTime(description='Last update timestamp')
+})
+
+inventory_sync_model = sync_page_model(api, 'InventorySyncPage', synced_inventory_model)
+
+
+@api.route('/<store_id>/sync')
+@api.param('store_id', 'The store identifier')
+class StoreInventorySync(Resource):
+    @api.doc('sync_store_inventory', params=sync_params)
+    @api.response(200, 'Success', inventory_sync_model)
+    @api.response(400, 'Invalid token', error_model)
+    @log_endpoint
+    @admit(BULK)
+    def get(self, store_id):
+        """Get a store's inventory rows created, updated or deleted since a sync token"""
+        token, limit = sync_args()
+        try:
+            result = sync.sync_store_inventory(db.session, store_id, token, limit)
+        except sync.InvalidToken:
+            return {'error': 'Invalid sync token'}, 400
+        return api.marshal(sync_response(result), inventory_sync_model), 200
+
+
+READ_CHUNK = 64 * 1024
+
+
+@api.route('/<store_id>/reconcile')
+@api.param('store_id', 'The store identifier')
+class StoreReconcile(Resource):
+    @api.doc('reconcile_store', params={
+        'apply': {'description': 'Apply corrective IN/OUT movements', 'type': 'boolean', 'default': False},
+    })
+    @api.response(200, 'NDJSON differences followed by a summary line')
+    @api.response(400, 'Malformed or unsorted count file', error_model)
+    @api.response(409, 'A correction could not be applied', error_model)
+    @log_endpoint
+    @admit(BULK, deadline_ms=0)  # streams for as long as the count takes
+    def post(self, store_id):
+        """Compare a physical count (CSV or NDJSON, sorted by SKU) with the store's inventory"""
+        apply = request.args.get('apply', 'false').lower() == 'true'
+        ndjson = request.mimetype == 'application/x-ndjson'
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        out = reconcile.spool()
+        try:
+            summary = reconcile.reconcile(db.session, store_id, reconcile.parse_counts(lines, ndjson), out, apply)
+        except (reconcile.CountFileError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            out.close()
+            return {'error': str(e)}, 400
+        except reconcile.ReconcileConflict as e:
+            db.session.rollback()
+            out.close()
+            return {'error': str(e)}, 409
+        if apply:
+            db.session.commit()
+        out.write(json.dumps({'summary': summary}) + '\n')
+        out.seek(0)
+
+        def generate():
+            try:
+                for chunk in iter(lambda: out.read(READ_CHUNK), ''):
+                    yield chunk
+            finally:
+                out.close()
+
+        return Response(generate(), mimetype='application/x-ndjson')
@@ -0,0 +1,75 @@
+from flask import Blueprint, request
+from flask_restx import Namespace, Resource, fields
+from app.main import db
+from app.services import sync
+from app.utils.admission import BULK, admit
+from app.utils.logging_config import log_endpoint
+
+sync_bp = Blueprint('sync', __name__)
+api = Namespace('sync', description='Delta synchronisation operations')
+
+MAX_SYNC_LIMIT = 5000
+
+sync_params = {
+    'since': {'description': 'Token from the previous sync; omit to start a full snapshot'},
+    'limit': {'description': 'Maximum rows per page', 'type': 'integer', 'default': 1000},
+}
+
+error_model = api.model('Error', {
+    'error': fields.String(required=True, description='Error message')
+})
+
+
+def sync_page_model(namespace, name, item_model):
+    return namespace.model(name, {
+        'items': fields.List(fields.Nested(item_model), description='Rows created or updated'),
+        'deleted': fields.List(fields.String, description='Ids of rows deleted since the token'),
+        'next_token': fields.String(description='Token for the next sync call'),
+        'has_more': fields.Boolean(description='Whether another page is immediately available')
+    })
+
+
+def sync_response(result):
+    rows, deleted, next_token, has_more = result
+    return {
+        'items': [row.to_dict() for row in rows],
+        'deleted': deleted,
+        'next_token': next_token,
+        'has_more': has_more
+    }
+
+
+def sync_args():
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), MAX_SYNC_LIMIT)
+    return request.args.get('since'), limit
+
+
+synced_product_model = api.model('SyncedProduct', {
+    'id': fields.String(description='Product unique identifier'),
+    'name': fields.String(description='Product name'),
+    'description': fields.String(description='Product description'),
+    'category': fields.String(description='Product category'),
+    'price': fields.Float(description='Product price'),
+    'sku': fields.String(description='Product SKU'),
+    'created_at': fields.DateTime(description='Creation timestamp'),
+    'updated_at': fields.DateTime(description='Last update timestamp')
+})
+
+product_sync_model = sync_page_model(api, 'ProductSyncPage', synced_product_model)
+
+
+@api.route('/products')
+class ProductSync(Resource):
+    @api.doc('sync_products', params=sync_params)
+    @api.response(200, 'Success', product_sync_model)
+    @api.response(400, 'Invalid token', error_model)
+    @log_endpoint
+    @admit(BULK)
+    def get(self):
+        """Get catalog rows created, updated or deleted since a sync token"""
+        token, limit = sync_args()
+        try:
+            result = sync.sync_products(db.session, token, limit)
+        except sync.InvalidToken:
+            return {'error': 'Invalid sync token'}, 400
+        return api.marshal(sync_response(result), product_sync_model), 200
@@ -0,0 +1,210 @@
+"""Batched stock receipts (``IN``), sales (``OUT``) and transfers.
+
+A batch is applied in one transaction: the affected inventory rows are locked
+in (product_id, store_id) order, every movement is checked against the running
+balance of its rows, and the net change per row is written with a single
+guarded executemany. Movements, rollups, change records and low-stock crossings
+are written in bulk.
+"""
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select, tuple_, update
+
+from app.models.inventory import Inventory
+from app.models.movement import Movement, MovementType
+from app.models.product import Product
+from app.services import changes, counters, notifications, rollups, stores
+
+MAX_LINES = 5000
+LINE_TYPES = (MovementType.IN.value, MovementType.OUT.value)
+
+
+class ConcurrentUpdateError(Exception):
+    """A guarded update matched fewer rows than were locked and checked."""
+
+
+def parse_lines(lines, limit=MAX_LINES):
+    """Validate adjustment lines, raising ValueError naming the first bad line."""
+    if not isinstance(lines, list) or not lines:
+        raise ValueError('lines must be a non-empty list')
+    if len(lines) > limit:
+        raise ValueError(f'lines accepts at most {limit} items')
+    parsed = []
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict) or not all(
+            isinstance(line.get(key), str) and line[key] for key in ('product_id', 'store_id')
+        ):
+            raise ValueError(f'line {index}: product_id and store_id are required')
+        if line.get('type') not in LINE_TYPES:
+            raise ValueError(f'line {index}: type must be one of {", ".join(LINE_TYPES)}')
+        quantity = line.get('quantity')
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            raise ValueError(f'line {index}: quantity must be a positive integer')
+        parsed.append({'product_id': line['product_id'], 'store_id': line['store_id'],
+                       'type': MovementType(line['type']), 'quantity': quantity})
+    return parsed
+
+
+def movement_line(line):
+    """Express an adjustment line as a movement: ``IN`` only has a target, ``OUT`` only a source."""
+    store_id = line['store_id']
+    return {'product_id': line['product_id'], 'type': line['type'], 'quantity': line['quantity'],
+            'source_store_id': store_id if line['type'] == MovementType.OUT else None,
+            'target_store_id': store_id if line['type'] == MovementType.IN else None}
+
+
+def _stores(movement):
+    return [store_id for store_id in (movement['source_store_id'], movement['target_store_id']) if store_id]
+
+
+def apply_movements(session, groups):
+    """Apply groups of movements in one pass; each group is applied or rejected as a whole.
+
+    A movement fails when its source row is missing or holds less than its
+    quantity, or when its target row is missing and the product is unknown.
+    Missing target rows are created with ``min_stock`` 0.
+
+    Returns ``(results, balances)``. ``results[i]`` has the ``errors`` of group
+    i as ``(index, message)`` pairs (empty when applied) and the ``movements``
+    written for it; ``balances`` maps every changed (product, store) to its
+    quantity afterwards.
+    """
+    pairs = sorted({(movement['product_id'], store_id)
+                    for group in groups for movement in group for store_id in _stores(movement)})
+    rows = session.execute(
+        select(Inventory.id, Inventory.product_id, Inventory.store_id, Inventory.quantity, Inventory.min_stock)
+        .where(tuple_(Inventory.product_id, Inventory.store_id).in_(pairs), ~counters.is_hot())
+        .order_by(Inventory.product_id, Inventory.store_id)
+        .with_for_update()
+    )
+    ids, balances, original = {}, {}, {}
+    for inventory_id, product_id, store_id, quantity, min_stock in rows:
+        ids[(product_id, store_id)] = inventory_id
+        balances[(product_id, store_id)] = quantity
+        original[(product_id, store_id)] = (quantity, min_stock)
+    # Hot rows are not locked; their slots guard the decrements instead
+    hot = counters.hot_rows(session, [pair for pair in pairs if pair not in ids])
+    for key, (inventory_id, _, total, _) in hot.items():
+        ids[key] = inventory_id
+        balances[key] = total
+
+    unknown = {product_id for product_id, store_id in pairs if (product_id, store_id) not in ids}
+    if unknown:
+        unknown -= set(session.execute(select(Product.id).where(Product.id.in_(unknown))).scalars())
+
+    now = datetime.utcnow()
+    results, accepted = [], []
+    for group in groups:
+        tentative, errors = {}, []
+        for index, movement in enumerate(group):
+            product_id, quantity = movement['product_id'], movement['quantity']
+            source, target = movement['source_store_id'], movement['target_store_id']
+            changed = {}
+            if source:
+                balance = tentative.get((product_id, source), balances.get((product_id, source)))
+                if balance is None:
+                    errors.append((index, 'Inventory not found'))
+                    continue
+                if balance < quantity:
+                    errors.append((index, 'Insufficient stock'))
+                    continue
+                changed[(product_id, source)] = balance - quantity
+            if target:
+                key = (product_id, target)
+                balance = changed.get(key, tentative.get(key, balances.get(key)))
+                if balance is None and product_id in unknown:
+                    errors.append((index, 'Product not found'))
+                    continue
+                changed[key] = (balance or 0) + quantity
+            tentative.update(changed)
+        written = []
+        if not errors:
+            balances.update(tentative)
+            written = [{'id': str(uuid.uuid4()), **movement, 'timestamp': now} for movement in group]
+            accepted.extend(written)
+        results.append({'errors': errors, 'movements': written})
+
+    if not accepted:
+        return results, {}
+
+    deltas = defaultdict(int)
+    for movement in accepted:
+        if movement['source_store_id']:
+            deltas[(movement['product_id'], movement['source_store_id'])] -= movement['quantity']
+        if movement['target_store_id']:
+            deltas[(movement['product_id'], movement['target_store_id'])] += movement['quantity']
+
+    table = Inventory.__table__
+    updates = [{'b_product_id': product_id, 'b_store_id': store_id, 'b_delta': delta}
+               for (product_id, store_id), delta in sorted(deltas.items())
+               if delta and (product_id, store_id) in original]
+    if updates:
+        result = session.execute(
+            update(table)
+            .where(table.c.product_id == bindparam('b_product_id'), table.c.store_id == bindparam('b_store_id'),
+                   table.c.quantity + bindparam('b_delta') >= 0)
+            .values(quantity=table.c.quantity + bindparam('b_delta'), updated_at=now),
+            updates
+        )
+        if session.connection().dialect.supports_sane_multi_rowcount and result.rowcount != len(updates):
+            raise ConcurrentUpdateError('Inventory changed while the batch was applied')
+    for key in sorted(key for key in deltas if key in hot):
+        try:
+            counters.adjust(session, hot[key], *key, deltas[key])
+        except counters.InsufficientStock:
+            raise ConcurrentUpdateError('Inventory changed while the batch was applied')
+
+    created = []
+    for key in deltas:
+        if key not in ids:
+            ids[key] = str(uuid.uuid4())
+            created.append({'id': ids[key], 'product_id': key[0], 'store_id': key[1], 'quantity': balances[key],
+                            'min_stock': 0, 'created_at': now, 'updated_at': now})
+    if created:
+        session.execute(insert(table), created)
+
+    session.execute(insert(Movement.__table__), accepted)
+    rollups.record_movements(session.connection(), accepted)
+    # Hot rows reach the change feed when their slots are folded
+    changes.capture(session, [changes.inventory_record(ids[key], *key) for key in deltas if key not in hot])
+    events, totals = [], []
+    for key in deltas:
+        if key in hot:
+            continue
+        old_quantity, min_stock = original.get(key, (None, 0))
+        events.append(notifications.crossing(ids[key], *key, old_quantity, min_stock, balances[key], min_stock))
+        totals.append(stores.row_delta(*key, old_quantity, min_stock, balances[key], min_stock))
+    notifications.capture(session, events)
+    stores.capture(session, totals)
+
+    return results, {key: balances[key] for key in deltas}
+
+
+def adjustment_groups(lines, atomic=True):
+    """Group parsed lines for ``apply_movements``: all together, or one group per line."""
+    movements = [movement_line(line) for line in lines]
+    return [movements] if atomic else [[movement] for movement in movements]
+
+
+def adjustment_outcome(lines, atomic, results):
+    """Turn ``apply_movements`` results for ``adjustment_groups`` into ``(applied, rejected)``."""
+    if atomic:
+        rejected = [{'index': index, 'error': error} for index, error in results[0]['errors']]
+        return ([] if rejected else list(lines)), rejected
+    rejected = [{'index': index, 'error': result['errors'][0][1]}
+                for index, result in enumerate(results) if result['errors']]
+    return [line for line, result in zip(lines, results) if not result['errors']], rejected
+
+
+def apply_adjustments(session, lines, atomic=True):
+    """Apply parsed lines in order. Returns ``(applied, rejected, balances)``.
+
+    A line is rejected when an ``OUT`` would take its row below zero or the row
+    does not exist, or when an ``IN`` names an unknown product. With ``atomic``
+    any rejection leaves the database untouched.
+    """
+    results, balances = apply_movements(session, adjustment_groups(lines, atomic))
+    applied, rejected = adjustment_outcome(lines, atomic, results)
+    return applied, rejected, balances
@@ -0,0 +1,138 @@
+"""Set-based bulk updates of product prices and inventory thresholds.
+
+Each update is one ``UPDATE ... RETURNING`` statement; the returned keys feed
+the change feed so mirrors see every touched row. Threshold updates first read
+the rows whose low-stock state the new threshold flips, for notifications.
+Rows whose new value would be negative are left unchanged by a guard in the
+``WHERE`` clause.
+"""
+from datetime import datetime
+from numbers import Number
+
+from sqlalchemy import Integer, cast, func, literal, select, update
+
+from app.models.inventory import Inventory
+from app.models.product import Product
+from app.services import changes, counters, notifications, stores
+
+OPERATIONS = ('set', 'multiply', 'add')
+PRODUCT_FILTERS = ('category', 'min_price', 'max_price', 'skus')
+INVENTORY_FILTERS = PRODUCT_FILTERS + ('store_ids',)
+
+
+def parse_operation(data, integer=False):
+    """Validate ``{"op": ..., "value": ...}`` and return ``(op, value)``."""
+    if not isinstance(data, dict) or data.get('op') not in OPERATIONS:
+        raise ValueError(f'operation.op must be one of {", ".join(OPERATIONS)}')
+    op, value = data['op'], data.get('value')
+    if isinstance(value, bool) or not isinstance(value, Number):
+        raise ValueError('operation.value must be a number')
+    if op in ('set', 'multiply') and value < 0:
+        raise ValueError(f'operation.value must not be negative for {op}')
+    if integer and op != 'multiply' and value != int(value):
+        raise ValueError(f'operation.value must be an integer for {op}')
+    if integer and op != 'multiply':
+        value = int(value)
+    return op, value
+
+
+def parse_filter(data, allowed):
+    """Validate a bulk-update filter; at least one criterion is required."""
+    if not isinstance(data, dict) or not data:
+        raise ValueError('filter must name at least one of: ' + ', '.join(allowed))
+    unknown = set(data) - set(allowed)
+    if unknown:
+        raise ValueError(f'Unknown filter keys: {", ".join(sorted(unknown))}')
+    for key in ('skus', 'store_ids'):
+        value = data.get(key)
+        if value is not None and not (isinstance(value, list) and value and all(isinstance(v, str) for v in value)):
+            raise ValueError(f'filter.{key} must be a non-empty list of strings')
+    for key in ('min_price', 'max_price'):
+        value = data.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, Number)):
+            raise ValueError(f'filter.{key} must be a number')
+    if 'category' in data and not isinstance(data['category'], str):
+        raise ValueError('filter.category must be a string')
+    return data
+
+
+def product_criteria(filters):
+    criteria = []
+    if 'category' in filters:
+        criteria.append(Product.category == filters['category'])
+    if 'min_price' in filters:
+        criteria.append(Product.price >= filters['min_price'])
+    if 'max_price' in filters:
+        criteria.append(Product.price <= filters['max_price'])
+    if 'skus' in filters:
+        criteria.append(Product.sku.in_(filters['skus']))
+    return criteria
+
+
+def _new_value(column, op, value, integer=False):
+    if op == 'set':
+        return literal(value, column.type)
+    if op == 'add':
+        return column + value
+    if integer:
+        return cast(func.round(column * value), Integer)
+    return func.round(column * value, 2)
+
+
+def update_prices(session, filters, op, value):
+    """Apply ``op`` to the price of every matching product. Returns the affected count."""
+    table = Product.__table__
+    new_price = _new_value(table.c.price, op, value)
+    # Old prices, read under lock, so the stores' stock can be revalued
+    old_prices = dict(session.execute(
+        select(table.c.id, table.c.price).where(*product_criteria(filters), new_price >= 0).with_for_update()
+    ).all())
+    statement = (
+        update(table)
+        .where(*product_criteria(filters), new_price >= 0)
+        .values(price=new_price, updated_at=datetime.utcnow())
+        .returning(table.c.id, table.c.price)
+    )
+    rows = session.execute(statement).all()
+    changes.capture(session, [changes.product_record(product_id) for product_id, _ in rows])
+    stores.capture_prices(session, [stores.price_change(product_id, old_prices[product_id], price)
+                                    for product_id, price in rows if product_id in old_prices])
+    return len(rows)
+
+
+def update_min_stock(session, filters, op, value):
+    """Apply ``op`` to ``min_stock`` of every matching inventory row. Returns the affected count."""
+    table = Inventory.__table__
+    criteria = []
+    product_filters = product_criteria(filters)
+    if product_filters:
+        criteria.append(table.c.product_id.in_(select(Product.id).where(*product_filters)))
+    if 'store_ids' in filters:
+        criteria.append(table.c.store_id.in_(filters['store_ids']))
+    new_min_stock = _new_value(table.c.min_stock, op, value, integer=True)
+    # Rows whose low-stock state flips under the new threshold, read before they change; hot rows
+    # are judged by their slot totals, not the cached quantity
+    quantity = counters.current_quantity()
+    crossings = session.execute(
+        select(table.c.id, table.c.product_id, table.c.store_id, quantity.label('quantity'), table.c.min_stock,
+               new_min_stock.label('new_min_stock'))
+        .where(*criteria, new_min_stock >= 0, (quantity <= table.c.min_stock) != (quantity <= new_min_stock))
+        .with_for_update()
+    ).all()
+    statement = (
+        update(table)
+        .where(*criteria, new_min_stock >= 0)
+        .values(min_stock=new_min_stock, updated_at=datetime.utcnow())
+        .returning(table.c.id, table.c.product_id, table.c.store_id)
+    )
+    rows = session.execute(statement).all()
+    changes.capture(session, [changes.inventory_record(*row) for row in rows])
+    notifications.capture(session, [
+        notifications.crossing(*row[:3], row.quantity, row.min_stock, row.quantity, row.new_min_stock)
+        for row in crossings
+    ])
+    stores.capture(session, [
+        stores.row_delta(row.product_id, row.store_id, row.quantity, row.min_stock, row.quantity, row.new_min_stock)
+        for row in crossings
+    ])
+    return len(rows)
@@ -0,0 +1,153 @@
+"""Monotonic change feed for products and inventory.
+
+ORM writes to ``Product`` and ``Inventory`` are captured by a ``before_flush``
+hook; set-based writers pass their records to ``capture`` (or, outside the ORM
+session, to ``write_changes``). Sequence numbers are handed out just before
+commit from a single counter row. The counter's row lock is held until the
+commit finishes, so sequence order matches commit order and a reader that has
+seen ``seq`` N can never later find a newly committed change below N.
+"""
+import threading
+from datetime import datetime
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.change import ChangeCounter, ChangeLog
+from app.models.inventory import Inventory
+from app.models.product import Product
+from app.utils.sql import upsert_add
+
+PRODUCT = 'product'
+INVENTORY = 'inventory'
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+_PENDING = 'pending_changes'
+_LAST_SEQ = 'last_change_seq'
+
+
+def record(entity, entity_id, product_id=None, store_id=None, op=UPSERT):
+    return {'entity': entity, 'entity_id': entity_id, 'product_id': product_id, 'store_id': store_id, 'op': op}
+
+
+def inventory_record(inventory_id, product_id, store_id, op=UPSERT):
+    return record(INVENTORY, inventory_id, product_id, store_id, op)
+
+
+def product_record(product_id, op=UPSERT):
+    return record(PRODUCT, product_id, product_id, None, op)
+
+
+def capture(session, records):
+    """Queue change records to be sequenced when ``session`` commits."""
+    session.info.setdefault(_PENDING, []).extend(records)
+
+
+def pending(session):
+    """Change records queued on ``session`` that have not been sequenced yet."""
+    return list(session.info.get(_PENDING, ()))
+
+
+def write_changes(connection, records):
+    """Sequence and insert change records on ``connection``. Returns the last seq."""
+    if not records:
+        return None
+    counter = ChangeCounter.__table__
+    upsert_add(connection, counter, [{'id': 1, 'value': len(records)}], ['id'], ['value'])
+    last = connection.execute(select(counter.c.value).where(counter.c.id == 1)).scalar()
+    first = last - len(records) + 1
+    now = datetime.utcnow()
+    connection.execute(insert(ChangeLog.__table__), [
+        {**change, 'seq': first + offset, 'changed_at': now} for offset, change in enumerate(records)
+    ])
+    return last
+
+
+def _orm_record(obj, op):
+    if isinstance(obj, Product):
+        return product_record(obj.id, op)
+    if isinstance(obj, Inventory):
+        return inventory_record(obj.id, obj.product_id, obj.store_id, op)
+    return None
+
+
+@event.listens_for(Session, 'before_flush')
+def _capture_orm_changes(session, flush_context, instances):
+    records = [_orm_record(obj, UPSERT) for obj in session.new]
+    records += [_orm_record(obj, UPSERT) for obj in session.dirty if session.is_modified(obj)]
+    records += [_orm_record(obj, DELETE) for obj in session.deleted]
+    records = [change for change in records if change is not None]
+    if records:
+        capture(session, records)
+
+
+@event.listens_for(Session, 'before_commit')
+def _sequence_pending_changes(session):
+    # Flush first so objects still pending in the session report their changes
+    session.flush()
+    records = session.info.pop(_PENDING, None)
+    if records:
+        # Several flushes may touch the same row; one entry per row is enough
+        latest = {(change['entity'], change['entity_id']): change for change in records}
+        session.info[_LAST_SEQ] = write_changes(session.connection(), list(latest.values()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_committed(session):
+    last = session.info.pop(_LAST_SEQ, None)
+    if last is not None:
+        notifier.notify(last)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(_PENDING, None)
+    session.info.pop(_LAST_SEQ, None)
+
+
+class ChangeNotifier:
+    """Wakes stream readers in this process when a commit produces changes.
+
+    Changes committed by other processes are picked up by the readers' poll
+    interval instead.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.latest = 0
+
+    def notify(self, seq):
+        with self._condition:
+            self.latest = max(self.latest, seq)
+            self._condition.notify_all()
+
+    def wait(self, seen, timeout):
+        """Block until a change newer than ``seen`` is committed or ``timeout`` elapses."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.latest > seen, timeout)
+
+
+notifier = ChangeNotifier()
+
+
+def changes_since(session, since, store_id=None, product_id=None, limit=500):
+    """Return changes after ``since`` in sequence order.
+
+    Inventory upserts carry the row's current ``quantity`` and ``min_stock``.
+    """
+    query = session.query(ChangeLog, Inventory.quantity, Inventory.min_stock).outerjoin(
+        Inventory, (ChangeLog.entity == INVENTORY) & (Inventory.id == ChangeLog.entity_id)
+    ).filter(ChangeLog.seq > since)
+    if store_id is not None:
+        query = query.filter(ChangeLog.store_id == store_id)
+    if product_id is not None:
+        query = query.filter(ChangeLog.product_id == product_id)
+
+    results = []
+    for change, quantity, min_stock in query.order_by(ChangeLog.seq).limit(limit):
+        item = change.to_dict()
+        if quantity is not None:
+            item.update(quantity=quantity, min_stock=min_stock)
+        results.append(item)
+    return results
@@ -0,0 +1,119 @@
+"""Periodic stock checkpoints and point-in-time quantity reconstruction.
+
+A checkpoint copies every inventory quantity, hot rows' slot totals included,
+at one instant. The quantity of a (product, store) pair at time T is the
+quantity in the latest checkpoint taken at or before T plus the movements
+recorded between that checkpoint and T, so a query only replays the ledger
+delta since the nearest checkpoint.
+"""
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, insert, select
+
+from app.main import db
+from app.models.checkpoint import StockCheckpoint
+from app.models.inventory import Inventory
+from app.services import counters, ledger
+from app.services.ledger import ledger_cli
+from app.utils import sharding
+
+BATCH_SIZE = 1000
+
+
+def movement_delta(row, store_id):
+    """Signed effect of a ledger movement on ``store_id``'s quantity.
+
+    ``IN`` movements only carry a target store, ``OUT`` movements only a source
+    store and transfers carry both, so one rule covers every movement type.
+    """
+    delta = 0
+    if row['target_store_id'] == store_id:
+        delta += row['quantity']
+    if row['source_store_id'] == store_id:
+        delta -= row['quantity']
+    return delta
+
+
+def create_checkpoint(session, taken_at=None):
+    """Copy every inventory quantity into a new checkpoint. Returns (taken_at, rows)."""
+    taken_at = taken_at or datetime.utcnow()
+    query = select(Inventory.product_id, Inventory.store_id, counters.current_quantity()).execution_options(
+        yield_per=BATCH_SIZE
+    )
+    count = 0
+    for partition in session.execute(query).partitions():
+        session.execute(insert(StockCheckpoint), [{
+            'id': str(uuid.uuid4()),
+            'product_id': product_id,
+            'store_id': store_id,
+            'quantity': quantity,
+            'taken_at': taken_at,
+        } for product_id, store_id, quantity in partition])
+        count += len(partition)
+    return taken_at, count
+
+
+def prune_checkpoints(session, older_than):
+    """Delete checkpoints taken before ``older_than``, always keeping the latest one."""
+    latest = session.execute(select(db.func.max(StockCheckpoint.taken_at))).scalar()
+    if latest is None:
+        return 0
+    cutoff = min(older_than, latest)
+    return session.execute(delete(StockCheckpoint).where(StockCheckpoint.taken_at < cutoff)).rowcount
+
+
+def nearest_checkpoint(session, at):
+    return session.execute(
+        select(db.func.max(StockCheckpoint.taken_at)).where(StockCheckpoint.taken_at <= at)
+    ).scalar()
+
+
+def quantities_as_of(session, at, product_id=None, store_id=None):
+    """Reconstruct quantities at ``at`` for a product, a store, or one pair.
+
+    Returns ``(checkpoint_taken_at, {(product_id, store_id): quantity})``.
+    """
+    taken_at = nearest_checkpoint(session, at)
+    quantities = {}
+    if taken_at is not None:
+        query = select(StockCheckpoint.product_id, StockCheckpoint.store_id, StockCheckpoint.quantity).where(
+            StockCheckpoint.taken_at == taken_at
+        )
+        if product_id is not None:
+            query = query.where(StockCheckpoint.product_id == product_id)
+        if store_id is not None:
+            query = query.where(StockCheckpoint.store_id == store_id)
+        for pid, sid, quantity in session.execute(query):
+            quantities[(pid, sid)] = quantity
+
+    # The checkpoint reflects every movement stamped before it was taken, so
+    # only movements from taken_at up to and including ``at`` are replayed.
+    movements = ledger.iter_movements(
+        session.connection(), product_id=product_id, store_id=store_id,
+        since=taken_at, until=at + timedelta(microseconds=1)
+    )
+    for row in movements:
+        for sid in (row['source_store_id'], row['target_store_id']):
+            if sid is None or (store_id is not None and sid != store_id):
+                continue
+            key = (row['product_id'], sid)
+            quantities[key] = quantities.get(key, 0) + movement_delta(row, sid)
+    return taken_at, quantities
+
+
+@ledger_cli.command('checkpoint')
+@click.option('--retain-days', type=int, default=None, help='Delete checkpoints older than this many days.')
+def checkpoint_command(retain_days):
+    """Snapshot current stock levels for point-in-time queries (run periodically)."""
+    for key in sharding.each_shard():
+        taken_at, count = create_checkpoint(db.session)
+        pruned = 0
+        if retain_days is not None:
+            pruned = prune_checkpoints(db.session, taken_at - timedelta(days=retain_days))
+        db.session.commit()
+        click.echo(json.dumps(sharding.tagged(key, {
+            'taken_at': taken_at.isoformat(), 'rows': count, 'pruned': pruned
+        })))
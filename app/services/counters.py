@@ -0,0 +1,214 @@
+"""Hot-row mode: spread an inventory row's quantity across counter slots.
+
+Writers that all hit one ``Inventory`` row serialize on its lock. In hot-row
+mode the quantity lives in N ``inventory_slot`` rows instead: an increment adds
+to a random slot, and a decrement takes from a random slot when that slot alone
+covers it. Otherwise the decrement locks every slot in slot order and spills
+over them. Each slot is guarded to stay non-negative, so the total never goes
+below zero, and concurrent writers usually touch different slots.
+
+Reads that need the exact quantity use ``current_quantity()``. The
+``Inventory.quantity`` column of a hot row is a cached total that ``fold``
+refreshes; the change feed and sync mirrors see hot rows at that cadence.
+"""
+import json
+import random
+from datetime import datetime
+
+import click
+from sqlalchemy import bindparam, delete, func, insert, select, tuple_, update
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.inventory_slot import InventorySlot
+from app.services import changes, notifications, stores
+from app.services.recommendations import inventory_cli
+from app.utils import sharding
+
+DEFAULT_SLOTS = 8
+
+
+class InsufficientStock(Exception):
+    """The slots of a hot row together hold less than the requested decrement."""
+
+
+def slot_total():
+    """Correlated sum of the current ``Inventory`` row's slots (NULL when not hot)."""
+    return select(func.sum(InventorySlot.quantity)).where(
+        InventorySlot.inventory_id == Inventory.id
+    ).scalar_subquery()
+
+
+def is_hot():
+    """Whether the current ``Inventory`` row is in hot-row mode."""
+    return select(InventorySlot.slot).where(InventorySlot.inventory_id == Inventory.id).exists()
+
+
+def slot_count():
+    """Correlated number of the current ``Inventory`` row's slots (0 when not hot)."""
+    return select(func.count(InventorySlot.slot)).where(
+        InventorySlot.inventory_id == Inventory.id
+    ).scalar_subquery()
+
+
+def current_quantity():
+    """Column expression for a row's exact quantity, hot or not."""
+    return func.coalesce(slot_total(), Inventory.quantity)
+
+
+def hot_rows(session, pairs):
+    """Map hot (product_id, store_id) pairs to ``(inventory_id, slots, total, min_stock)``."""
+    if not pairs:
+        return {}
+    query = (
+        select(Inventory.product_id, Inventory.store_id, Inventory.id, func.count(InventorySlot.slot),
+               func.sum(InventorySlot.quantity), Inventory.min_stock)
+        .join(InventorySlot, InventorySlot.inventory_id == Inventory.id)
+        .where(tuple_(Inventory.product_id, Inventory.store_id).in_(list(pairs)))
+        .group_by(Inventory.product_id, Inventory.store_id, Inventory.id, Inventory.min_stock)
+    )
+    return {(row[0], row[1]): tuple(row[2:]) for row in session.execute(query)}
+
+
+def enable(session, inventory_id, slots=DEFAULT_SLOTS):
+    """Switch a row to hot-row mode (or change its slot count), spreading its quantity evenly."""
+    if slots < 1:
+        raise ValueError('slots must be at least 1')
+    session.execute(select(Inventory.id).where(Inventory.id == inventory_id).with_for_update())
+    total = disable(session, inventory_id)
+    if total is None:
+        raise LookupError(f'Inventory {inventory_id} not found')
+    session.execute(insert(InventorySlot.__table__), spread(inventory_id, slots, total))
+    return total
+
+
+def spread(inventory_id, slots, total):
+    """Slot rows holding ``total`` evenly over ``slots`` slots."""
+    share, remainder = divmod(total, slots)
+    return [{'inventory_id': inventory_id, 'slot': slot, 'quantity': share + (slot < remainder)}
+            for slot in range(slots)]
+
+
+def disable(session, inventory_id):
+    """Fold a row's slots back into ``Inventory.quantity`` and drop them. Returns the quantity."""
+    fold(session, [inventory_id])
+    session.execute(delete(InventorySlot.__table__).where(InventorySlot.inventory_id == inventory_id))
+    return session.execute(select(Inventory.quantity).where(Inventory.id == inventory_id)).scalar()
+
+
+def fold(session, inventory_ids=None):
+    """Copy slot totals into ``Inventory.quantity`` for hot rows whose cached value is stale.
+
+    Returns the number of rows refreshed; each one gets a change record.
+    """
+    totals = select(InventorySlot.inventory_id, func.sum(InventorySlot.quantity).label('total')).group_by(
+        InventorySlot.inventory_id
+    )
+    if inventory_ids is not None:
+        totals = totals.where(InventorySlot.inventory_id.in_(inventory_ids))
+    totals = totals.subquery()
+    stale = session.execute(
+        select(Inventory.id, Inventory.product_id, Inventory.store_id, totals.c.total)
+        .join(totals, totals.c.inventory_id == Inventory.id)
+        .where(Inventory.quantity != totals.c.total)
+    ).all()
+    if stale:
+        table = Inventory.__table__
+        session.execute(
+            update(table).where(table.c.id == bindparam('b_id'))
+            .values(quantity=bindparam('b_total'), updated_at=datetime.utcnow()),
+            [{'b_id': row.id, 'b_total': row.total} for row in stale]
+        )
+        changes.capture(session, [changes.inventory_record(*row[:3]) for row in stale])
+    return len(stale)
+
+
+def _take(session, inventory_id, slots, quantity):
+    table = InventorySlot.__table__
+    start = random.randrange(slots)
+    taken = session.execute(
+        update(table)
+        .where(table.c.inventory_id == inventory_id, table.c.slot == start, table.c.quantity >= quantity)
+        .values(quantity=table.c.quantity - quantity)
+    ).rowcount
+    if taken:
+        return
+
+    # Spill over: lock every slot in slot order so concurrent spills cannot deadlock
+    available = session.execute(
+        select(table.c.slot, table.c.quantity).where(table.c.inventory_id == inventory_id)
+        .order_by(table.c.slot).with_for_update()
+    ).all()
+    if sum(row.quantity for row in available) < quantity:
+        raise InsufficientStock(f'Insufficient stock in hot inventory {inventory_id}')
+    takes, remaining = [], quantity
+    for slot, on_hand in available:
+        take = min(on_hand, remaining)
+        if take:
+            takes.append({'b_slot': slot, 'b_take': take})
+            remaining -= take
+        if not remaining:
+            break
+    session.execute(
+        update(table)
+        .where(table.c.inventory_id == inventory_id, table.c.slot == bindparam('b_slot'),
+               table.c.quantity >= bindparam('b_take'))
+        .values(quantity=table.c.quantity - bindparam('b_take')),
+        takes
+    )
+
+
+def adjust(session, hot_row, product_id, store_id, delta):
+    """Apply ``delta`` to a hot row given as returned by ``hot_rows``.
+
+    Raises InsufficientStock when a decrement exceeds what the slots hold.
+    """
+    inventory_id, slots, _, min_stock = hot_row
+    if delta < 0:
+        _take(session, inventory_id, slots, -delta)
+    elif delta > 0:
+        table = InventorySlot.__table__
+        session.execute(
+            update(table).where(table.c.inventory_id == inventory_id, table.c.slot == random.randrange(slots))
+            .values(quantity=table.c.quantity + delta)
+        )
+    else:
+        return
+    total = session.execute(
+        select(func.sum(InventorySlot.quantity)).where(InventorySlot.inventory_id == inventory_id)
+    ).scalar()
+    notifications.capture(session, [
+        notifications.crossing(inventory_id, product_id, store_id, total - delta, min_stock, total, min_stock)
+    ])
+    stores.capture(session, [stores.row_delta(product_id, store_id, total - delta, min_stock, total, min_stock)])
+
+
+def _find_inventory(product_id, store_id):
+    inventory = Inventory.query.filter_by(product_id=product_id, store_id=store_id).first()
+    if inventory is None:
+        raise click.ClickException(f'No inventory for product {product_id} in store {store_id}')
+    return inventory
+
+
+@inventory_cli.command('hot')
+@click.argument('product_id')
+@click.argument('store_id')
+@click.option('--slots', default=DEFAULT_SLOTS, show_default=True, help='Counter slots for the row.')
+@click.option('--off', is_flag=True, help='Fold the slots back and leave hot-row mode.')
+def hot_command(product_id, store_id, slots, off):
+    """Put one inventory row in (or take it out of) hot-row mode."""
+    if sharding.enabled():
+        sharding.route(db.session, [store_id])
+    inventory = _find_inventory(product_id, store_id)
+    quantity = disable(db.session, inventory.id) if off else enable(db.session, inventory.id, slots)
+    db.session.commit()
+    click.echo(json.dumps({'inventory_id': inventory.id, 'slots': 0 if off else slots, 'quantity': quantity}))
+
+
+@inventory_cli.command('fold')
+def fold_command():
+    """Refresh the cached quantity of hot rows from their slots (run periodically)."""
+    for key in sharding.each_shard():
+        folded = fold(db.session)
+        db.session.commit()
+        click.echo(json.dumps(sharding.tagged(key, {'folded': folded})))
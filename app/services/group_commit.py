@@ -0,0 +1,154 @@
+"""In-process group commit for transfers and adjustments.
+
+Request threads hand their movement groups to a single scheduler thread
+instead of committing on their own. The scheduler collects whatever arrives
+within ``GROUP_COMMIT_WINDOW_MS`` of the first request, up to
+``GROUP_COMMIT_MAX_BATCH`` groups, and applies them with one
+``adjustments.apply_movements`` call and one commit. Rows are locked in
+(product_id, store_id) order, so batches cannot deadlock each other. Each
+caller gets the result of its own groups, including per-group rejections. If
+the combined transaction fails, its requests are retried one at a time so a
+single bad request cannot fail its neighbours.
+
+A caller waits for its result no longer than its request deadline. If the
+wait runs out before its batch starts, the request is cancelled and never
+applied; once the batch has started, the caller waits for its commit.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.main import db
+from app.services import adjustments
+from app.utils import deadlines
+
+RESULT_TIMEOUT = 30
+
+
+class BatchFailed(Exception):
+    """The request's transaction failed and was rolled back, so none of it was applied."""
+
+
+class _Request:
+    def __init__(self, groups):
+        self.groups = groups
+        self.future = Future()
+
+
+class GroupCommitScheduler:
+    def __init__(self, app, window_ms=2.0, max_batch=64):
+        self.app = app
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(app, app.config['GROUP_COMMIT_WINDOW_MS'], app.config['GROUP_COMMIT_MAX_BATCH'])
+
+    def submit(self, groups):
+        """Queue movement groups; the future resolves to ``(results, balances)`` as from ``apply_movements``."""
+        self._ensure_started()
+        request = _Request(groups)
+        self._queue.put(request)
+        return request.future
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].groups)
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.groups)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self.app.app_context():
+                try:
+                    self._apply(batch)
+                finally:
+                    db.session.remove()
+
+    def _apply(self, batch):
+        # Requests cancelled by a caller that stopped waiting are dropped before they can apply
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if batch:
+            self._commit(batch)
+
+    def _commit(self, batch):
+        groups = [group for request in batch for group in request.groups]
+        try:
+            results, balances = adjustments.apply_movements(db.session, groups)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            for request in batch:
+                self._commit([request])
+            return
+
+        offset = 0
+        for request in batch:
+            own = results[offset:offset + len(request.groups)]
+            offset += len(request.groups)
+            keys = {key for result in own for movement in result['movements']
+                    for key in [(movement['product_id'], movement['source_store_id']),
+                                (movement['product_id'], movement['target_store_id'])] if key[1]}
+            request.future.set_result((own, {key: balances[key] for key in keys if key in balances}))
+
+
+def wait(future):
+    """The ``(results, balances)`` of a submitted request, waiting no longer than the request deadline.
+
+    Raises DeadlineExceeded when the request was cancelled before it applied,
+    or when its batch did not commit within ``RESULT_TIMEOUT`` of starting, and
+    BatchFailed when the batch's transaction failed.
+    """
+    left = deadlines.remaining()
+    timeout = RESULT_TIMEOUT if left is None else max(0, min(left, RESULT_TIMEOUT))
+    try:
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise deadlines.DeadlineExceeded('Request deadline exceeded before the request was applied')
+        try:
+            return future.result(RESULT_TIMEOUT)
+        except FutureTimeout:
+            raise deadlines.DeadlineExceeded('Request deadline exceeded while its batch was committing; '
+                                             'check the outcome before retrying')
+    except SQLAlchemyError as e:
+        raise BatchFailed('The request could not be applied; retry later') from e
+
+
+def init_group_commit(app):
+    # The scheduler's session is not routed to shards, so sharded apps commit per request
+    if app.config['GROUP_COMMIT_ENABLED'] and not app.config['SHARD_DATABASE_URLS']:
+        app.extensions['group_commit'] = GroupCommitScheduler.from_config(app)
+
+
+def scheduler(app):
+    """The app's scheduler, or None when group commit is disabled."""
+    return app.extensions.get('group_commit')
@@ -0,0 +1,455 @@
+"""Database-backed queue for long-running inventory operations.
+
+``POST /api/jobs`` validates a job and inserts it as ``queued``; the web
+process never runs it. Job workers (``flask jobs work``) claim jobs and run
+them in a pool of worker processes. A claim is a single statement that takes
+the oldest runnable job: ``UPDATE ... WHERE id = (SELECT ... FOR UPDATE SKIP
+LOCKED)`` on PostgreSQL, so concurrent workers skip each other's rows, and the
+same statement without the lock clause on SQLite, where writers are serialized
+and the UPDATE re-checks the state it selected on.
+
+Claimed jobs are leased for ``JOBS_LEASE_SECONDS``. Handlers work in chunks
+and commit each chunk together with the job's checkpoint and progress, which
+also renews the lease. A job whose worker died is claimed again once its lease
+runs out and resumes from its last checkpoint; every write of the old worker
+is fenced off by the claim count. A job claimed more than ``JOBS_MAX_ATTEMPTS``
+times, or whose handler raises, fails.
+"""
+import json
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_, select, update
+
+from app.main import db
+from app.models.job import Job
+from app.services import adjustments, rebuild, recommendations, reconcile, rollups
+from app.utils import sharding
+
+jobs_cli = AppGroup('jobs', help='Background job workers.')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+IMPORT_MAX_LINES = 100000
+# Attempts per chunk when concurrent writes invalidate its guarded update
+CHUNK_RETRIES = 3
+SAMPLE_SIZE = 100
+
+KINDS = {}
+
+
+class LeaseLost(Exception):
+    """The job was claimed by another worker after this worker's lease ran out."""
+
+
+class JobKind:
+    def __init__(self, name, validate, run):
+        self.name = name
+        self.validate = validate
+        self.run = run
+
+
+def job_kind(name, validate):
+    """Register ``run(context, params)`` as the handler of jobs of kind ``name``.
+
+    ``validate(params)`` raises ValueError or returns the params to store.
+    """
+    def decorator(run):
+        KINDS[name] = JobKind(name, validate, run)
+        return run
+    return decorator
+
+
+def submit(session, kind, params):
+    """Validate and queue a job. Raises ValueError for an unknown kind or bad params."""
+    if kind not in KINDS:
+        raise ValueError(f'kind must be one of {", ".join(sorted(KINDS))}')
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        raise ValueError('params must be an object')
+    job = Job(id=str(uuid.uuid4()), kind=kind, params=KINDS[kind].validate(params), state=QUEUED)
+    session.add(job)
+    return job
+
+
+def _runnable(table, now):
+    return or_(table.c.state == QUEUED, and_(table.c.state == RUNNING, table.c.lease_until < now))
+
+
+def claim(connection, worker, lease_seconds):
+    """Take the oldest queued (or abandoned) job. Returns ``(job_id, attempt)`` or None."""
+    table = Job.__table__
+    now = datetime.utcnow()
+    candidate = (
+        select(table.c.id).where(_runnable(table, now))
+        .order_by(table.c.created_at).limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    row = connection.execute(
+        update(table).where(table.c.id == candidate, _runnable(table, now))
+        .values(state=RUNNING, worker=worker, attempts=table.c.attempts + 1,
+                lease_until=now + timedelta(seconds=lease_seconds),
+                started_at=db.func.coalesce(table.c.started_at, now))
+        .returning(table.c.id, table.c.attempts)
+    ).first()
+    return tuple(row) if row else None
+
+
+class JobContext:
+    """What a handler sees of its job: the last checkpoint, and a way to commit a chunk."""
+
+    def __init__(self, session, job_id, attempt, checkpoint, lease_seconds, chunk_size):
+        self.session = session
+        self.job_id = job_id
+        self.attempt = attempt
+        self.checkpoint = checkpoint
+        self.lease = timedelta(seconds=lease_seconds)
+        self.chunk_size = chunk_size
+
+    def _update(self, **values):
+        table = Job.__table__
+        result = self.session.execute(
+            update(table).where(table.c.id == self.job_id, table.c.attempts == self.attempt,
+                                table.c.state == RUNNING).values(**values)
+        )
+        if result.rowcount != 1:
+            self.session.rollback()
+            raise LeaseLost(f'Job {self.job_id} was claimed by another worker')
+
+    def save(self, checkpoint, done, total=None):
+        """Commit the chunk written in ``session`` together with its checkpoint and progress."""
+        values = {'checkpoint': checkpoint, 'progress_done': done,
+                  'lease_until': datetime.utcnow() + self.lease}
+        if total is not None:
+            values['progress_total'] = total
+        self._update(**values)
+        self.session.commit()
+        self.checkpoint = checkpoint
+
+    def finish(self, state, result=None, error=None):
+        self._update(state=state, result=result, error=error, lease_until=None, finished_at=datetime.utcnow())
+        self.session.commit()
+
+
+def run_job(session, job_id, attempt, lease_seconds, max_attempts, chunk_size):
+    """Run a claimed job to completion. Returns its final state, or None if the lease was lost."""
+    table = Job.__table__
+    job = session.execute(select(table.c.kind, table.c.params, table.c.checkpoint)
+                          .where(table.c.id == job_id)).one()
+    session.commit()
+    context = JobContext(session, job_id, attempt, job.checkpoint, lease_seconds, chunk_size)
+    try:
+        if attempt > max_attempts:
+            context.finish(FAILED, error=f'Gave up after {max_attempts} attempts')
+            return FAILED
+        try:
+            result = KINDS[job.kind].run(context, job.params)
+        except LeaseLost:
+            raise
+        except Exception as e:
+            session.rollback()
+            current_app.logger.exception('Job %s (%s) failed', job_id, job.kind)
+            context.finish(FAILED, error=str(e))
+            return FAILED
+        context.finish(SUCCEEDED, result=result)
+        return SUCCEEDED
+    except LeaseLost as e:
+        current_app.logger.warning('%s', e)
+        return None
+
+
+_process_app = None
+
+
+def _init_process(app):
+    global _process_app
+    _process_app = app
+    with app.app_context():
+        # Forked workers must not share the parent's pooled connections
+        db.engine.dispose(close=False)
+
+
+def _run_in_process(job_id, attempt, lease_seconds, max_attempts, chunk_size):
+    with _process_app.app_context():
+        try:
+            return run_job(db.session, job_id, attempt, lease_seconds, max_attempts, chunk_size)
+        finally:
+            db.session.remove()
+
+
+class Worker:
+    """Claims jobs and runs them in ``processes`` worker processes (inline when 0)."""
+
+    def __init__(self, app, processes=1, poll_interval=1.0, lease_seconds=300.0, max_attempts=3, chunk_size=1000):
+        self.app = app
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.chunk_size = chunk_size
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+
+    @classmethod
+    def from_config(cls, app, processes=None):
+        config = app.config
+        return cls(app, config['JOBS_PROCESSES'] if processes is None else processes, config['JOBS_POLL_INTERVAL'],
+                   config['JOBS_LEASE_SECONDS'], config['JOBS_MAX_ATTEMPTS'], config['JOBS_CHUNK_SIZE'])
+
+    def claim(self):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                return claim(connection, self.name, self.lease_seconds)
+
+    def _args(self, claimed):
+        return (*claimed, self.lease_seconds, self.max_attempts, self.chunk_size)
+
+    def run_once(self):
+        """Claim one job and run it in this process. Returns ``(job_id, state)``, or None when idle."""
+        claimed = self.claim()
+        if claimed is None:
+            return None
+        with self.app.app_context():
+            try:
+                return claimed[0], run_job(db.session, *self._args(claimed))
+            finally:
+                db.session.remove()
+
+    def run(self, should_stop=lambda: False):
+        if self.processes < 1:
+            while not should_stop():
+                if self.run_once() is None:
+                    time.sleep(self.poll_interval)
+            return
+        with self.app.app_context():
+            db.engine.dispose()
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_init_process, initargs=(self.app,)) as pool:
+            running = set()
+            while not should_stop():
+                while len(running) < self.processes:
+                    claimed = self.claim()
+                    if claimed is None:
+                        break
+                    running.add(pool.submit(_run_in_process, *self._args(claimed)))
+                if not running:
+                    time.sleep(self.poll_interval)
+                    continue
+                done, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        # The job keeps its lease and is picked up again once it expires
+                        self.app.logger.error('Job worker process failed: %s', future.exception())
+
+
+@jobs_cli.command('work')
+@click.option('--processes', type=int, default=None,
+              help='Worker processes (defaults to JOBS_PROCESSES; 0 runs inline).')
+@click.option('--once', is_flag=True, help='Run a single job in this process and exit.')
+def work_command(processes, once):
+    """Run queued background jobs."""
+    # Jobs run against the catalog database, which holds no inventory once sharding is on
+    sharding.refuse('flask jobs work')
+    worker = Worker.from_config(current_app._get_current_object(), processes)
+    if once:
+        claimed = worker.run_once()
+        click.echo(json.dumps({'job_id': claimed[0], 'state': claimed[1]} if claimed else {'job_id': None}))
+        return
+    worker.run()
+
+
+def _chunks(context, total):
+    start = (context.checkpoint or {}).get('next', 0)
+    for offset in range(start, total, context.chunk_size):
+        yield offset, min(offset + context.chunk_size, total)
+
+
+def validate_import(params):
+    adjustments.parse_lines(params.get('lines'), IMPORT_MAX_LINES)
+    return {'lines': params['lines']}
+
+
+@job_kind('inventory_import', validate_import)
+def run_import(context, params):
+    """Apply ``IN``/``OUT`` lines chunk by chunk; a line that cannot be applied is rejected on its own."""
+    lines = params['lines']
+    state = context.checkpoint or {'next': 0, 'applied': 0, 'rejected': 0, 'sample': []}
+    for start, end in _chunks(context, len(lines)):
+        parsed = adjustments.parse_lines(lines[start:end])
+        for retry in range(CHUNK_RETRIES):
+            try:
+                applied, rejected, _ = adjustments.apply_adjustments(context.session, parsed, atomic=False)
+                break
+            except adjustments.ConcurrentUpdateError:
+                context.session.rollback()
+                if retry == CHUNK_RETRIES - 1:
+                    raise
+        sample = state['sample'] + [{'index': start + item['index'], 'error': item['error']} for item in rejected]
+        state = {'next': end, 'applied': state['applied'] + len(applied),
+                 'rejected': state['rejected'] + len(rejected), 'sample': sample[:SAMPLE_SIZE]}
+        context.save(state, end, len(lines))
+    return {'lines': len(lines), 'applied': state['applied'], 'rejected': state['rejected'],
+            'rejected_sample': state['sample']}
+
+
+def _date(params, name):
+    try:
+        return date.fromisoformat(params[name])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def validate_rollup_rebuild(params):
+    since = _date(params, 'since')
+    # Pin the range now so a resumed job rebuilds the same days
+    until = _date(params, 'until') if params.get('until') is not None else datetime.utcnow().date() + timedelta(days=1)
+    if until <= since:
+        raise ValueError('until must be after since')
+    return {'since': since.isoformat(), 'until': until.isoformat()}
+
+
+@job_kind('rollup_rebuild', validate_rollup_rebuild)
+def run_rollup_rebuild(context, params):
+    """Recompute daily movement rollups one day per chunk."""
+    since, until = date.fromisoformat(params['since']), date.fromisoformat(params['until'])
+    days = (until - since).days
+    state = context.checkpoint or {'next': 0, 'rows': 0}
+    for offset in range(state['next'], days):
+        day = since + timedelta(days=offset)
+        rows = rollups.rebuild_rollups(context.session, day, day + timedelta(days=1))
+        state = {'next': offset + 1, 'rows': state['rows'] + rows}
+        context.save(state, offset + 1, days)
+    return {'since': params['since'], 'until': params['until'], 'days': days, 'rows': state['rows']}
+
+
+def _positive_int(params, name, default):
+    value = params.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f'{name} must be a positive integer')
+    return value
+
+
+def validate_ledger_rebuild(params):
+    for name in ('apply', 'include_unanchored'):
+        if not isinstance(params.get(name, False), bool):
+            raise ValueError(f'{name} must be a boolean')
+    return {'apply': params.get('apply', False), 'include_unanchored': params.get('include_unanchored', False),
+            'partitions': _positive_int(params, 'partitions', 16)}
+
+
+REBUILD_TOTALS = ('movements', 'pairs', 'mismatches', 'unanchored', 'corrected')
+
+
+@job_kind('ledger_rebuild', validate_ledger_rebuild)
+def run_ledger_rebuild(context, params):
+    """Verify (and with ``apply`` correct) inventory from the ledger, one product range per chunk.
+
+    Each range commits its own corrections before the checkpoint is saved; a
+    range redone after a crash finds nothing left to correct.
+    """
+    state = context.checkpoint
+    if state is None:
+        ranges = rebuild.product_ranges(context.session.connection(), params['partitions'])
+        state = {'ranges': [list(product_range) for product_range in ranges], 'next': 0, 'movements': 0,
+                 'pairs': 0, 'mismatches': 0, 'unanchored': 0, 'corrected': 0, 'sample': []}
+        context.save(state, 0, len(ranges))
+    database_url = db.engine.url.render_as_string(hide_password=False)
+    archive_dir = current_app.config['LEDGER_ARCHIVE_DIR']
+    for index in range(state['next'], len(state['ranges'])):
+        report = rebuild.rebuild_range(database_url, archive_dir, state['ranges'][index], params['apply'],
+                                       include_unanchored=params.get('include_unanchored', False))
+        state = {**state, 'next': index + 1, 'sample': (state['sample'] + report['sample'])[:SAMPLE_SIZE],
+                 **{key: state[key] + report[key] for key in REBUILD_TOTALS}}
+        context.save(state, index + 1)
+    return {key: state[key] for key in REBUILD_TOTALS + ('sample',)}
+
+
+def validate_recommendations(params):
+    validated = {
+        'window_days': _positive_int(params, 'window_days', recommendations.DEFAULT_WINDOW_DAYS),
+        'lead_time_days': _positive_int(params, 'lead_time_days', recommendations.DEFAULT_LEAD_TIME_DAYS),
+        'z': params.get('z', recommendations.DEFAULT_SERVICE_Z),
+        'min_observed_days': _positive_int(params, 'min_observed_days', recommendations.DEFAULT_MIN_OBSERVED_DAYS),
+        'store_id': params.get('store_id'),
+        'apply': params.get('apply', False),
+    }
+    if isinstance(validated['z'], bool) or not isinstance(validated['z'], (int, float)) or validated['z'] < 0:
+        raise ValueError('z must be a non-negative number')
+    if validated['store_id'] is not None and not isinstance(validated['store_id'], str):
+        raise ValueError('store_id must be a string')
+    if not isinstance(validated['apply'], bool):
+        raise ValueError('apply must be a boolean')
+    return validated
+
+
+@job_kind('recommendations', validate_recommendations)
+def run_recommendations(context, params):
+    """Report (and with ``apply`` write) the reorder points that differ from ``min_stock``."""
+    result = recommendations.recommend(context.session, params['window_days'], params['lead_time_days'],
+                                       params['z'], store_id=params['store_id'],
+                                       min_observed_days=params.get('min_observed_days',
+                                                                    recommendations.DEFAULT_MIN_OBSERVED_DAYS))
+    changed = (result['recommended'] != result['min_stock']).nonzero()[0]
+    if params['apply']:
+        recommendations.apply_recommendations(context.session, result)
+    return {
+        'pairs': len(result['inventory_id']),
+        'changed': len(changed),
+        'applied': params['apply'],
+        'sample': [{
+            'inventory_id': result['inventory_id'][index],
+            'product_id': result['product_id'][index],
+            'store_id': result['store_id'][index],
+            'min_stock': int(result['min_stock'][index]),
+            'recommended': int(result['recommended'][index]),
+            'daily_demand': round(float(result['daily_demand'][index]), 3),
+        } for index in changed[:SAMPLE_SIZE]],
+    }
+
+
+def _count_lines(counts):
+    return [json.dumps(count) for count in counts]
+
+
+def validate_reconcile(params):
+    store_id = params.get('store_id')
+    if not isinstance(store_id, str) or not store_id:
+        raise ValueError('store_id must be a non-empty string')
+    counts = params.get('counts')
+    if not isinstance(counts, list) or len(counts) > IMPORT_MAX_LINES:
+        raise ValueError(f'counts must be a list of at most {IMPORT_MAX_LINES} {{"sku", "quantity"}} objects')
+    for _ in reconcile.parse_counts(_count_lines(counts), ndjson=True):
+        pass
+    if not isinstance(params.get('apply', False), bool):
+        raise ValueError('apply must be a boolean')
+    return {'store_id': store_id, 'counts': counts, 'apply': params.get('apply', False)}
+
+
+@job_kind('reconcile', validate_reconcile)
+def run_reconcile(context, params):
+    """Reconcile a store's physical count and, with ``apply``, correct its stock.
+
+    The corrections commit together with the result, so a job redone after a
+    crash reconciles from scratch.
+    """
+    out = reconcile.spool()
+    try:
+        counts = reconcile.parse_counts(_count_lines(params['counts']), ndjson=True)
+        summary = reconcile.reconcile(context.session, params['store_id'], counts, out, params['apply'])
+        out.seek(0)
+        sample = [json.loads(line) for _, line in zip(range(SAMPLE_SIZE), out)]
+    finally:
+        out.close()
+    return {**summary, 'sample': sample}
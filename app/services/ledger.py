@@ -0,0 +1,458 @@
+"""Storage management for the movement ledger.
+
+On PostgreSQL the ``movement`` table is range-partitioned by month, with one
+``movement_YYYY_MM`` partition per period plus a default partition for rows
+no period covers; those are moved into partitions of their own when the
+partitions are ensured or rotated. SQLite has no declarative partitioning, so
+the ``movement`` table acts as the hot period and older rows are rotated into
+``movement_YYYY_MM`` tables of the same shape.
+
+Cold periods can be archived to gzip-compressed, column-oriented JSON files in
+``LEDGER_ARCHIVE_DIR``, in a subdirectory per shard when sharding is on.
+``iter_movements`` reads archives, cold periods and the hot table in
+chronological order, so callers never need to know where a row currently
+lives.
+"""
+import gzip
+import json
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Column, Index, MetaData, Table, event, inspect, or_, select, text
+
+from app.main import db
+from app.models.movement import Movement
+from app.utils import sharding
+from app.utils.params import parse_timestamp
+from app.utils.sql import SHARD_KEY
+
+COLUMNS = ('id', 'product_id', 'source_store_id', 'target_store_id', 'quantity', 'timestamp', 'type')
+PERIOD_RE = re.compile(r'^movement_(\d{4})_(\d{2})$')
+ARCHIVE_RE = re.compile(r'^movement_(\d{4})_(\d{2})\.json\.gz$')
+STAGED_SUFFIX = '.tmp'
+
+ledger_cli = AppGroup('ledger', help='Movement ledger maintenance.')
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def period_name(month):
+    return f'movement_{month.year:04d}_{month.month:02d}'
+
+
+def _period_month(name, pattern=PERIOD_RE):
+    match = pattern.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+
+def _period_table(name):
+    """A Table bound to a period's storage with the same column types as Movement."""
+    columns = [Column(c.name, c.type, primary_key=c.primary_key) for c in Movement.__table__.columns]
+    return Table(name, MetaData(), *columns, Index(f'ix_{name}_timestamp', 'timestamp'))
+
+
+def _is_postgres(connection):
+    return connection.dialect.name == 'postgresql'
+
+
+def _month_bounds(month):
+    return f"'{month:%Y-%m-%d}'", f"'{add_months(month, 1):%Y-%m-%d}'"
+
+
+def _create_partition(connection, month):
+    """Create ``month``'s partition, moving its rows out of the default partition.
+
+    PostgreSQL refuses to add a partition while the default one holds rows in
+    its range, so the default partition is detached around the move. Returns
+    the number of rows moved.
+    """
+    name = period_name(month)
+    start, end = _month_bounds(month)
+    in_month = f'timestamp >= {start} AND timestamp < {end}'
+    create = f'CREATE TABLE {name} PARTITION OF movement FOR VALUES FROM ({start}) TO ({end})'
+    if not connection.execute(text(f'SELECT EXISTS (SELECT 1 FROM movement_default WHERE {in_month})')).scalar():
+        connection.execute(text(create))
+        return 0
+    columns = ', '.join(COLUMNS)
+    connection.execute(text('ALTER TABLE movement DETACH PARTITION movement_default'))
+    connection.execute(text(create))
+    moved = connection.execute(text(
+        f'WITH moved AS (DELETE FROM movement_default WHERE {in_month} RETURNING {columns}) '
+        f'INSERT INTO movement ({columns}) SELECT {columns} FROM moved'
+    )).rowcount
+    connection.execute(text('ALTER TABLE movement ATTACH PARTITION movement_default DEFAULT'))
+    return moved
+
+
+def _partition_exists(connection, name):
+    return connection.execute(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': name}).scalar()
+
+
+def _stranded_months(connection):
+    """Months with rows in the default partition, which only holds rows no monthly partition covers."""
+    return connection.execute(text(
+        "SELECT DISTINCT date_trunc('month', timestamp) FROM movement_default ORDER BY 1"
+    )).scalars().all()
+
+
+def ensure_partitions(connection, months_ahead=2):
+    """Create the default partition and monthly partitions up to ``months_ahead``.
+
+    Returns the names of the monthly partitions that were ensured. This is a
+    no-op on databases without declarative partitioning.
+    """
+    if not _is_postgres(connection):
+        return []
+    connection.execute(text('CREATE TABLE IF NOT EXISTS movement_default PARTITION OF movement DEFAULT'))
+    current = month_start(datetime.utcnow())
+    names = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        name = period_name(month)
+        if not _partition_exists(connection, name):
+            _create_partition(connection, month)
+        names.append(name)
+    return names
+
+
+def convert_to_partitioned(connection):
+    """Rebuild an unpartitioned PostgreSQL ``movement`` table as the partitioned one.
+
+    For databases created before the ledger was partitioned. Every month with
+    rows gets its partition. Returns the number of rows copied, or None when
+    the table is already partitioned or the database is not PostgreSQL.
+    """
+    if not _is_postgres(connection):
+        return None
+    kind = connection.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('movement')")).scalar()
+    if kind != 'r':
+        return None
+    connection.execute(text('LOCK TABLE movement IN ACCESS EXCLUSIVE MODE'))
+    connection.execute(text('ALTER TABLE movement RENAME TO movement_unpartitioned'))
+    # Index names are schema-wide; free them for the new table's indexes
+    for index in connection.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'movement_unpartitioned'"
+    )).scalars().all():
+        connection.execute(text(f'ALTER INDEX {index} RENAME TO {index}_unpartitioned'))
+    Movement.__table__.create(connection, checkfirst=True)
+    months = connection.execute(text(
+        "SELECT DISTINCT date_trunc('month', timestamp) FROM movement_unpartitioned ORDER BY 1"
+    )).scalars().all()
+    for month in months:
+        if not _partition_exists(connection, period_name(month)):
+            _create_partition(connection, month)
+    columns = ', '.join(COLUMNS)
+    copied = connection.execute(text(
+        f'INSERT INTO movement ({columns}) SELECT {columns} FROM movement_unpartitioned'
+    )).rowcount
+    connection.execute(text('DROP TABLE movement_unpartitioned'))
+    return copied
+
+
+@event.listens_for(Movement.__table__, 'after_create')
+def _create_initial_partitions(target, connection, **kw):
+    ensure_partitions(connection)
+
+
+def cold_periods(connection):
+    """Return the months stored outside the hot table, oldest first."""
+    if _is_postgres(connection):
+        names = connection.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = 'movement'"
+        )).scalars().all()
+        current = month_start(datetime.utcnow())
+        months = [_period_month(name) for name in names]
+        return sorted(month for month in months if month and month < current)
+    names = inspect(connection).get_table_names()
+    return sorted(month for month in (_period_month(name) for name in names) if month)
+
+
+def hot_cutoff(hot_months=1):
+    """Start of the oldest month kept in the hot table."""
+    return add_months(month_start(datetime.utcnow()), -(hot_months - 1))
+
+
+def rotate(connection, cutoff):
+    """Move rows older than ``cutoff`` out of the SQLite ``movement`` table.
+
+    PostgreSQL routes rows to their monthly partition on insert; there, only
+    rows that landed in the default partition, for months without a partition
+    of their own, are moved into new partitions so they can be archived.
+    Returns the number of rows moved.
+    """
+    if _is_postgres(connection):
+        return sum(_create_partition(connection, month) for month in _stranded_months(connection))
+    cutoff = month_start(cutoff)
+    movement = Movement.__table__
+    oldest = connection.execute(
+        select(db.func.min(movement.c.timestamp)).where(movement.c.timestamp < cutoff)
+    ).scalar()
+    moved = 0
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        end = add_months(month, 1)
+        in_period = (movement.c.timestamp >= month) & (movement.c.timestamp < end)
+        period = _period_table(period_name(month))
+        period.create(connection, checkfirst=True)
+        connection.execute(period.insert().from_select(
+            COLUMNS, select(*(movement.c[name] for name in COLUMNS)).where(in_period)
+        ))
+        moved += connection.execute(movement.delete().where(in_period)).rowcount
+        month = end
+    return moved
+
+
+def archive_root(connection, archive_dir=None):
+    """``archive_dir`` (default ``LEDGER_ARCHIVE_DIR``), or its subdirectory for the shard of ``connection``."""
+    archive_dir = archive_dir or current_app.config['LEDGER_ARCHIVE_DIR']
+    key = connection.get_execution_options().get(SHARD_KEY)
+    return os.path.join(archive_dir, key) if key else archive_dir
+
+
+def _archive_path(archive_dir, month):
+    return os.path.join(archive_dir, f'{period_name(month)}.json.gz')
+
+
+def read_archive(path):
+    """Return the column arrays stored in an archive file."""
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        return json.load(handle)['columns']
+
+
+def stage_archive(archive_dir, month, rows):
+    """Write ``month``'s archive, merged with any existing one, next to it under a staging name.
+
+    Rows already in the archive are replaced by those with the same id, so
+    archiving a period again never duplicates it. Returns the staged path and
+    the number of rows taken from ``rows``; ``_publish_archive`` moves the file
+    in place.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = _archive_path(archive_dir, month)
+    columns = read_archive(path) if os.path.exists(path) else {name: [] for name in COLUMNS}
+    merged = {values[0]: values for values in zip(*(columns[name] for name in COLUMNS))}
+    count = 0
+    for row in rows:
+        values = []
+        for name in COLUMNS:
+            value = row[name]
+            if name == 'timestamp':
+                value = value.isoformat()
+            elif name == 'type':
+                value = value.value
+            values.append(value)
+        merged[row['id']] = tuple(values)
+        count += 1
+    columns = {name: [values[index] for values in merged.values()] for index, name in enumerate(COLUMNS)}
+    staged = path + STAGED_SUFFIX
+    with gzip.open(staged, 'wt', encoding='utf-8') as handle:
+        json.dump({'period': f'{month:%Y-%m}', 'rows': len(merged), 'columns': columns}, handle)
+    return staged, count
+
+
+def _publish_archive(staged):
+    path = staged[:-len(STAGED_SUFFIX)]
+    os.replace(staged, path)
+    return path
+
+
+def _settle_staged(connection, archive_dir):
+    """Publish archives staged by a run that stopped after dropping their period; discard the rest."""
+    if not os.path.isdir(archive_dir):
+        return
+    cold = set(cold_periods(connection))
+    for name in os.listdir(archive_dir):
+        if not name.endswith(STAGED_SUFFIX):
+            continue
+        staged = os.path.join(archive_dir, name)
+        if _period_month(name[:-len(STAGED_SUFFIX)], ARCHIVE_RE) in cold:
+            os.remove(staged)
+        else:
+            _publish_archive(staged)
+
+
+def archive_periods(connection, before, archive_dir):
+    """Archive every cold period older than ``before`` and drop it from the database.
+
+    ``connection`` must not be in a transaction. Each period is dropped in a
+    transaction of its own, and its archive is only put in place once the drop
+    has committed, so a failed run never leaves rows both in a period and in
+    its archive.
+    """
+    before = min(month_start(before), month_start(datetime.utcnow()))
+    with connection.begin():
+        rotate(connection, before)
+        _settle_staged(connection, archive_dir)
+        months = [month for month in cold_periods(connection) if month < before]
+    archived = []
+    for month in months:
+        name = period_name(month)
+        period = _period_table(name)
+        with connection.begin():
+            rows = connection.execute(
+                select(period).order_by(period.c.timestamp).execution_options(yield_per=1000)
+            ).mappings()
+            staged, count = stage_archive(archive_dir, month, rows)
+            if _is_postgres(connection):
+                connection.execute(text(f'ALTER TABLE movement DETACH PARTITION {name}'))
+            connection.execute(text(f'DROP TABLE {name}'))
+        archived.append({'period': f'{month:%Y-%m}', 'rows': count, 'path': _publish_archive(staged)})
+    return archived
+
+
+def archived_periods(archive_dir):
+    if not os.path.isdir(archive_dir):
+        return []
+    months = (_period_month(name, ARCHIVE_RE) for name in os.listdir(archive_dir))
+    return sorted(month for month in months if month)
+
+
+def _overlaps(month, since, until):
+    if since is not None and add_months(month, 1) <= since:
+        return False
+    if until is not None and month >= until:
+        return False
+    return True
+
+
+class MovementFilter(namedtuple('MovementFilter', 'product_id store_id since until product_range')):
+    """Row filter applied uniformly to archives, cold periods and the hot table.
+
+    ``product_range`` is an inclusive ``(lowest, highest)`` pair of product ids.
+    """
+
+    def matches(self, row):
+        if self.product_id is not None and row['product_id'] != self.product_id:
+            return False
+        if self.product_range is not None and not self.product_range[0] <= row['product_id'] <= self.product_range[1]:
+            return False
+        if self.store_id is not None and self.store_id not in (row['source_store_id'], row['target_store_id']):
+            return False
+        if self.since is not None and row['timestamp'] < self.since:
+            return False
+        if self.until is not None and row['timestamp'] >= self.until:
+            return False
+        return True
+
+    def apply(self, query, table):
+        if self.product_id is not None:
+            query = query.where(table.c.product_id == self.product_id)
+        if self.product_range is not None:
+            query = query.where(table.c.product_id.between(*self.product_range))
+        if self.store_id is not None:
+            query = query.where(or_(table.c.source_store_id == self.store_id,
+                                    table.c.target_store_id == self.store_id))
+        if self.since is not None:
+            query = query.where(table.c.timestamp >= self.since)
+        if self.until is not None:
+            query = query.where(table.c.timestamp < self.until)
+        return query
+
+
+def _iter_archive(path, movement_filter):
+    columns = read_archive(path)
+    rows = []
+    for values in zip(*(columns[name] for name in COLUMNS)):
+        row = dict(zip(COLUMNS, values))
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        if movement_filter.matches(row):
+            rows.append(row)
+    rows.sort(key=lambda row: row['timestamp'])
+    return rows
+
+
+def _table_query(table, movement_filter, batch_size):
+    query = movement_filter.apply(select(*(table.c[name] for name in COLUMNS)), table)
+    return query.order_by(table.c.timestamp).execution_options(yield_per=batch_size)
+
+
+def iter_movements(connection, product_id=None, store_id=None, since=None, until=None,
+                   product_range=None, archive_dir=None, batch_size=1000):
+    """Yield movements as dicts in chronological order from every storage tier.
+
+    ``timestamp`` is a naive UTC datetime and ``type`` the MovementType value.
+    Archives and cold periods are only opened when they overlap ``since``/``until``.
+    Database rows are streamed with a server-side cursor in ``batch_size`` chunks.
+    """
+    if archive_dir is None:
+        archive_dir = archive_root(connection)
+    movement_filter = MovementFilter(product_id, store_id, since, until, product_range)
+    for month in archived_periods(archive_dir):
+        if _overlaps(month, since, until):
+            yield from _iter_archive(_archive_path(archive_dir, month), movement_filter)
+
+    tables = []
+    if not _is_postgres(connection):
+        tables = [_period_table(period_name(month)) for month in cold_periods(connection)
+                  if _overlaps(month, since, until)]
+    tables.append(Movement.__table__)
+    for table in tables:
+        for row in connection.execute(_table_query(table, movement_filter, batch_size)).mappings():
+            row = dict(row)
+            row['type'] = row['type'].value
+            yield row
+
+
+def serialize(row):
+    return {**row, 'timestamp': row['timestamp'].isoformat()}
+
+
+def _month_option(value):
+    return month_start(parse_timestamp(value + '-01' if len(value) == 7 else value))
+
+
+@ledger_cli.command('partitions')
+@click.option('--months-ahead', default=2, show_default=True, help='Future monthly partitions to create.')
+def partitions_command(months_ahead):
+    """Create upcoming monthly partitions (PostgreSQL only)."""
+    for key in sharding.each_shard():
+        with db.session.get_bind().begin() as connection:
+            names = ensure_partitions(connection, months_ahead)
+        click.echo(json.dumps(sharding.tagged(key, {'partitions': names})))
+
+
+@ledger_cli.command('convert')
+def convert_command():
+    """Rebuild a movement table created before partitioning as a partitioned table (PostgreSQL only)."""
+    for key in sharding.each_shard():
+        with db.session.get_bind().begin() as connection:
+            copied = convert_to_partitioned(connection)
+        click.echo(json.dumps(sharding.tagged(key, {'converted': copied is not None, 'rows': copied or 0})))
+
+
+@ledger_cli.command('rotate')
+@click.option('--hot-months', default=1, show_default=True, help='Months kept in the hot table.')
+def rotate_command(hot_months):
+    """Move old movements into per-period tables (SQLite), or out of the default partition (PostgreSQL)."""
+    for key in sharding.each_shard():
+        with db.session.get_bind().begin() as connection:
+            moved = rotate(connection, hot_cutoff(hot_months))
+        click.echo(json.dumps(sharding.tagged(key, {'moved': moved})))
+
+
+@ledger_cli.command('archive')
+@click.option('--before', required=True, help='Archive periods older than this month (YYYY-MM).')
+@click.option('--archive-dir', default=None, help='Defaults to LEDGER_ARCHIVE_DIR.')
+def archive_command(before, archive_dir):
+    """Archive cold periods to compressed files and drop them from the database."""
+    for key in sharding.each_shard():
+        with db.session.get_bind().connect() as connection:
+            archived = archive_periods(connection, _month_option(before), archive_root(connection, archive_dir))
+        click.echo(json.dumps(sharding.tagged(key, {'archived': archived})))
@@ -0,0 +1,303 @@
+"""Low-stock notifications through a transactional outbox.
+
+A row *crosses* the threshold when it enters (``low``) or leaves
+(``recovered``) the state ``quantity <= min_stock`` that ``/alerts`` reports.
+ORM writes to ``Inventory`` are checked by a ``before_flush`` hook; set-based
+writers compute the crossings of the rows they touch and pass them to
+``capture``. Crossings are written to ``low_stock_outbox`` in the same
+transaction as the stock change, so a notification exists if and only if the
+change committed.
+
+The outbox keeps one undelivered row per (product, store): a repeat crossing
+replaces the state and ``event_id`` of the pending row and bumps
+``occurrences``. The dispatcher claims due rows in batches, posts them to every
+configured webhook and deletes them once delivered. A failed batch is retried
+with exponential backoff; a receiver answering 429 or 503 pauses the dispatcher
+for its ``Retry-After``. Delivery is at least once; receivers can deduplicate
+on ``event_id``.
+"""
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, delete, event, inspect, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.notification import LowStockOutbox
+from app.utils import sharding
+from app.utils.sql import dialect_insert
+
+notifications_cli = AppGroup('notifications', help='Low-stock notification delivery.')
+
+LOW = 'low'
+RECOVERED = 'recovered'
+
+_PENDING = 'pending_low_stock'
+
+
+def is_low(quantity, min_stock):
+    return quantity <= min_stock
+
+
+def crossing(inventory_id, product_id, store_id, old_quantity, old_min_stock, quantity, min_stock):
+    """Return the event for a row whose low-stock state changed, else None.
+
+    ``old_quantity`` is None for a new row, which only notifies when created low.
+    """
+    low = is_low(quantity, min_stock)
+    if old_quantity is None:
+        if not low:
+            return None
+    elif is_low(old_quantity, old_min_stock) == low:
+        return None
+    return {'inventory_id': inventory_id, 'product_id': product_id, 'store_id': store_id,
+            'kind': LOW if low else RECOVERED, 'quantity': quantity, 'min_stock': min_stock}
+
+
+def capture(session, events):
+    """Queue crossings to be written to the outbox when ``session`` commits."""
+    events = [item for item in events if item is not None]
+    if events:
+        session.info.setdefault(_PENDING, []).extend(events)
+
+
+def enqueue(connection, events):
+    """Insert events into the outbox, coalescing with undelivered rows of the same pair."""
+    if not events:
+        return
+    now = datetime.utcnow()
+    # Only the last crossing of a pair within one transaction matters
+    latest = {(item['product_id'], item['store_id']): item for item in events}
+    table = LowStockOutbox.__table__
+    statement = dialect_insert(connection, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['product_id', 'store_id'],
+        set_={
+            'event_id': statement.excluded.event_id,
+            'inventory_id': statement.excluded.inventory_id,
+            'kind': statement.excluded.kind,
+            'quantity': statement.excluded.quantity,
+            'min_stock': statement.excluded.min_stock,
+            'detected_at': statement.excluded.detected_at,
+            'occurrences': table.c.occurrences + 1,
+        }
+    )
+    connection.execute(statement, [{
+        **item, 'event_id': str(uuid.uuid4()), 'occurrences': 1, 'first_detected_at': now,
+        'detected_at': now, 'attempts': 0, 'next_attempt_at': now,
+    } for item in latest.values()])
+
+
+def _previous(obj, name):
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, name)
+
+
+@event.listens_for(Session, 'before_flush')
+def _capture_orm_crossings(session, flush_context, instances):
+    # Column defaults only apply on INSERT, so unset levels count as zero
+    events = [crossing(obj.id, obj.product_id, obj.store_id, None, None, obj.quantity or 0, obj.min_stock or 0)
+              for obj in session.new if isinstance(obj, Inventory)]
+    events += [crossing(obj.id, obj.product_id, obj.store_id, _previous(obj, 'quantity'),
+                        _previous(obj, 'min_stock'), obj.quantity, obj.min_stock)
+               for obj in session.dirty if isinstance(obj, Inventory) and session.is_modified(obj)]
+    capture(session, events)
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_pending_crossings(session):
+    session.flush()
+    events = session.info.pop(_PENDING, None)
+    if events:
+        enqueue(session.connection(), events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_crossings(session):
+    session.info.pop(_PENDING, None)
+
+
+def backoff(attempts, base, maximum):
+    """Exponential delay with jitter for the ``attempts``-th failure."""
+    delay = min(maximum, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def payload(row):
+    return {
+        'event_id': row['event_id'],
+        'kind': row['kind'],
+        'inventory_id': row['inventory_id'],
+        'product_id': row['product_id'],
+        'store_id': row['store_id'],
+        'quantity': row['quantity'],
+        'min_stock': row['min_stock'],
+        'occurrences': row['occurrences'],
+        'first_detected_at': row['first_detected_at'].isoformat(),
+        'detected_at': row['detected_at'].isoformat(),
+    }
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def post_batch(url, events, timeout):
+    """POST ``{"events": [...]}`` to ``url``; raises DeliveryError unless it answers 2xx."""
+    body = json.dumps({'events': events}).encode('utf-8')
+    request = urllib.request.Request(url, data=body, method='POST', headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        retry_after = _retry_after(e.headers.get('Retry-After')) if e.code in (429, 503) else None
+        raise DeliveryError(f'{url} answered {e.code}', retry_after)
+    except (urllib.error.URLError, OSError) as e:
+        raise DeliveryError(f'{url} unreachable: {e}')
+
+
+class Dispatcher:
+    """Claims due outbox rows in batches and delivers them to the webhooks."""
+
+    def __init__(self, engine, urls, batch_size=100, poll_interval=2.0, timeout=5.0,
+                 backoff_base=1.0, backoff_max=300.0, lease_seconds=60.0):
+        self.engine = engine
+        self.urls = list(urls)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = timedelta(seconds=lease_seconds)
+        self.paused_until = 0.0
+
+    @classmethod
+    def from_config(cls, engine, config):
+        urls = [url.strip() for url in config['NOTIFY_WEBHOOK_URLS'].split(',') if url.strip()]
+        return cls(engine, urls, config['NOTIFY_BATCH_SIZE'], config['NOTIFY_POLL_INTERVAL'],
+                   config['NOTIFY_TIMEOUT'], config['NOTIFY_BACKOFF_BASE'], config['NOTIFY_BACKOFF_MAX'],
+                   config['NOTIFY_LEASE_SECONDS'])
+
+    def claim(self):
+        """Lease a batch of due rows so other dispatchers skip them while they are delivered."""
+        table = LowStockOutbox.__table__
+        now = datetime.utcnow()
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                select(table).where(table.c.next_attempt_at <= now)
+                .order_by(table.c.next_attempt_at).limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).mappings().all()
+            if rows:
+                connection.execute(
+                    update(table).where(tuple_(table.c.product_id, table.c.store_id).in_(
+                        [(row['product_id'], row['store_id']) for row in rows]
+                    )).values(next_attempt_at=now + self.lease)
+                )
+        return rows
+
+    def acknowledge(self, rows):
+        """Delete delivered rows unless a newer crossing replaced them meanwhile."""
+        table = LowStockOutbox.__table__
+        with self.engine.begin() as connection:
+            connection.execute(
+                delete(table).where(and_(table.c.product_id == bindparam('b_product_id'),
+                                         table.c.store_id == bindparam('b_store_id'),
+                                         table.c.event_id == bindparam('b_event_id'))),
+                [{'b_product_id': row['product_id'], 'b_store_id': row['store_id'], 'b_event_id': row['event_id']}
+                 for row in rows]
+            )
+            # Replaced rows carry a new event and are due again right away
+            connection.execute(
+                update(table).where(tuple_(table.c.product_id, table.c.store_id).in_(
+                    [(row['product_id'], row['store_id']) for row in rows]
+                )).values(next_attempt_at=datetime.utcnow(), attempts=0)
+            )
+
+    def reschedule(self, rows, error, retry_after=None):
+        table = LowStockOutbox.__table__
+        now = datetime.utcnow()
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(table).where(table.c.product_id == bindparam('b_product_id'),
+                                    table.c.store_id == bindparam('b_store_id'))
+                .values(attempts=table.c.attempts + 1, last_error=error, next_attempt_at=bindparam('b_next')),
+                [{'b_product_id': row['product_id'], 'b_store_id': row['store_id'],
+                  'b_next': now + timedelta(seconds=retry_after if retry_after is not None else backoff(
+                      row['attempts'] + 1, self.backoff_base, self.backoff_max))}
+                 for row in rows]
+            )
+
+    def run_once(self):
+        """Deliver one batch. Returns the number of rows delivered."""
+        if time.monotonic() < self.paused_until:
+            return 0
+        rows = self.claim()
+        if not rows:
+            return 0
+        events = [payload(row) for row in rows]
+        try:
+            for url in self.urls:
+                post_batch(url, events, self.timeout)
+        except DeliveryError as e:
+            current_app.logger.warning('Low-stock delivery failed: %s', e)
+            if e.retry_after is not None:
+                # The receiver asked us to slow down: hold every batch, not just this one
+                self.paused_until = time.monotonic() + e.retry_after
+            self.reschedule(rows, str(e), e.retry_after)
+            return 0
+        self.acknowledge(rows)
+        return len(rows)
+
+    def run(self, should_stop=lambda: False):
+        while not should_stop():
+            delivered = self.run_once()
+            if delivered < self.batch_size:
+                time.sleep(max(self.poll_interval, self.paused_until - time.monotonic()))
+
+
+@notifications_cli.command('dispatch')
+@click.option('--once', is_flag=True, help='Deliver a single batch and exit.')
+def dispatch_command(once):
+    """Deliver queued low-stock notifications to the configured webhooks, from every shard's outbox."""
+    dispatchers = {key: Dispatcher.from_config(db.session.get_bind(), current_app.config)
+                   for key in sharding.each_shard()}
+    if not any(dispatcher.urls for dispatcher in dispatchers.values()):
+        raise click.UsageError('NOTIFY_WEBHOOK_URLS is not set')
+    if once:
+        for key, dispatcher in dispatchers.items():
+            click.echo(json.dumps(sharding.tagged(key, {'delivered': dispatcher.run_once()})))
+        return
+    if len(dispatchers) == 1:
+        next(iter(dispatchers.values())).run()
+        return
+    app = current_app._get_current_object()
+
+    def serve(dispatcher):
+        with app.app_context():
+            dispatcher.run()
+
+    # One dispatcher per shard outbox, each with its own backoff
+    with ThreadPoolExecutor(max_workers=len(dispatchers)) as pool:
+        list(pool.map(serve, dispatchers.values()))
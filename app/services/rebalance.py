@@ -0,0 +1,143 @@
+"""Plan (and optionally apply) transfers that resolve low-stock alerts.
+
+For every product with a short row, surplus above ``min_stock`` in other
+stores is moved to the short stores. Each shortage is first served by the
+single donor whose surplus covers it most tightly; only when no donor can cover
+it alone is it split across the largest surpluses. This greedy matching keeps
+the number of transfers close to the minimum without a full flow solver.
+"""
+import uuid
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import bindparam, insert, select, tuple_, update
+
+from app.models.inventory import Inventory
+from app.models.movement import Movement, MovementType
+from app.services import changes, counters, notifications, rollups, stores
+
+FETCH_SIZE = 10000
+
+
+def load_positions(session, product_ids=None, store_ids=None, lock=False):
+    """Stream inventory rows of products that have at least one short row.
+
+    Rows come back ordered by (product_id, store_id), which is also the lock
+    order when ``lock`` is set.
+    """
+    quantity = counters.current_quantity()
+    short = select(Inventory.product_id).where(quantity < Inventory.min_stock)
+    query = select(Inventory.product_id, Inventory.store_id, quantity, Inventory.min_stock)
+    if product_ids:
+        short = short.where(Inventory.product_id.in_(product_ids))
+    if store_ids:
+        short = short.where(Inventory.store_id.in_(store_ids))
+        query = query.where(Inventory.store_id.in_(store_ids))
+    query = query.where(Inventory.product_id.in_(short.distinct())).order_by(
+        Inventory.product_id, Inventory.store_id
+    )
+    if lock:
+        query = query.with_for_update()
+    return session.execute(query.execution_options(yield_per=FETCH_SIZE))
+
+
+def plan_product(product_id, rows):
+    """Match one product's surpluses to its shortages.
+
+    Returns ``(transfers, unresolved)`` where unresolved lists the shortages
+    that the available surplus could not cover.
+    """
+    surpluses = []  # sorted (surplus, store_id)
+    shortages = []
+    for _, store_id, quantity, min_stock in rows:
+        if quantity > min_stock:
+            insort(surpluses, (quantity - min_stock, store_id))
+        elif quantity < min_stock:
+            shortages.append((min_stock - quantity, store_id))
+
+    transfers, unresolved = [], []
+    for missing, target in sorted(shortages, reverse=True):
+        while missing and surpluses:
+            # Tightest single donor that covers the whole shortage, else the largest one
+            index = bisect_left(surpluses, (missing, ''))
+            if index == len(surpluses):
+                index -= 1
+            available, source = surpluses.pop(index)
+            quantity = min(available, missing)
+            transfers.append({'product_id': product_id, 'source_store_id': source,
+                              'target_store_id': target, 'quantity': quantity})
+            missing -= quantity
+            if available > quantity:
+                insort(surpluses, (available - quantity, source))
+        if missing:
+            unresolved.append({'product_id': product_id, 'store_id': target, 'missing_quantity': missing})
+    return transfers, unresolved
+
+
+def plan(session, product_ids=None, store_ids=None, lock=False):
+    transfers, unresolved = [], []
+    rows = load_positions(session, product_ids, store_ids, lock)
+    for product_id, product_rows in groupby(rows, key=lambda row: row[0]):
+        product_transfers, product_unresolved = plan_product(product_id, product_rows)
+        transfers.extend(product_transfers)
+        unresolved.extend(product_unresolved)
+    return transfers, unresolved
+
+
+def apply_plan(session, transfers):
+    """Apply planned transfers with set-based updates and bulk movement inserts.
+
+    The caller must have locked the affected rows (``plan(..., lock=True)``) in
+    the same transaction, so the planned quantities are still available. Slots
+    of hot rows are not locked, so a hot source drained meanwhile raises
+    ``counters.InsufficientStock``.
+    """
+    if not transfers:
+        return
+    now = datetime.utcnow()
+    deltas = defaultdict(int)
+    for transfer in transfers:
+        deltas[(transfer['product_id'], transfer['source_store_id'])] -= transfer['quantity']
+        deltas[(transfer['product_id'], transfer['target_store_id'])] += transfer['quantity']
+
+    hot = counters.hot_rows(session, list(deltas))
+    rows = session.execute(
+        select(Inventory.id, Inventory.product_id, Inventory.store_id, Inventory.quantity, Inventory.min_stock)
+        .where(tuple_(Inventory.product_id, Inventory.store_id).in_([key for key in deltas if key not in hot]))
+    ).all()
+
+    table = Inventory.__table__
+    updates = [{'b_product_id': product_id, 'b_store_id': store_id, 'b_delta': delta}
+               for (product_id, store_id), delta in sorted(deltas.items()) if delta and (product_id, store_id) not in hot]
+    if updates:
+        session.execute(
+            update(table)
+            .where(table.c.product_id == bindparam('b_product_id'), table.c.store_id == bindparam('b_store_id'))
+            .values(quantity=table.c.quantity + bindparam('b_delta'), updated_at=now),
+            updates
+        )
+    for key in sorted(hot):
+        counters.adjust(session, hot[key], *key, deltas[key])
+
+    movements = [{
+        'id': str(uuid.uuid4()),
+        **transfer,
+        'timestamp': now,
+        'type': MovementType.TRANSFER,
+    } for transfer in transfers]
+    session.execute(insert(Movement.__table__), movements)
+    rollups.record_movements(session.connection(), movements)
+
+    changes.capture(session, [changes.inventory_record(*row[:3]) for row in rows])
+    notifications.capture(session, [
+        notifications.crossing(inventory_id, product_id, store_id, quantity, min_stock,
+                               quantity + deltas[(product_id, store_id)], min_stock)
+        for inventory_id, product_id, store_id, quantity, min_stock in rows
+    ])
+    stores.capture(session, [
+        stores.row_delta(product_id, store_id, quantity, min_stock,
+                         quantity + deltas[(product_id, store_id)], min_stock)
+        for _, product_id, store_id, quantity, min_stock in rows
+    ])
@@ -0,0 +1,256 @@
+"""Rebuild or verify ``Inventory.quantity`` from the movement ledger.
+
+Product ids are split into contiguous ranges and each range is handled by a
+worker process with its own database engine. A worker streams the range's
+movements through a server-side cursor, folds them into expected quantities,
+compares them with the stored inventory rows and, when asked to, writes the
+corrections back with a single executemany per statement.
+
+The ledger and the inventory are read in one snapshot and corrected by
+deltas, so writes that commit meanwhile are kept. Rows whose opening stock
+was never recorded as a movement, such as seeded ones, are only reported
+unless ``include_unanchored`` is set: their ledger sum is not their quantity.
+"""
+import json
+import multiprocessing
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import click
+from sqlalchemy import bindparam, create_engine, delete, insert, select, tuple_, update
+from sqlalchemy.pool import NullPool
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.inventory_slot import InventorySlot
+from app.models.product import Product
+from app.services import changes, counters, ledger, stores
+from app.services.checkpoints import movement_delta
+from app.services.ledger import ledger_cli
+from app.utils import sharding
+
+MISMATCH_SAMPLE = 100
+
+# A pair's opening movement and its inventory row are written by one request
+OPENING_TOLERANCE = timedelta(seconds=5)
+
+
+def product_ranges(connection, partitions):
+    """Split product ids into at most ``partitions`` contiguous, inclusive ranges."""
+    bucket = db.func.ntile(partitions).over(order_by=Product.id).label('bucket')
+    buckets = select(Product.id, bucket).subquery()
+    query = select(db.func.min(buckets.c.id), db.func.max(buckets.c.id)).group_by(buckets.c.bucket).order_by(
+        buckets.c.bucket
+    )
+    return [tuple(row) for row in connection.execute(query)]
+
+
+def _snapshot(engine):
+    """A connection whose transaction reads one snapshot of the database."""
+    connection = engine.connect()
+    if engine.dialect.name == 'postgresql':
+        connection.execution_options(isolation_level='REPEATABLE READ')
+    return connection
+
+
+def is_anchored(opening, created_at, wanted):
+    """Whether the ledger holds a pair's opening stock, so its sum is the pair's quantity.
+
+    ``opening`` is the pair's first movement as ``(timestamp, delta)``. It must
+    credit the pair no later than the row's creation (within
+    ``OPENING_TOLERANCE``): rows stocked without a movement, such as seeded
+    ones, have no ledger entry for what they started with.
+    """
+    if opening is None or wanted < 0:
+        return False
+    timestamp, delta = opening
+    return delta > 0 and (created_at is None or timestamp <= created_at + OPENING_TOLERANCE)
+
+
+def verify_range(connection, archive_dir, product_range, batch_size=5000, include_unanchored=False, shard=None):
+    """Compare the range's inventory with its ledger sums, reading both from ``connection``.
+
+    ``shard`` is the ``sharding.layout`` of the shard ``connection`` is on. A
+    cross-shard transfer's movement names both stores on both shards, so only
+    the stores that shard holds are summed.
+
+    Returns ``(movements, pairs, mismatches, fixes, inserts)``. ``fixes`` are the
+    corrections as ``(inventory_id, product_id, store_id, delta, slots)``, deltas
+    rather than quantities so they can be applied after the snapshot was read.
+    """
+    expected, opening = defaultdict(int), {}
+    movements = 0
+    for row in ledger.iter_movements(connection, product_range=product_range,
+                                     archive_dir=archive_dir, batch_size=batch_size):
+        for store_id in {row['source_store_id'], row['target_store_id']} - {None}:
+            if not sharding.holds(shard, store_id):
+                continue
+            key = (row['product_id'], store_id)
+            delta = movement_delta(row, store_id)
+            expected[key] += delta
+            opening.setdefault(key, (row['timestamp'], delta))
+        movements += 1
+
+    stored = connection.execute(
+        select(Inventory.id, Inventory.product_id, Inventory.store_id, counters.current_quantity(),
+               counters.slot_count(), Inventory.created_at)
+        .where(Inventory.product_id.between(*product_range))
+        .execution_options(yield_per=batch_size)
+    )
+    mismatches, fixes, pairs = [], [], 0
+    for inventory_id, product_id, store_id, quantity, slots, created_at in stored:
+        pairs += 1
+        key = (product_id, store_id)
+        wanted = expected.pop(key, 0)
+        if wanted == quantity:
+            continue
+        anchored = is_anchored(opening.get(key), created_at, wanted)
+        mismatches.append({'product_id': product_id, 'store_id': store_id, 'stored': quantity, 'ledger': wanted,
+                           'anchored': anchored})
+        if anchored or (include_unanchored and wanted >= 0):
+            fixes.append((inventory_id, product_id, store_id, wanted - quantity, slots))
+
+    # Pairs with ledger activity but no inventory row at all
+    inserts = []
+    for (product_id, store_id), wanted in expected.items():
+        if wanted == 0:
+            continue
+        pairs += 1
+        anchored = is_anchored(opening[(product_id, store_id)], None, wanted)
+        mismatches.append({'product_id': product_id, 'store_id': store_id, 'stored': None, 'ledger': wanted,
+                           'anchored': anchored})
+        if anchored:
+            inserts.append({'id': str(uuid.uuid4()), 'product_id': product_id, 'store_id': store_id,
+                            'quantity': wanted, 'min_stock': 0})
+    return movements, pairs, mismatches, fixes, inserts
+
+
+def apply_fixes(connection, fixes, inserts):
+    """Add the ``verify_range`` corrections to the current rows. Returns the rows corrected.
+
+    Writes that committed after the snapshot changed the ledger and the row
+    alike, so adding the delta keeps them. Rows are updated in (product_id,
+    store_id) order, the order adjustments and transfers lock them in.
+    """
+    now = datetime.utcnow()
+    fixes = sorted(fixes, key=lambda fix: fix[1:3])
+    table = Inventory.__table__
+    cold = [{'b_id': fix[0], 'b_delta': fix[3]} for fix in fixes if not fix[4]]
+    if cold:
+        connection.execute(
+            update(table).where(table.c.id == bindparam('b_id'))
+            .values(quantity=table.c.quantity + bindparam('b_delta'), updated_at=now),
+            cold
+        )
+    slot_table = InventorySlot.__table__
+    for inventory_id, _, _, delta, slots in fixes:
+        if not slots:
+            continue
+        # A hot row's quantity is its slots; the column is only their cached total
+        held = connection.execute(
+            select(slot_table.c.quantity).where(slot_table.c.inventory_id == inventory_id)
+            .order_by(slot_table.c.slot).with_for_update()
+        ).scalars().all()
+        total = max(sum(held) + delta, 0)
+        connection.execute(delete(slot_table).where(slot_table.c.inventory_id == inventory_id))
+        connection.execute(insert(slot_table), counters.spread(inventory_id, len(held) or slots, total))
+        connection.execute(update(table).where(table.c.id == inventory_id).values(quantity=total, updated_at=now))
+
+    if inserts:
+        # Rows created since the snapshot already hold their stock
+        existing = set(connection.execute(
+            select(Inventory.product_id, Inventory.store_id)
+            .where(tuple_(Inventory.product_id, Inventory.store_id).in_(
+                [(row['product_id'], row['store_id']) for row in inserts]))
+        ).all())
+        inserts = [row for row in inserts if (row['product_id'], row['store_id']) not in existing]
+    if inserts:
+        connection.execute(insert(table), [{**row, 'created_at': now, 'updated_at': now} for row in inserts])
+
+    changes.write_changes(connection, [changes.inventory_record(*fix[:3]) for fix in fixes] + [
+        changes.inventory_record(row['id'], row['product_id'], row['store_id']) for row in inserts
+    ])
+    stores.refresh(connection, {fix[2] for fix in fixes} | {row['store_id'] for row in inserts})
+    return len(fixes) + len(inserts)
+
+
+def rebuild_range(database_url, archive_dir, product_range, apply=False, batch_size=5000, include_unanchored=False,
+                  shard=None):
+    """Verify (and optionally correct) every inventory row whose product is in ``product_range``.
+
+    Runs in a worker process, so it only takes picklable arguments and opens its
+    own engine. The ledger and inventory are read in one snapshot; corrections
+    are applied as deltas in a second transaction.
+    """
+    engine = create_engine(database_url, poolclass=NullPool)
+    with _snapshot(engine) as connection, connection.begin():
+        movements, pairs, mismatches, fixes, inserts = verify_range(
+            connection, archive_dir, product_range, batch_size, include_unanchored, shard
+        )
+    corrected = 0
+    if apply and (fixes or inserts):
+        with engine.begin() as connection:
+            corrected = apply_fixes(connection, fixes, inserts)
+
+    engine.dispose()
+    return {
+        'range': list(product_range),
+        'movements': movements,
+        'pairs': pairs,
+        'mismatches': len(mismatches),
+        'unanchored': sum(not item['anchored'] for item in mismatches),
+        'corrected': corrected,
+        'sample': mismatches[:MISMATCH_SAMPLE],
+    }
+
+
+def rebuild(database_url, archive_dir, ranges, workers=1, apply=False, include_unanchored=False, shard=None):
+    """Run ``rebuild_range`` over every range and merge the reports."""
+    started = perf_counter()
+    run_range = partial(rebuild_range, database_url, archive_dir, apply=apply, include_unanchored=include_unanchored,
+                        shard=shard)
+    if workers > 1 and len(ranges) > 1:
+        # Forked workers must not share the parent's pooled connections
+        db.engine.dispose()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            results = list(pool.map(run_range, ranges))
+    else:
+        results = [run_range(product_range) for product_range in ranges]
+    elapsed = perf_counter() - started
+
+    movements = sum(result['movements'] for result in results)
+    sample = [item for result in results for item in result['sample']][:MISMATCH_SAMPLE]
+    return {
+        'ranges': len(ranges),
+        'movements': movements,
+        'pairs': sum(result['pairs'] for result in results),
+        'mismatches': sum(result['mismatches'] for result in results),
+        'unanchored': sum(result['unanchored'] for result in results),
+        'corrected': sum(result['corrected'] for result in results),
+        'elapsed_s': round(elapsed, 3),
+        'rows_per_second': round(movements / elapsed, 1) if elapsed else None,
+        'sample': sample,
+    }
+
+
+@ledger_cli.command('rebuild')
+@click.option('--apply', is_flag=True, help='Write corrected quantities instead of only reporting them.')
+@click.option('--include-unanchored', is_flag=True,
+              help='Also set rows whose opening stock is not in the ledger (e.g. seeded rows) to their ledger sum.')
+@click.option('--workers', default=multiprocessing.cpu_count(), show_default=True, help='Worker processes.')
+@click.option('--partitions', type=int, default=None, help='Product id ranges (defaults to 4 per worker).')
+def rebuild_command(apply, include_unanchored, workers, partitions):
+    """Verify or rebuild inventory quantities from the movement ledger."""
+    for key in sharding.each_shard():
+        bind = db.session.get_bind()
+        with bind.connect() as connection:
+            ranges = product_ranges(connection, partitions or workers * 4)
+            archive_dir = ledger.archive_root(connection)
+        database_url = bind.url.render_as_string(hide_password=False)
+        shard = sharding.layout(key) if key else None
+        report = rebuild(database_url, archive_dir, ranges, workers, apply, include_unanchored, shard)
+        click.echo(json.dumps(sharding.tagged(key, report)))
@@ -0,0 +1,162 @@
+"""Reorder-point (``min_stock``) recommendations from movement history.
+
+Demand per (product, store) is read as a columnar extract of the daily rollups:
+the units that left the store each day, whether sold (``OUT``) or transferred
+away. Days without movement count as zero demand. Velocity and variability are
+computed with NumPy over whole columns, and the recommended reorder point is
+``ceil(mean * lead_time + z * std * sqrt(lead_time))``.
+
+Rows with fewer than ``min_observed_days`` days of demand in the window keep
+their ``min_stock``. No history is not evidence of no demand: the SKU may be
+new, or its movements may predate the rollups.
+"""
+import json
+from datetime import datetime, timedelta
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, select, update
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.movement import MovementType
+from app.models.rollup import MovementDailyRollup
+from app.services import changes, stores
+from app.utils import sharding
+
+inventory_cli = AppGroup('inventory', help='Inventory maintenance.')
+
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_LEAD_TIME_DAYS = 7
+DEFAULT_SERVICE_Z = 1.65  # ~95% cycle service level
+DEFAULT_MIN_OBSERVED_DAYS = 1
+FETCH_SIZE = 50000
+
+
+def _columns(session, query, width):
+    """Fetch a query into per-column lists without building per-row objects."""
+    columns = [[] for _ in range(width)]
+    for partition in session.execute(query.execution_options(yield_per=FETCH_SIZE)).partitions():
+        for column, values in zip(columns, zip(*partition)):
+            column.extend(values)
+    return columns
+
+
+def _pair_keys(product_ids, store_ids):
+    return np.char.add(np.char.add(np.array(product_ids, dtype=str), '\x1f'), np.array(store_ids, dtype=str))
+
+
+def recommend(session, window_days=DEFAULT_WINDOW_DAYS, lead_time_days=DEFAULT_LEAD_TIME_DAYS,
+              z=DEFAULT_SERVICE_Z, store_id=None, product_id=None, as_of=None,
+              min_observed_days=DEFAULT_MIN_OBSERVED_DAYS):
+    """Compute recommendations for every matching inventory row.
+
+    Returns a dict of NumPy columns: ``inventory_id``, ``product_id``,
+    ``store_id``, ``min_stock``, ``daily_demand``, ``demand_std``,
+    ``observed_days`` and ``recommended``. Rows observed on fewer than
+    ``min_observed_days`` days are recommended their current ``min_stock``.
+    """
+    end = (as_of or datetime.utcnow()).date()
+    start = end - timedelta(days=window_days)
+
+    inventory_query = select(Inventory.id, Inventory.product_id, Inventory.store_id, Inventory.min_stock)
+    demand_query = select(
+        MovementDailyRollup.product_id, MovementDailyRollup.store_id,
+        db.func.sum(MovementDailyRollup.units_out)
+    ).where(
+        MovementDailyRollup.day >= start,
+        MovementDailyRollup.day < end,
+        MovementDailyRollup.type.in_([MovementType.OUT, MovementType.TRANSFER]),
+        MovementDailyRollup.units_out > 0
+    ).group_by(MovementDailyRollup.product_id, MovementDailyRollup.store_id, MovementDailyRollup.day)
+    if store_id is not None:
+        inventory_query = inventory_query.where(Inventory.store_id == store_id)
+        demand_query = demand_query.where(MovementDailyRollup.store_id == store_id)
+    if product_id is not None:
+        inventory_query = inventory_query.where(Inventory.product_id == product_id)
+        demand_query = demand_query.where(MovementDailyRollup.product_id == product_id)
+
+    inventory_ids, product_ids, store_ids, min_stock = _columns(session, inventory_query, 4)
+    demand_products, demand_stores, units = _columns(session, demand_query, 3)
+
+    count = len(inventory_ids)
+    keys = _pair_keys(product_ids, store_ids) if count else np.array([], dtype=str)
+    order = np.argsort(keys)
+    sums = np.zeros(count)
+    squares = np.zeros(count)
+    observed = np.zeros(count, dtype=np.int64)
+    if units and count:
+        demand_keys = _pair_keys(demand_products, demand_stores)
+        positions = np.searchsorted(keys, demand_keys, sorter=order)
+        positions = np.minimum(positions, count - 1)
+        matched = keys[order[positions]] == demand_keys
+        index = order[positions[matched]]
+        daily = np.asarray(units, dtype=float)[matched]
+        sums = np.bincount(index, weights=daily, minlength=count)
+        squares = np.bincount(index, weights=daily * daily, minlength=count)
+        # The demand query yields one row per pair and day with demand
+        observed = np.bincount(index, minlength=count)
+
+    mean = sums / window_days
+    std = np.sqrt(np.maximum(squares / window_days - mean * mean, 0.0))
+    recommended = np.ceil(mean * lead_time_days + z * std * np.sqrt(lead_time_days)).astype(np.int64)
+    min_stock = np.array(min_stock, dtype=np.int64)
+    recommended = np.where(observed >= max(min_observed_days, 1), recommended, min_stock)
+    return {
+        'inventory_id': np.array(inventory_ids, dtype=object),
+        'product_id': np.array(product_ids, dtype=object),
+        'store_id': np.array(store_ids, dtype=object),
+        'min_stock': min_stock,
+        'daily_demand': mean,
+        'demand_std': std,
+        'observed_days': observed,
+        'recommended': recommended,
+    }
+
+
+def apply_recommendations(session, result):
+    """Write changed recommendations to ``Inventory.min_stock`` in bulk. Returns the count."""
+    changed = np.nonzero(result['recommended'] != result['min_stock'])[0]
+    if not len(changed):
+        return 0
+    now = datetime.utcnow()
+    table = Inventory.__table__
+    session.execute(
+        update(table).where(table.c.id == bindparam('b_id')).values(min_stock=bindparam('b_min_stock'),
+                                                                     updated_at=now),
+        [{'b_id': inventory_id, 'b_min_stock': int(value)}
+         for inventory_id, value in zip(result['inventory_id'][changed], result['recommended'][changed])]
+    )
+    changes.capture(session, [
+        changes.inventory_record(*row) for row in zip(result['inventory_id'][changed],
+                                                      result['product_id'][changed],
+                                                      result['store_id'][changed])
+    ])
+    # Thresholds may move across many rows; recount the low-stock rows of the affected stores
+    stores.mark_stale(session, set(result['store_id'][changed]))
+    return len(changed)
+
+
+@inventory_cli.command('recommend')
+@click.option('--window-days', default=DEFAULT_WINDOW_DAYS, show_default=True, help='Days of history to use.')
+@click.option('--lead-time-days', default=DEFAULT_LEAD_TIME_DAYS, show_default=True, help='Replenishment lead time.')
+@click.option('--z', default=DEFAULT_SERVICE_Z, show_default=True, help='Safety factor (standard deviations).')
+@click.option('--min-observed-days', default=DEFAULT_MIN_OBSERVED_DAYS, show_default=True,
+              help='Days with demand a row needs before its min_stock is changed.')
+@click.option('--apply', is_flag=True, help='Write the recommendations to min_stock.')
+def recommend_command(window_days, lead_time_days, z, min_observed_days, apply):
+    """Recompute min_stock recommendations for every inventory row."""
+    for key in sharding.each_shard():
+        started = datetime.utcnow()
+        result = recommend(db.session, window_days, lead_time_days, z, min_observed_days=min_observed_days)
+        changed = int(np.count_nonzero(result['recommended'] != result['min_stock']))
+        if apply:
+            apply_recommendations(db.session, result)
+            db.session.commit()
+        click.echo(json.dumps(sharding.tagged(key, {
+            'pairs': len(result['inventory_id']),
+            'changed': changed,
+            'applied': apply,
+            'elapsed_s': round((datetime.utcnow() - started).total_seconds(), 3),
+        })))
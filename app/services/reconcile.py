@@ -0,0 +1,184 @@
+"""Reconcile a store's physical count against its inventory.
+
+The count (``sku,quantity`` CSV or NDJSON, sorted by SKU) is read as a stream
+and merged against the store's inventory rows, read in the same order through a
+server-side cursor. Differences are written out as NDJSON and, when applying,
+the corrective movements are spooled and replayed in batches once the merge has
+finished. Memory use depends on the batch size, not on the number of SKUs.
+"""
+import csv
+import json
+import tempfile
+
+from sqlalchemy import select
+
+from app.models.inventory import Inventory
+from app.models.movement import MovementType
+from app.models.product import Product
+from app.services import adjustments, counters
+
+FETCH_SIZE = 5000
+BATCH_SIZE = 1000
+SPOOL_SIZE = 4 * 1024 * 1024
+
+MISMATCH = 'mismatch'
+NOT_COUNTED = 'not_counted'
+NOT_STOCKED = 'not_stocked'
+UNKNOWN_SKU = 'unknown_sku'
+
+
+class CountFileError(ValueError):
+    """The uploaded count is malformed or not sorted by SKU."""
+
+
+class ReconcileConflict(Exception):
+    """A correction could not be applied."""
+
+
+def spool():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode='w+', encoding='utf-8')
+
+
+def parse_counts(lines, ndjson=False):
+    """Yield ``(sku, quantity)`` from count lines, enforcing strictly increasing SKUs."""
+    previous = None
+    rows = lines if ndjson else csv.reader(lines)
+    for number, row in enumerate(rows, start=1):
+        try:
+            if ndjson:
+                if not row.strip():
+                    continue
+                row = json.loads(row)
+                sku, quantity = row['sku'], row['quantity']
+            else:
+                if not row:
+                    continue
+                sku, quantity = row
+                if number == 1 and sku.strip().lower() == 'sku':
+                    continue
+                quantity = int(quantity)
+        except (KeyError, TypeError, ValueError):
+            raise CountFileError(f'line {number}: expected a SKU and an integer quantity')
+        if not isinstance(sku, str) or not sku or isinstance(quantity, bool) or not isinstance(quantity, int) \
+                or quantity < 0:
+            raise CountFileError(f'line {number}: expected a SKU and a non-negative integer quantity')
+        if previous is not None and sku <= previous:
+            raise CountFileError(f'line {number}: SKUs must be unique and sorted ({sku!r} after {previous!r})')
+        previous = sku
+        yield sku, quantity
+
+
+def inventory_by_sku(session, store_id, lock=False):
+    """Stream ``(sku, product_id, quantity)`` for a store in code-point SKU order."""
+    sku = Product.sku
+    if session.get_bind().dialect.name == 'postgresql':
+        # Match Python's string ordering regardless of the database locale
+        sku = sku.collate('C')
+    query = (
+        select(Product.sku, Inventory.product_id, counters.current_quantity())
+        .join(Product, Product.id == Inventory.product_id)
+        .where(Inventory.store_id == store_id)
+        .order_by(sku)
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    if lock:
+        query = query.with_for_update(of=Inventory)
+    return session.execute(query)
+
+
+def merge(counts, stock):
+    """Merge-join two SKU-ordered streams into ``(sku, product_id, expected, counted)``.
+
+    ``product_id`` and ``expected`` are None for SKUs the store has no row for;
+    ``counted`` is None for rows missing from the count.
+    """
+    end = object()
+    count, row = next(counts, end), next(stock, end)
+    while count is not end or row is not end:
+        if row is end or (count is not end and count[0] < row[0]):
+            yield count[0], None, None, count[1]
+            count = next(counts, end)
+        elif count is end or row[0] < count[0]:
+            yield row[0], row[1], row[2], None
+            row = next(stock, end)
+        else:
+            yield row[0], row[1], row[2], count[1]
+            count, row = next(counts, end), next(stock, end)
+
+
+def _resolve(session, pending):
+    """Fill in product ids of count-only SKUs in ``pending`` with one IN query."""
+    wanted = {item['sku'] for item in pending if item['status'] == NOT_STOCKED}
+    if not wanted:
+        return
+    products = dict(session.execute(select(Product.sku, Product.id).where(Product.sku.in_(wanted))).all())
+    for item in pending:
+        if item['status'] == NOT_STOCKED:
+            item['product_id'] = products.get(item['sku'])
+            if item['product_id'] is None:
+                item['status'] = UNKNOWN_SKU
+
+
+def reconcile(session, store_id, counts, out, apply=False):
+    """Write one NDJSON line per difference to ``out`` and return a summary.
+
+    A row missing from the count is treated as counted at zero.
+    """
+    summary = {'store_id': store_id, 'counted': 0, 'matched': 0, 'differences': 0, 'unknown_skus': 0,
+               'units_in': 0, 'units_out': 0, 'applied': apply}
+    corrections = spool()
+    pending = []
+
+    def flush():
+        _resolve(session, pending)
+        for item in pending:
+            if item['status'] == UNKNOWN_SKU:
+                summary['unknown_skus'] += 1
+            else:
+                summary['differences'] += 1
+                direction = MovementType.IN if item['difference'] > 0 else MovementType.OUT
+                units = abs(item['difference'])
+                summary['units_in' if direction == MovementType.IN else 'units_out'] += units
+                if apply:
+                    corrections.write(json.dumps([item['product_id'], direction.value, units]) + '\n')
+            out.write(json.dumps(item) + '\n')
+        pending.clear()
+
+    try:
+        for sku, product_id, expected, counted in merge(counts, iter(inventory_by_sku(session, store_id, apply))):
+            if counted is not None:
+                summary['counted'] += 1
+            difference = (counted or 0) - (expected or 0)
+            if difference == 0:
+                summary['matched'] += counted is not None
+                continue
+            status = MISMATCH if counted is not None and expected is not None else (
+                NOT_COUNTED if counted is None else NOT_STOCKED
+            )
+            pending.append({'sku': sku, 'product_id': product_id, 'expected': expected or 0,
+                            'counted': counted or 0, 'difference': difference, 'status': status})
+            if len(pending) >= BATCH_SIZE:
+                flush()
+        flush()
+
+        corrections.seek(0)
+        batch = []
+        for line in corrections:
+            product_id, direction, quantity = json.loads(line)
+            batch.append({'product_id': product_id, 'store_id': store_id,
+                          'type': MovementType(direction), 'quantity': quantity})
+            if len(batch) >= BATCH_SIZE:
+                _apply(session, batch)
+        _apply(session, batch)
+    finally:
+        corrections.close()
+    return summary
+
+
+def _apply(session, batch):
+    if not batch:
+        return
+    applied, rejected, _ = adjustments.apply_adjustments(session, batch)
+    if rejected:
+        raise ReconcileConflict(f'Correction rejected: {rejected[0]["error"]}')
+    batch.clear()
@@ -0,0 +1,268 @@
+"""Store-keyed sharding across several databases.
+
+Every store belongs to one shard (see ``app.utils.sharding``). A shard holds the inventory,
+movements, slots, rollups, checkpoints, change feed and outbox of its stores.
+The database behind ``DATABASE_URL`` becomes the catalog: products are written
+there and replicated to every shard after commit, so shard queries can join
+them locally.
+
+A transfer between stores on different shards runs in three local
+transactions:
+
+1. reserve: on the source shard, take the stock out of the source store and
+   record a ``reserved`` ``ShardTransfer``;
+2. apply: on the target shard, record an ``AppliedTransfer`` and add the stock
+   to the target store, or record the target's rejection; a transfer that is
+   already recorded keeps its first outcome;
+3. complete: on the source shard, mark the transfer ``committed``, or give the
+   stock back and mark it ``released`` when the target rejected it.
+
+A crash between steps leaves the transfer ``reserved``; ``flask shards
+recover`` rolls such transfers forward. Both shards keep a movement row with
+the transfer's id, each recording its own side in rollups.
+"""
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.main import db
+from app.models.movement import Movement, MovementType
+from app.models.product import Product
+from app.models.shard_transfer import AppliedTransfer, ShardTransfer
+from app.services import adjustments, changes, stores
+from app.utils.sharding import enabled, engine, shard_for, shard_keys, shard_session
+from app.utils.sql import ROUTED_BIND, dialect_insert
+
+shards_cli = AppGroup('shards', help='Store-keyed database shards.')
+
+RESERVED = 'reserved'
+COMMITTED = 'committed'
+RELEASED = 'released'
+
+_REPLICATE = 'replicate_products'
+
+
+# Product replication
+
+def replicate_products(product_ids=None):
+    """Copy catalog products to every shard; all of them when ``product_ids`` is None.
+
+    Requested ids that no longer exist in the catalog are deleted from the
+    shards. A shard that fails is logged and skipped; ``flask shards
+    sync-products`` repairs it.
+    """
+    table = Product.__table__
+    query, prices = select(table), select(table.c.id, table.c.price).with_for_update()
+    if product_ids is not None:
+        query = query.where(table.c.id.in_(list(product_ids)))
+        prices = prices.where(table.c.id.in_(list(product_ids)))
+    with db.engine.connect() as connection:
+        rows = [dict(row) for row in connection.execute(query).mappings()]
+    gone = set(product_ids or ()) - {row['id'] for row in rows}
+    for key in shard_keys():
+        try:
+            with engine(key).begin() as connection:
+                if rows:
+                    # The shard's store totals value its stock at the replicated prices
+                    old_prices = dict(connection.execute(prices).all())
+                    statement = dialect_insert(connection, table)
+                    connection.execute(statement.on_conflict_do_update(
+                        index_elements=['id'],
+                        set_={name: statement.excluded[name] for name in table.c.keys() if name != 'id'}
+                    ), rows)
+                    stores.write_totals(connection, prices=[
+                        stores.price_change(row['id'], old_prices[row['id']], row['price'])
+                        for row in rows if row['id'] in old_prices
+                    ])
+                if gone:
+                    connection.execute(delete(table).where(table.c.id.in_(gone)))
+        except SQLAlchemyError:
+            current_app.logger.exception('Replicating products to %s failed', key)
+    return len(rows)
+
+
+def _is_catalog_session(session):
+    return session.bind is None and session.info.get(ROUTED_BIND) is None
+
+
+@event.listens_for(Session, 'before_commit', insert=True)
+def _collect_product_writes(session):
+    # Runs before the change feed sequences (and drops) its pending records
+    if not has_app_context() or not enabled() or not _is_catalog_session(session):
+        return
+    session.flush()
+    ids = {change['entity_id'] for change in changes.pending(session) if change['entity'] == changes.PRODUCT}
+    if ids:
+        session.info.setdefault(_REPLICATE, set()).update(ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _replicate_committed_products(session):
+    ids = session.info.pop(_REPLICATE, None)
+    if ids:
+        replicate_products(ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_writes(session):
+    session.info.pop(_REPLICATE, None)
+
+
+# Cross-shard transfers
+
+def _apply(session, movement):
+    """Apply one movement; returns the error message, or None once applied."""
+    results, _ = adjustments.apply_movements(session, [[movement]])
+    errors = results[0]['errors']
+    return errors[0][1] if errors else None
+
+
+def reserve(product_id, source_store_id, target_store_id, quantity):
+    """Step 1: take the stock out of the source store. Returns ``(transfer_id, error)``."""
+    transfer_id = str(uuid.uuid4())
+    with shard_session(shard_for(source_store_id)) as session:
+        error = _apply(session, {'id': transfer_id, 'product_id': product_id, 'source_store_id': source_store_id,
+                                 'target_store_id': None, 'quantity': quantity, 'type': MovementType.TRANSFER})
+        if error:
+            session.rollback()
+            return None, error
+        session.add(ShardTransfer(id=transfer_id, product_id=product_id, source_store_id=source_store_id,
+                                  target_store_id=target_store_id, quantity=quantity, state=RESERVED))
+        session.commit()
+    return transfer_id, None
+
+
+def apply_target(transfer):
+    """Step 2: add the stock to the target store, once. Returns the target's error, if any."""
+    with shard_session(shard_for(transfer['target_store_id'])) as session:
+        record = AppliedTransfer(id=transfer['id'])
+        session.add(record)
+        try:
+            # Blocks behind a concurrent apply of the same transfer until it commits
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            return session.get(AppliedTransfer, transfer['id']).error
+        if session.execute(select(Movement.id).where(Movement.id == transfer['id'])).first() is not None:
+            # Applied before its transfers were recorded
+            session.commit()
+            return None
+        record.error = _apply(session, {'id': transfer['id'], 'product_id': transfer['product_id'],
+                                        'source_store_id': None, 'target_store_id': transfer['target_store_id'],
+                                        'quantity': transfer['quantity'], 'type': MovementType.TRANSFER})
+        if record.error is None:
+            session.execute(update(Movement.__table__).where(Movement.__table__.c.id == transfer['id'])
+                            .values(source_store_id=transfer['source_store_id']))
+        session.commit()
+        return record.error
+
+
+def complete(transfer_id, source_store_id, error=None):
+    """Step 3: commit a reserved transfer, or release its stock when the target rejected it.
+
+    Returns the transfer's movement as seen by the source shard and its final
+    state. A release the source store rejects leaves the transfer ``reserved``.
+    """
+    with shard_session(shard_for(source_store_id)) as session:
+        transfer = session.get(ShardTransfer, transfer_id, with_for_update=True)
+        movements = Movement.__table__
+        if transfer.state == RESERVED and error is None:
+            session.execute(update(movements).where(movements.c.id == transfer_id)
+                            .values(target_store_id=transfer.target_store_id))
+            transfer.state = COMMITTED
+        elif transfer.state == RESERVED:
+            release_error = _apply(session, {'product_id': transfer.product_id, 'source_store_id': None,
+                                             'target_store_id': transfer.source_store_id,
+                                             'quantity': transfer.quantity, 'type': MovementType.IN})
+            if release_error is None:
+                transfer.state = RELEASED
+            else:
+                current_app.logger.error('Transfer %s stays reserved; releasing its stock failed: %s',
+                                         transfer_id, release_error)
+        state = transfer.state
+        session.commit()
+        movement = session.execute(select(Movement).where(Movement.id == transfer_id)).scalar_one()
+        return movement.to_dict(), state
+
+
+def _transfer_dict(transfer):
+    return {'id': transfer.id, 'product_id': transfer.product_id, 'source_store_id': transfer.source_store_id,
+            'target_store_id': transfer.target_store_id, 'quantity': transfer.quantity}
+
+
+def transfer(product_id, source_store_id, target_store_id, quantity):
+    """Transfer stock between stores on different shards.
+
+    Returns ``(movement, state, error)``. ``error`` is set when the source
+    store rejected the transfer; nothing was changed then. ``state`` is
+    ``reserved`` when the target shard could not be reached, in which case
+    ``flask shards recover`` finishes the transfer later.
+    """
+    transfer_id, error = reserve(product_id, source_store_id, target_store_id, quantity)
+    if error:
+        return None, None, error
+    pending = {'id': transfer_id, 'product_id': product_id, 'source_store_id': source_store_id,
+               'target_store_id': target_store_id, 'quantity': quantity}
+    try:
+        target_error = apply_target(pending)
+    except SQLAlchemyError:
+        current_app.logger.exception('Transfer %s is reserved; the target shard failed', transfer_id)
+        return pending, RESERVED, None
+    movement, state = complete(transfer_id, source_store_id, target_error)
+    return movement, state, target_error
+
+
+def recover(older_than):
+    """Roll forward transfers reserved more than ``older_than`` seconds ago. Returns counts by final state."""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    outcome = {COMMITTED: 0, RELEASED: 0, RESERVED: 0}
+    for key in shard_keys():
+        with shard_session(key) as session:
+            pending = [_transfer_dict(transfer) for transfer in session.execute(
+                select(ShardTransfer).where(ShardTransfer.state == RESERVED, ShardTransfer.created_at <= cutoff)
+                .order_by(ShardTransfer.created_at)
+            ).scalars()]
+        for item in pending:
+            try:
+                _, state = complete(item['id'], item['source_store_id'], apply_target(item))
+            except SQLAlchemyError:
+                current_app.logger.exception('Recovering transfer %s failed', item['id'])
+                state = RESERVED
+            outcome[state] += 1
+    return outcome
+
+
+def _require_shards():
+    if not enabled():
+        raise click.UsageError('SHARD_DATABASE_URLS is not set')
+
+
+@shards_cli.command('locate')
+@click.argument('store_id')
+def locate_command(store_id):
+    """Print the shard that holds a store."""
+    _require_shards()
+    click.echo(json.dumps({'store_id': store_id, 'shard': shard_for(store_id)}))
+
+
+@shards_cli.command('sync-products')
+def sync_products_command():
+    """Copy every catalog product to every shard."""
+    _require_shards()
+    click.echo(json.dumps({'replicated': replicate_products()}))
+
+
+@shards_cli.command('recover')
+@click.option('--older-than', default=60.0, show_default=True,
+              help='Only transfers reserved at least this many seconds ago.')
+def recover_command(older_than):
+    """Finish cross-shard transfers left reserved by a failure between steps."""
+    _require_shards()
+    click.echo(json.dumps(recover(older_than)))
@@ -0,0 +1,244 @@
+"""Per-store inventory totals: SKUs, units, valuation and low-stock rows.
+
+Every change to an inventory row is reduced to a delta of its store's totals
+(``row_delta``). ORM writes to ``Inventory`` and to ``Product.price`` are
+captured by a ``before_flush`` hook. Set-based writers pass their deltas to
+``capture`` and their price changes to ``capture_prices``. Writers that touch
+too many rows to track individually mark the stores with ``mark_stale``, and
+those stores are recomputed.
+
+The deltas of a transaction are added to the ``store`` rows just before it
+commits, in one upsert ordered by store id. Units are valued at the product's
+current price. A price change revalues the units each store held before the
+transaction. The store rows stay locked only from that upsert to the commit,
+which the change-feed counter row already serializes.
+
+Hot rows are not locked by their writers, so a price change that races one of
+them can leave a store's valuation slightly off. ``flask stores refresh``
+recomputes the totals from the inventory.
+"""
+import json
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, case, event, func, inspect, select, union, update
+from sqlalchemy.orm import Session
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.product import Product
+from app.models.store import Store
+from app.services.notifications import is_low
+from app.utils import sharding
+from app.utils.sql import dialect_insert
+
+stores_cli = AppGroup('stores', help='Store summary maintenance.')
+
+_PENDING = 'pending_store_deltas'
+_PRICES = 'pending_price_changes'
+_STALE = 'stale_store_totals'
+
+TOTALS = ('sku_count', 'total_units', 'total_value', 'low_stock_count')
+
+
+def row_delta(product_id, store_id, old_quantity, old_min_stock, quantity, min_stock):
+    """How one inventory row changes its store's totals, or None when it does not.
+
+    ``old_quantity`` is None for a created row, ``quantity`` None for a deleted one.
+    """
+    skus = (quantity is not None) - (old_quantity is not None)
+    units = (quantity or 0) - (old_quantity or 0)
+    low = ((quantity is not None and is_low(quantity, min_stock))
+           - (old_quantity is not None and is_low(old_quantity, old_min_stock)))
+    if not (skus or units or low):
+        return None
+    return {'product_id': product_id, 'store_id': store_id, 'skus': skus, 'units': units, 'low': low}
+
+
+def price_change(product_id, old_price, price):
+    """A product's price change, or None when the price is unchanged."""
+    old_price, price = Decimal(str(old_price)), Decimal(str(price))
+    if old_price == price:
+        return None
+    return {'product_id': product_id, 'old_price': old_price, 'price': price}
+
+
+def capture(session, deltas):
+    """Queue row deltas to be added to the store totals when ``session`` commits."""
+    deltas = [delta for delta in deltas if delta is not None]
+    if deltas:
+        session.info.setdefault(_PENDING, []).extend(deltas)
+
+
+def capture_prices(session, changes):
+    """Queue price changes whose stock must be revalued when ``session`` commits."""
+    changes = [change for change in changes if change is not None]
+    if changes:
+        session.info.setdefault(_PRICES, []).extend(changes)
+
+
+def mark_stale(session, store_ids):
+    """Recompute these stores' totals from their inventory when ``session`` commits."""
+    session.info.setdefault(_STALE, set()).update(store_ids)
+
+
+def _current_quantity():
+    # counters reports its hot-row deltas through this module
+    from app.services import counters
+    return counters.current_quantity()
+
+
+def write_totals(connection, deltas=(), prices=(), stale=()):
+    """Apply deltas, price changes and recomputations to the ``store`` rows on ``connection``."""
+    prices = [change for change in prices if change is not None]
+    stale = set(stale)
+    totals = defaultdict(lambda: {name: 0 for name in TOTALS})
+    product_ids = {delta['product_id'] for delta in deltas if delta['units']}
+    current_prices = {}
+    if product_ids:
+        current_prices = dict(connection.execute(
+            select(Product.id, Product.price).where(Product.id.in_(product_ids))
+        ).all())
+    pending_units = defaultdict(int)
+    for delta in deltas:
+        pending_units[(delta['product_id'], delta['store_id'])] += delta['units']
+        if delta['store_id'] in stale:
+            continue
+        store = totals[delta['store_id']]
+        store['sku_count'] += delta['skus']
+        store['total_units'] += delta['units']
+        store['total_value'] += delta['units'] * current_prices.get(delta['product_id'], 0)
+        store['low_stock_count'] += delta['low']
+
+    if prices:
+        latest = {}
+        for change in prices:
+            # Several changes of one price in a transaction revalue once, from the first old price
+            first = latest.get(change['product_id'], change)
+            latest[change['product_id']] = {**change, 'old_price': first['old_price']}
+        held = connection.execute(
+            select(Inventory.product_id, Inventory.store_id, _current_quantity())
+            .where(Inventory.product_id.in_(list(latest)))
+            # The order adjustments and transfers lock rows in, so a repricing cannot deadlock with them
+            .order_by(Inventory.product_id, Inventory.store_id)
+            .with_for_update()
+        ).all()
+        for product_id, store_id, quantity in held:
+            if store_id in stale:
+                continue
+            change = latest[product_id]
+            # Units this transaction added were valued at the new price already
+            units = quantity - pending_units[(product_id, store_id)]
+            totals[store_id]['total_value'] += units * (change['price'] - change['old_price'])
+
+    store_ids = sorted(stale | {store_id for store_id, store in totals.items() if any(store.values())})
+    if not store_ids:
+        return
+    now = datetime.utcnow()
+    table = Store.__table__
+    statement = dialect_insert(connection, table)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['id'],
+        set_={**{name: table.c[name] + statement.excluded[name] for name in TOTALS}, 'updated_at': now}
+    ), [{'id': store_id, **totals[store_id], 'created_at': now, 'updated_at': now} for store_id in store_ids])
+    if stale:
+        _recompute(connection, sorted(stale), now)
+
+
+def _recompute(connection, store_ids, now):
+    # The upsert above locked the store rows, so no delta can commit between this read and the write
+    quantity = _current_quantity()
+    rows = {row[0]: row[1:] for row in connection.execute(
+        select(Inventory.store_id, func.count(), func.coalesce(func.sum(quantity), 0),
+               func.coalesce(func.sum(quantity * Product.price), 0),
+               func.coalesce(func.sum(case((quantity <= Inventory.min_stock, 1), else_=0)), 0))
+        .join(Product, Product.id == Inventory.product_id)
+        .where(Inventory.store_id.in_(store_ids))
+        .group_by(Inventory.store_id)
+    )}
+    table = Store.__table__
+    connection.execute(
+        update(table).where(table.c.id == bindparam('b_id'))
+        .values(updated_at=now, **{name: bindparam(f'b_{name}') for name in TOTALS}),
+        [{'b_id': store_id, **{f'b_{name}': value for name, value in zip(TOTALS, rows.get(store_id, (0, 0, 0, 0)))}}
+         for store_id in store_ids]
+    )
+
+
+def refresh(connection, store_ids=None):
+    """Recompute the totals of ``store_ids`` (every stocked or known store when None)."""
+    if store_ids is None:
+        store_ids = connection.execute(union(select(Inventory.store_id), select(Store.id))).scalars().all()
+    write_totals(connection, stale=store_ids)
+    return len(store_ids)
+
+
+def _previous(obj, name):
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, name)
+
+
+def _inventory_deltas(obj, created=False, deleted=False):
+    if created:
+        return [row_delta(obj.product_id, obj.store_id, None, None, obj.quantity or 0, obj.min_stock or 0)]
+    old_key = (_previous(obj, 'product_id'), _previous(obj, 'store_id'))
+    old = (_previous(obj, 'quantity'), _previous(obj, 'min_stock'))
+    if deleted:
+        return [row_delta(*old_key, *old, None, None)]
+    if old_key != (obj.product_id, obj.store_id):
+        return [row_delta(*old_key, *old, None, None),
+                row_delta(obj.product_id, obj.store_id, None, None, obj.quantity, obj.min_stock)]
+    return [row_delta(obj.product_id, obj.store_id, *old, obj.quantity, obj.min_stock)]
+
+
+@event.listens_for(Session, 'before_flush')
+def _capture_orm_totals(session, flush_context, instances):
+    deltas = []
+    for obj in session.new:
+        if isinstance(obj, Inventory):
+            deltas += _inventory_deltas(obj, created=True)
+    for obj in session.dirty:
+        if isinstance(obj, Inventory) and session.is_modified(obj):
+            deltas += _inventory_deltas(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Inventory):
+            deltas += _inventory_deltas(obj, deleted=True)
+    capture(session, deltas)
+    capture_prices(session, [
+        price_change(obj.id, _previous(obj, 'price'), obj.price) for obj in session.dirty
+        if isinstance(obj, Product) and session.is_modified(obj) and inspect(obj).attrs.price.history.deleted
+    ])
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_pending_totals(session):
+    session.flush()
+    deltas = session.info.pop(_PENDING, None)
+    prices = session.info.pop(_PRICES, None)
+    stale = session.info.pop(_STALE, None)
+    if deltas or prices or stale:
+        write_totals(session.connection(), deltas or (), prices or (), stale or ())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_totals(session):
+    for key in (_PENDING, _PRICES, _STALE):
+        session.info.pop(key, None)
+
+
+@stores_cli.command('refresh')
+@click.argument('store_ids', nargs=-1)
+def refresh_command(store_ids):
+    """Recompute store totals from the inventory (all stores when none are given)."""
+    for key in sharding.each_shard():
+        shard_stores = [store_id for store_id in store_ids if key is None or sharding.shard_for(store_id) == key]
+        if store_ids and not shard_stores:
+            continue
+        with db.session.get_bind().begin() as connection:
+            refreshed = refresh(connection, shard_stores or None)
+        click.echo(json.dumps(sharding.tagged(key, {'refreshed': refreshed})))
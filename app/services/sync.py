@@ -0,0 +1,85 @@
+"""Delta synchronisation of the catalog and store inventories for mirrors.
+
+A sync token is either ``<seq>`` (delta mode: return rows changed after that
+change sequence number) or ``<seq>:<after_id>`` (snapshot mode: keep paging
+through the full table by id, then continue with deltas from ``seq``). A client
+without a token starts a snapshot; the ``seq`` captured at its start makes sure
+changes committed while paging are replayed afterwards.
+
+Deltas are read from the change log through its (entity, seq) and
+(store_id, seq) indexes, so a sync costs time proportional to what changed.
+"""
+from sqlalchemy import select
+
+from app.main import db
+from app.models.change import ChangeLog
+from app.models.inventory import Inventory
+from app.models.product import Product
+from app.services import changes
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def encode_token(seq, after_id=None):
+    return str(seq) if after_id is None else f'{seq}:{after_id}'
+
+
+def decode_token(token):
+    """Return ``(seq, after_id)``; ``after_id`` is None in delta mode."""
+    try:
+        seq, separator, after_id = token.partition(':')
+        seq = int(seq)
+    except (AttributeError, ValueError):
+        raise InvalidToken(token)
+    if seq < 0:
+        raise InvalidToken(token)
+    return seq, (after_id if separator else None)
+
+
+def current_seq(session):
+    return session.execute(select(db.func.coalesce(db.func.max(ChangeLog.seq), 0))).scalar()
+
+
+def _snapshot_page(session, model, scope, seq, after_id, limit):
+    query = select(model).where(model.id > after_id, *scope).order_by(model.id).limit(limit)
+    rows = session.execute(query).scalars().all()
+    if len(rows) < limit:
+        return rows, [], encode_token(seq), False
+    return rows, [], encode_token(seq, rows[-1].id), True
+
+
+def _delta_page(session, model, entity, scope, change_scope, seq, limit):
+    query = select(ChangeLog.seq, ChangeLog.entity_id).where(
+        ChangeLog.entity == entity, ChangeLog.seq > seq, *change_scope
+    ).order_by(ChangeLog.seq).limit(limit)
+    entries = session.execute(query).all()
+    if not entries:
+        return [], [], encode_token(seq), False
+
+    ids = list(dict.fromkeys(entity_id for _, entity_id in entries))
+    rows = session.execute(select(model).where(model.id.in_(ids), *scope)).scalars().all()
+    present = {row.id for row in rows}
+    deleted = [entity_id for entity_id in ids if entity_id not in present]
+    return rows, deleted, encode_token(entries[-1][0]), len(entries) == limit
+
+
+def sync_page(session, model, entity, token, limit, scope=(), change_scope=()):
+    """Return ``(rows, deleted_ids, next_token, has_more)`` for one sync page."""
+    if token is None:
+        seq, after_id = current_seq(session), ''
+    else:
+        seq, after_id = decode_token(token)
+    if after_id is not None:
+        return _snapshot_page(session, model, scope, seq, after_id, limit)
+    return _delta_page(session, model, entity, scope, change_scope, seq, limit)
+
+
+def sync_products(session, token, limit):
+    return sync_page(session, Product, changes.PRODUCT, token, limit)
+
+
+def sync_store_inventory(session, store_id, token, limit):
+    return sync_page(session, Inventory, changes.INVENTORY, token, limit,
+                     scope=(Inventory.store_id == store_id,), change_scope=(ChangeLog.store_id == store_id,))
@@ -0,0 +1,248 @@
+"""Admission control: bound in-flight requests per route class and shed the excess early.
+
+Every endpoint belongs to a class: ``transfers`` (stock writes), ``reads``
+(single-item requests) or ``bulk`` (listings, exports, lookups and set-based
+updates). Each class admits up to its limit of concurrent requests per worker
+process; further requests wait in a bounded queue for at most the class's
+maximum wait. Requests that find the queue full or time out get ``503`` with
+``Retry-After`` before they touch the database.
+
+The database pool counts as saturated when every connection is checked out,
+or when admitted requests wait longer than ``ADMISSION_POOL_WAIT_TARGET_MS``
+(moving average) for their first connection. While it is saturated, ``bulk``
+is held to one request and ``reads`` to half its limit; ``transfers`` keep
+their full limit, and ``bulk`` is not admitted at all while transfers queue.
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, g, has_request_context, jsonify
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.utils import deadlines
+
+TRANSFERS = 'transfers'
+READS = 'reads'
+BULK = 'bulk'
+
+DEFAULT_LIMITS = 'transfers=32,reads=64,bulk=8'
+DEFAULT_QUEUES = 'transfers=64,reads=64,bulk=8'
+DEFAULT_MAX_WAIT_MS = 'transfers=2000,reads=1000,bulk=250'
+
+# Weight of the newest sample in the moving averages
+SMOOTHING = 0.2
+
+
+def parse_class_settings(value, name):
+    """Parse ``transfers=32,reads=64,bulk=8`` into a dict of non-negative numbers."""
+    settings = {}
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        route_class, _, number = item.partition('=')
+        if route_class not in (TRANSFERS, READS, BULK):
+            raise ValueError(f'{name}: unknown route class {route_class!r}')
+        try:
+            settings[route_class] = float(number)
+        except ValueError:
+            raise ValueError(f'{name}: invalid value for {route_class}: {number!r}')
+        if settings[route_class] < 0:
+            raise ValueError(f'{name}: {route_class} must not be negative')
+    return settings
+
+
+class RouteClass:
+    def __init__(self, name, limit, queue, max_wait):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.queue_wait_ms = 0.0
+
+    def metrics(self, effective_limit):
+        return {
+            'limit': self.limit,
+            'effective_limit': effective_limit,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'queue_limit': self.queue,
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'timed_out': self.timed_out,
+            'queue_wait_ms': round(self.queue_wait_ms, 2),
+        }
+
+
+class AdmissionController:
+    def __init__(self, limits, queues, max_wait_ms, pool_wait_target_ms=50.0, retry_after=1, pool=None):
+        self.classes = {
+            name: RouteClass(name, int(limits[name]), int(queues[name]), max_wait_ms[name] / 1000)
+            for name in (TRANSFERS, READS, BULK)
+        }
+        self.pool_wait_target_ms = pool_wait_target_ms
+        self.retry_after = retry_after
+        self.pool = pool
+        self.pool_wait_ms = 0.0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config, pool=None):
+        def settings(key, default):
+            return {**parse_class_settings(default, key), **parse_class_settings(config[key], key)}
+
+        return cls(settings('ADMISSION_LIMITS', DEFAULT_LIMITS), settings('ADMISSION_QUEUES', DEFAULT_QUEUES),
+                   settings('ADMISSION_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS), config['ADMISSION_POOL_WAIT_TARGET_MS'],
+                   config['ADMISSION_RETRY_AFTER'], pool)
+
+    def pool_utilization(self):
+        """Fraction of the pool's connections checked out, or None for pools that do not report it."""
+        if self.pool is None or not hasattr(self.pool, 'checkedout'):
+            return None
+        capacity = self.pool.size() + max(getattr(self.pool, '_max_overflow', 0), 0)
+        return self.pool.checkedout() / capacity if capacity > 0 else None
+
+    def saturated(self):
+        utilization = self.pool_utilization()
+        return self.pool_wait_ms > self.pool_wait_target_ms or (utilization is not None and utilization >= 1)
+
+    def effective_limit(self, route_class, saturated):
+        if route_class.name == TRANSFERS or not saturated:
+            return route_class.limit
+        if route_class.name == READS:
+            return max(1, route_class.limit // 2)
+        return min(1, route_class.limit)
+
+    def _can_admit(self, route_class):
+        if route_class.name == BULK and self.classes[TRANSFERS].queued:
+            return False
+        return route_class.in_flight < self.effective_limit(route_class, self.saturated())
+
+    def acquire(self, name, deadline=None):
+        """Admit a request of class ``name``, waiting in its queue if needed. False means shed it.
+
+        ``deadline`` (seconds left for the request) shortens the class's maximum wait.
+        """
+        route_class = self.classes[name]
+        max_wait = route_class.max_wait if deadline is None else max(0.0, min(route_class.max_wait, deadline))
+        with self._condition:
+            if self._can_admit(route_class):
+                route_class.in_flight += 1
+                route_class.admitted += 1
+                return True
+            if route_class.queued >= route_class.queue:
+                route_class.shed += 1
+                return False
+            route_class.queued += 1
+            started = time.monotonic()
+            admitted = self._condition.wait_for(lambda: self._can_admit(route_class), max_wait)
+            route_class.queued -= 1
+            waited_ms = (time.monotonic() - started) * 1000
+            route_class.queue_wait_ms += SMOOTHING * (waited_ms - route_class.queue_wait_ms)
+            if not admitted:
+                route_class.timed_out += 1
+                route_class.shed += 1
+                # Leaving the queue can unblock bulk requests held back for queued transfers
+                self._condition.notify_all()
+                return False
+            route_class.in_flight += 1
+            route_class.admitted += 1
+            return True
+
+    def release(self, name):
+        with self._condition:
+            self.classes[name].in_flight -= 1
+            self._condition.notify_all()
+
+    def record_pool_wait(self, waited_ms):
+        with self._condition:
+            self.pool_wait_ms += SMOOTHING * (waited_ms - self.pool_wait_ms)
+            self._condition.notify_all()
+
+    def metrics(self):
+        with self._condition:
+            saturated = self.saturated()
+            utilization = self.pool_utilization()
+            return {
+                'classes': {name: route_class.metrics(self.effective_limit(route_class, saturated))
+                            for name, route_class in self.classes.items()},
+                'pool': {
+                    'saturated': saturated,
+                    'utilization': None if utilization is None else round(utilization, 3),
+                    'wait_ms': round(self.pool_wait_ms, 2),
+                    'wait_target_ms': self.pool_wait_target_ms,
+                },
+            }
+
+
+def shed_response(controller, route_class):
+    response = jsonify({'error': f'Server is busy; retry the {route_class} request later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(controller.retry_after)
+    return response
+
+
+def admit(route_class, deadline_ms=None):
+    """Run the endpoint only once the admission controller admits a ``route_class`` request.
+
+    The request's deadline starts here: ``deadline_ms``, or the class default
+    from ``DEADLINE_DEFAULTS_MS`` when None. ``0`` means no default deadline.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            default = deadline_ms
+            if default is None:
+                default = current_app.config['DEADLINE_DEFAULTS_MS'].get(route_class, 0)
+            try:
+                deadlines.begin(default)
+            except ValueError as e:
+                return {'error': str(e)}, 400
+            controller = current_app.extensions.get('admission')
+            if controller is None:
+                return f(*args, **kwargs)
+            if not controller.acquire(route_class, deadlines.remaining()):
+                return shed_response(controller, route_class)
+            if route_class != BULK:
+                # Bulk requests may parse large bodies before their first query
+                g.admitted_at = time.perf_counter()
+            try:
+                response = f(*args, **kwargs)
+            except Exception:
+                controller.release(route_class)
+                raise
+            if isinstance(response, Response) and response.is_streamed:
+                # Streams keep their slot until the last chunk is sent
+                response.call_on_close(lambda: controller.release(route_class))
+            else:
+                controller.release(route_class)
+            return response
+        return decorated_function
+    return decorator
+
+
+@event.listens_for(Session, 'after_begin')
+def _record_pool_wait(session, transaction, connection):
+    # Time from admission to the request's first connection approximates the pool wait
+    if not has_request_context() or 'admitted_at' not in g:
+        return
+    controller = current_app.extensions.get('admission')
+    if controller is not None:
+        controller.record_pool_wait((time.perf_counter() - g.pop('admitted_at')) * 1000)
+
+
+def init_admission(app):
+    if not app.config['ADMISSION_ENABLED']:
+        return
+    with app.app_context():
+        from app import db
+        pool = db.engine.pool
+    app.extensions['admission'] = AdmissionController.from_config(app.config, pool)
+
+    @app.route('/metrics/admission')
+    def admission_metrics():
+        return current_app.extensions['admission'].metrics()
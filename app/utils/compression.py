@@ -0,0 +1,129 @@
+import os
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encoders():
+    """Supported encodings in server preference order."""
+    encoders = {}
+    if zstandard is not None:
+        encoders['zstd'] = _ZstdEncoder
+    if brotli is not None:
+        encoders['br'] = _BrotliEncoder
+    encoders['gzip'] = _GzipEncoder
+    return encoders
+
+
+def negotiate_encoding(accept_encodings, allowed):
+    """Pick the best encoding the client accepts, honouring q-values, or None."""
+    best, best_quality = None, 0
+    for encoding in allowed:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compress_stream(chunks, encoder):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """Compress eligible responses with the encoding negotiated from Accept-Encoding.
+
+    Buffered bodies are compressed when they reach COMPRESS_MIN_SIZE; streamed
+    bodies are always compressed, chunk by chunk, so the body is never held in
+    memory as a whole.
+    """
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or request.method == 'HEAD':
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return response
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoders = {name: encoder for name, encoder in available_encoders().items()
+                if name in config['COMPRESS_ENCODINGS']}
+    encoding = negotiate_encoding(request.accept_encodings, encoders)
+    if encoding is None:
+        return response
+    encoder = encoders[encoding](config['COMPRESS_LEVEL'].get(encoding, 6))
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoder)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(encoder.compress(body) + encoder.finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESS_ENABLED', os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true')
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.getenv('COMPRESS_MIN_SIZE', 1024)))
+    app.config.setdefault('COMPRESS_ENCODINGS', ('zstd', 'br', 'gzip'))
+    app.config.setdefault('COMPRESS_LEVEL', {'gzip': 6, 'br': 4, 'zstd': 3})
+    app.config.setdefault('COMPRESS_MIMETYPES', (
+        'application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv',
+    ))
+    app.after_request(compress_response)
@@ -0,0 +1,134 @@
+"""Request deadlines, enforced on every SQL statement the request runs.
+
+A request's budget is the ``X-Request-Timeout-Ms`` header if the client sent
+one, otherwise its route's default (see ``admission.admit``), and never more
+than ``DEADLINE_MAX_MS``. Before each statement the remaining budget is
+applied to the connection: ``SET LOCAL statement_timeout`` on PostgreSQL, a
+progress handler that interrupts the statement on SQLite. On PostgreSQL the
+timeout is set through its own cursor, since a server-side cursor executes
+only once, and set again only once it is ``STATEMENT_TIMEOUT_SLACK_MS`` old.
+A statement started with no budget left, or cancelled because the budget ran
+out, raises DeadlineExceeded, which the API answers with ``504``.
+"""
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HEADER = 'X-Request-Timeout-Ms'
+
+# SQLite VM instructions between deadline checks
+SQLITE_PROGRESS_STEPS = 10000
+
+# PostgreSQL's query_canceled, raised when statement_timeout fires
+QUERY_CANCELED = '57014'
+
+# A statement timeout set this long ago may let a statement overrun the deadline by as
+# much, so it is set again; within it, a transaction's statements share one SET
+STATEMENT_TIMEOUT_SLACK_MS = 50
+
+_APPLIED_TIMEOUT = 'deadline_statement_timeout'
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, message='Request deadline exceeded'):
+        super().__init__(message)
+
+
+def begin(default_ms):
+    """Start the current request's deadline. Raises ValueError for a malformed header."""
+    value = request.headers.get(HEADER)
+    if value is not None:
+        try:
+            budget = int(value)
+        except ValueError:
+            budget = 0
+        if budget <= 0:
+            raise ValueError(f'{HEADER} must be a positive integer')
+    else:
+        budget = default_ms
+    if budget:
+        g.deadline = time.monotonic() + min(budget, current_app.config['DEADLINE_MAX_MS']) / 1000
+
+
+def remaining():
+    """Seconds left for the current request, or None when it has no deadline."""
+    if not has_request_context() or 'deadline' not in g:
+        return None
+    return g.deadline - time.monotonic()
+
+
+def lift():
+    """Drop the route's default deadline, e.g. for a stream; a client's own header still applies."""
+    if HEADER not in request.headers:
+        g.pop('deadline', None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _apply_deadline(conn, cursor, statement, parameters, context, executemany):
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded()
+    if conn.dialect.name == 'postgresql':
+        _set_statement_timeout(conn, cursor, left)
+    elif conn.dialect.name == 'sqlite':
+        deadline = g.deadline
+        cursor.connection.set_progress_handler(lambda: time.monotonic() > deadline, SQLITE_PROGRESS_STEPS)
+
+
+def _set_statement_timeout(conn, cursor, left):
+    applied = conn.info.get(_APPLIED_TIMEOUT)
+    now = time.monotonic()
+    if applied is not None and applied[0] == g.deadline and now - applied[1] <= STATEMENT_TIMEOUT_SLACK_MS / 1000:
+        return
+    # Named (server-side) cursors run exactly one statement, so the SET gets its own plain cursor
+    plain = cursor.connection.cursor()
+    try:
+        plain.execute(f'SET LOCAL statement_timeout = {max(1, int(left * 1000))}')
+    finally:
+        plain.close()
+    conn.info[_APPLIED_TIMEOUT] = (g.deadline, now)
+
+
+@event.listens_for(Engine, 'begin')
+def _forget_statement_timeout(conn):
+    # SET LOCAL ends with the transaction it was issued in
+    conn.info.pop(_APPLIED_TIMEOUT, None)
+
+
+def _clear_progress_handler(dbapi_connection):
+    if dbapi_connection is not None and hasattr(dbapi_connection, 'set_progress_handler'):
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _clear_deadline(conn, cursor, statement, parameters, context, executemany):
+    if conn.dialect.name == 'sqlite' and remaining() is not None:
+        _clear_progress_handler(cursor.connection)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _translate_cancellation(context):
+    if remaining() is None:
+        return None
+    if context.dialect.name == 'sqlite' and context.connection is not None:
+        _clear_progress_handler(context.connection.connection.dbapi_connection)
+    error = context.original_exception
+    cancelled = getattr(error, 'pgcode', None) == QUERY_CANCELED or str(error) == 'interrupted'
+    if cancelled and remaining() <= 0:
+        return DeadlineExceeded()
+    return None
+
+
+def init_deadlines(app, api):
+    @api.errorhandler(DeadlineExceeded)
+    @app.errorhandler(DeadlineExceeded)
+    def deadline_exceeded(error):
+        return {'error': str(error)}, 504
+
+    @app.teardown_request
+    def _end_deadline(exc):
+        g.pop('deadline', None)
@@ -0,0 +1,38 @@
+from datetime import datetime
+from decimal import Decimal
+from flask import request
+
+
+def requested_fields(allowed):
+    """Parse the ``fields`` query parameter into a list of field names.
+
+    Returns None when the parameter is absent and raises ValueError for empty
+    or unknown fields.
+    """
+    value = request.args.get('fields')
+    if value is None:
+        return None
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if not fields or unknown:
+        raise ValueError(f'fields must be a comma-separated subset of: {", ".join(allowed)}')
+    return fields
+
+
+def requested_includes(allowed):
+    """Parse the ``include`` query parameter into a set of relation names."""
+    value = request.args.get('include')
+    if value is None:
+        return None
+    includes = {name.strip() for name in value.split(',') if name.strip()}
+    if includes - set(allowed):
+        raise ValueError(f'include must be a comma-separated subset of: {", ".join(allowed)}')
+    return includes
+
+
+def serialize_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
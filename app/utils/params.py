@@ -0,0 +1,47 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp into a naive UTC datetime.
+
+    Returns None for empty values and raises ValueError for malformed ones.
+    """
+    if not value:
+        return None
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_key_list(value, name, limit):
+    """Validate a JSON list of non-empty strings of at most ``limit`` items.
+
+    Duplicates are kept so callers can answer every key they were given.
+    """
+    if not isinstance(value, list) or not all(isinstance(key, str) and key for key in value):
+        raise ValueError(f'{name} must be a list of non-empty strings')
+    if len(value) > limit:
+        raise ValueError(f'{name} accepts at most {limit} items')
+    return value
+
+
+def encode_cursor(values):
+    """An opaque keyset cursor for the sort key ``values`` of the last row of a page."""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Inverse of ``encode_cursor``. Raises ValueError unless it holds ``size`` strings."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise ValueError('Invalid cursor')
+    return values
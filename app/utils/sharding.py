@@ -0,0 +1,201 @@
+"""Store-keyed shards: the shard map, request routing and per-shard loops.
+
+``SHARD_DATABASE_URLS`` lists the shard databases. Every store belongs to one
+shard: the one named for it in ``SHARD_MAP`` (``STORE-001=0,STORE-002=1``),
+otherwise ``crc32(store_id) % len(shards)``. Requests naming a store, in the
+path or in a ``store_id`` query parameter, run their whole session on that
+store's shard.
+
+Endpoints that read or write inventory across stores without naming one
+either fan out (``fan_out``), route to the single shard of the stores they
+name, or answer ``400`` (``store_scoped``, ``unsharded``). Maintenance
+commands run once per shard (``each_shard``), or refuse to start (``refuse``).
+
+Services import this module rather than ``app.services.shards``, which
+depends on most of them.
+"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import click
+from flask import current_app, request
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.main import db
+from app.utils.sql import ROUTED_BIND, SHARD_KEY
+
+
+class CrossShardError(Exception):
+    """A single-transaction operation names stores on more than one shard."""
+
+
+def shard_urls(urls):
+    """Name the shards of a comma-separated URL list ``shard0``, ``shard1``, ..."""
+    return {f'shard{index}': url for index, url in enumerate(url.strip() for url in urls.split(',') if url.strip())}
+
+
+def parse_shard_map(value):
+    """Parse ``STORE-001=0,STORE-002=1`` into ``{'STORE-001': 'shard0', ...}``."""
+    assignments = {}
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        store_id, _, index = item.rpartition('=')
+        if not store_id or not index.isdigit():
+            raise ValueError(f'Invalid SHARD_MAP entry: {item!r}')
+        assignments[store_id] = f'shard{index}'
+    return assignments
+
+
+def init_sharding(app):
+    """Create the shard engines and route store-scoped requests to them."""
+    urls = shard_urls(app.config['SHARD_DATABASE_URLS'])
+    if not urls:
+        return
+    assignments = parse_shard_map(app.config['SHARD_MAP'])
+    unknown = set(assignments.values()) - set(urls)
+    if unknown:
+        raise ValueError(f'SHARD_MAP names unknown shards: {", ".join(sorted(unknown))}')
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    app.extensions['shards'] = {
+        'keys': list(urls),
+        'map': assignments,
+        'engines': {key: create_engine(url, **{
+            **options, 'execution_options': {**options.get('execution_options', {}), SHARD_KEY: key}
+        }) for key, url in urls.items()},
+    }
+    app.before_request(_route_request)
+    app.teardown_request(_unroute_request)
+
+
+def shard_keys(app=None):
+    """Names of the shards, empty when sharding is off."""
+    return (app or current_app).extensions.get('shards', {}).get('keys', [])
+
+
+def enabled(app=None):
+    return bool(shard_keys(app))
+
+
+def engine(key, app=None):
+    return (app or current_app).extensions['shards']['engines'][key]
+
+
+def locate(store_id, keys, assignments):
+    """The shard of ``store_id`` among ``keys``, given the ``SHARD_MAP`` assignments."""
+    if store_id in assignments:
+        return assignments[store_id]
+    return keys[zlib.crc32(store_id.encode('utf-8')) % len(keys)]
+
+
+def shard_for(store_id, app=None):
+    config = (app or current_app).extensions['shards']
+    return locate(store_id, config['keys'], config['map'])
+
+
+def layout(key, app=None):
+    """Shard ``key`` with the shard map, as a picklable ``(key, keys, assignments)`` for worker processes."""
+    config = (app or current_app).extensions['shards']
+    return key, list(config['keys']), dict(config['map'])
+
+
+def holds(shard, store_id):
+    """Whether the shard described by ``layout`` holds ``store_id``; any store when ``shard`` is None."""
+    return shard is None or locate(store_id, *shard[1:]) == shard[0]
+
+
+def route(session, store_ids):
+    """Run ``session`` on the shard of ``store_ids``; raises CrossShardError if they span shards."""
+    keys = {shard_for(store_id) for store_id in store_ids}
+    if len(keys) > 1:
+        raise CrossShardError('Stores are on different shards; submit them separately')
+    if keys:
+        session.info[ROUTED_BIND] = engine(keys.pop())
+
+
+def _route_request():
+    store_id = (request.view_args or {}).get('store_id') or request.args.get('store_id')
+    if store_id:
+        route(db.session, [store_id])
+
+
+def _unroute_request(exc):
+    db.session.info.pop(ROUTED_BIND, None)
+
+
+def routed(session):
+    """Whether ``session`` runs on a shard."""
+    return session.info.get(ROUTED_BIND) is not None
+
+
+def store_scoped(f):
+    """Answer ``400`` when sharding is on and the request names no store, as only shards hold inventory."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if enabled() and not routed(db.session):
+            return {'error': 'store_id is required while sharding is on'}, 400
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def unsharded(f):
+    """Answer ``400`` when sharding is on, for endpoints that need every store in one database."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if enabled():
+            return {'error': 'Not available while sharding is on'}, 400
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def each_shard():
+    """Route ``db.session`` to each shard in turn and yield its key; yield None once when sharding is off.
+
+    Maintenance commands loop over it, so they cover every database that holds
+    inventory; ``db.session.get_bind()`` is the shard's engine.
+    """
+    if not enabled():
+        yield None
+        return
+    for key in shard_keys():
+        db.session.close()
+        db.session.info[ROUTED_BIND] = engine(key)
+        try:
+            yield key
+        finally:
+            db.session.close()
+            db.session.info.pop(ROUTED_BIND, None)
+
+
+def tagged(key, result):
+    """A command's result for one shard, labelled with the shard when sharding is on."""
+    return result if key is None else {'shard': key, **result}
+
+
+def refuse(command):
+    """Stop a command that cannot run per shard."""
+    if enabled():
+        raise click.UsageError(f'{command} is not available while sharding is on')
+
+
+def shard_session(key):
+    """A standalone session on one shard."""
+    return Session(bind=engine(key))
+
+
+def create_all(app=None):
+    """Create every table on every shard, as ``db.create_all`` does on the catalog."""
+    for key in shard_keys(app):
+        db.metadata.create_all(engine(key, app))
+
+
+def fan_out(query):
+    """Run an ORM query on every shard in parallel and return the rows, shard by shard."""
+    engines = [engine(key) for key in shard_keys()]
+
+    def run(bind):
+        with Session(bind=bind) as session:
+            return query.with_session(session).all()
+
+    with ThreadPoolExecutor(max_workers=len(engines)) as pool:
+        return [row for rows in pool.map(run, engines) for row in rows]
@@ -0,0 +1,38 @@
+from flask_sqlalchemy.session import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+ROUTED_BIND = 'routed_bind'
+
+# Execution option naming the shard a connection belongs to
+SHARD_KEY = 'shard_key'
+
+
+def dialect_insert(connection, table):
+    """Return an INSERT construct with ON CONFLICT support for the connection's dialect."""
+    if connection.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    if connection.dialect.name == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f'Upserts are not supported on {connection.dialect.name}')
+
+
+def upsert_add(connection, table, rows, key_columns, add_columns):
+    """Insert rows, or add their ``add_columns`` onto existing rows with the same key."""
+    if not rows:
+        return
+    statement = dialect_insert(connection, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={name: table.c[name] + statement.excluded[name] for name in add_columns}
+    )
+    connection.execute(statement, rows)
+
+
+class RoutingSession(Session):
+    """``db.session`` that sends every statement to ``info['routed_bind']`` when it is set."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        routed = self.info.get(ROUTED_BIND)
+        if bind is None and routed is not None:
+            return routed
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,67 @@
+"""Gunicorn settings, driven by the environment.
+
+GUNICORN_WORKER_CLASS picks the concurrency model:
+
+- ``gthread`` (default): WEB_CONCURRENCY processes with GUNICORN_THREADS
+  threads each. Threads release the GIL while they wait on PostgreSQL.
+- ``gevent``: WEB_CONCURRENCY processes with up to GUNICORN_WORKER_CONNECTIONS
+  greenlets each. psycopg2 is made cooperative in every worker, so a query
+  yields to other requests instead of blocking the process.
+- ``sync``: one request at a time per process.
+
+Each worker's database pool is sized from its concurrency (DB_POOL_SIZE and
+DB_MAX_OVERFLOW, read by ``create_app``) unless those are set explicitly.
+The whole deployment opens at most workers x (pool size + overflow)
+connections to PostgreSQL.
+"""
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in ('sync', 'gthread', 'gevent'):
+    raise ValueError(f'Unsupported GUNICORN_WORKER_CLASS: {worker_class}')
+
+bind = os.getenv('GUNICORN_BIND', f'0.0.0.0:{os.getenv("PORT", "8000")}')
+workers = int(os.getenv('WEB_CONCURRENCY', 2 * cores + 1 if worker_class == 'sync' else cores))
+threads = int(os.getenv('GUNICORN_THREADS', 4)) if worker_class == 'gthread' else 1
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# The app opens its engine at import time; loading it once per worker keeps
+# pooled connections from being shared across forks.
+preload_app = False
+
+
+def pool_sizes():
+    """``(pool_size, max_overflow)`` for one worker."""
+    if worker_class == 'gevent':
+        # Greenlets beyond the pool wait for a connection instead of opening more
+        return min(worker_connections, int(os.getenv('DB_POOL_MAX', 20))), 0
+    # One extra connection each for background threads (group commit, streams)
+    return threads, 2
+
+
+pool_size, max_overflow = pool_sizes()
+os.environ.setdefault('DB_POOL_SIZE', str(pool_size))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(max_overflow))
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    server.log.info('Worker %s: %s, %s threads, %s connections, db pool %s+%s', worker.pid, worker_class,
+                    threads, worker_connections if worker_class == 'gevent' else threads,
+                    os.environ['DB_POOL_SIZE'], os.environ['DB_MAX_OVERFLOW'])
@@ -0,0 +1,97 @@
+"""Measure bytes saved and CPU cost of response compression per endpoint.
+
+Seeds a temporary SQLite database (unless DATABASE_URL is already set), then
+requests each endpoint with every available encoding and reports the average
+body size and CPU time per request as JSON:
+
+    python scripts/bench_compression.py --products 2000 --stores 5 --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(db, products, stores):
+    from app.models.inventory import Inventory
+    from app.models.product import Product
+
+    store_ids = [f'BENCH-STORE-{index}' for index in range(stores)]
+    for index in range(products):
+        product = Product(id=str(uuid.uuid4()), name=f'Benchmark product {index}',
+                          description='Compression benchmark product with a realistic description',
+                          category=f'Category {index % 20}', price=9.99, sku=f'BENCH-{index:07d}')
+        db.session.add(product)
+        for store_id in store_ids:
+            db.session.add(Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id=store_id,
+                                     quantity=index % 50, min_stock=10))
+    db.session.commit()
+    return store_ids
+
+
+def measure(client, path, encoding, repeat):
+    """Average end-to-end CPU time per request in ms, plus the last body."""
+    headers = {'Accept-Encoding': encoding} if encoding != 'identity' else {}
+    body, cpu = b'', 0.0
+    for _ in range(repeat):
+        started = time.process_time()
+        response = client.get(path, headers=headers)
+        cpu += time.process_time() - started
+        body = response.data
+        assert response.headers.get('Content-Encoding', 'identity') == encoding, response.headers
+    return body, cpu / repeat * 1000
+
+
+def encode_cost(encoder_class, level, body, repeat):
+    """Average CPU time in ms spent only on compressing ``body``."""
+    started = time.process_time()
+    for _ in range(repeat):
+        encoder = encoder_class(level)
+        encoder.compress(body)
+        encoder.finish()
+    return (time.process_time() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--stores', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkstemp(suffix=".db")[1]}')
+    from app.main import app, db
+    from app.utils.compression import available_encoders
+
+    encoders = available_encoders()
+    with app.app_context():
+        store_ids = seed(db, args.products, args.stores)
+        client = app.test_client()
+        paths = [f'/api/stores/{store_ids[0]}/inventory', '/api/inventory/alerts',
+                 '/api/products?per_page=100']
+        results = []
+        for path in paths:
+            body, baseline_cpu = measure(client, path, 'identity', args.repeat)
+            for encoding, encoder_class in encoders.items():
+                encoded, cpu = measure(client, path, encoding, args.repeat)
+                level = app.config['COMPRESS_LEVEL'].get(encoding, 6)
+                results.append({
+                    'path': path,
+                    'encoding': encoding,
+                    'identity_bytes': len(body),
+                    'encoded_bytes': len(encoded),
+                    'saved_pct': round(100 * (1 - len(encoded) / len(body)), 1),
+                    'request_cpu_ms': round(baseline_cpu, 2),
+                    'request_cpu_ms_encoded': round(cpu, 2),
+                    'compression_cpu_ms': round(encode_cost(encoder_class, level, body, args.repeat), 3),
+                })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
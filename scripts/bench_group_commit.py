@@ -0,0 +1,118 @@
+"""Compare transfer throughput with and without the group-commit scheduler.
+
+Every thread posts small transfers between a handful of stores through the
+Flask test client, first with one commit per request and then through the
+scheduler for each window/max-batch combination. Reports operations per
+second, latency percentiles, errors and the mean batch size as JSON:
+
+    DATABASE_URL=postgresql://... python scripts/bench_group_commit.py --threads 32 --windows 1 2 5 --batches 16 64
+
+Without DATABASE_URL a temporary SQLite database is used. The gain comes from
+amortizing commit (fsync) latency, so it is largest on a durable PostgreSQL.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STORES = [f'BENCH-GC-{index}' for index in range(8)]
+STOCK = 10 ** 9
+
+
+def seed(db):
+    from app.models.inventory import Inventory
+    from app.models.product import Product
+
+    product = Product(id=str(uuid.uuid4()), name='Group commit item', category='Bench', price=1,
+                      sku=f'GC-{uuid.uuid4().hex[:8]}')
+    db.session.add(product)
+    db.session.add_all([Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id=store_id,
+                                  quantity=STOCK, min_stock=0) for store_id in STORES])
+    db.session.commit()
+    return product.id
+
+
+def run(app, product_id, threads, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            source, target = random.sample(STORES, 2)
+            started = time.perf_counter()
+            response = client.post('/api/inventory/transfer', json={
+                'product_id': product_id, 'source_store_id': source, 'target_store_id': target, 'quantity': 1
+            })
+            if response.status_code == 201:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors.append(response.status_code)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        'ops': len(latencies),
+        'ops_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--windows', type=float, nargs='+', default=[1, 2, 5])
+    parser.add_argument('--batches', type=int, nargs='+', default=[16, 64])
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkstemp(suffix=".db")[1]}')
+    from app.main import app, db
+    from app.services import adjustments
+    from app.services.group_commit import GroupCommitScheduler
+
+    batch_sizes = []
+    apply_movements = adjustments.apply_movements
+
+    def counting(session, groups):
+        batch_sizes.append(len(groups))
+        return apply_movements(session, groups)
+
+    adjustments.apply_movements = counting
+
+    with app.app_context():
+        product_id = seed(db)
+    app.extensions.pop('group_commit', None)
+    results = [{'mode': 'direct', 'window_ms': None, 'max_batch': None, 'threads': args.threads,
+                **run(app, product_id, args.threads, args.seconds)}]
+    for window in args.windows:
+        for max_batch in args.batches:
+            batch_sizes.clear()
+            app.extensions['group_commit'] = GroupCommitScheduler(app, window, max_batch)
+            result = run(app, product_id, args.threads, args.seconds)
+            mean_batch = round(sum(batch_sizes) / len(batch_sizes), 1) if batch_sizes else None
+            results.append({'mode': 'group', 'window_ms': window, 'max_batch': max_batch, 'threads': args.threads,
+                            **result, 'mean_batch': mean_batch})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Measure decrement throughput on one contended inventory row, with and without counter slots.
+
+Every thread repeatedly takes one unit from the same (product, store) row and
+commits, first against the plain row and then in hot-row mode with each slot
+count. Reports operations per second, latency percentiles and errors as JSON:
+
+    DATABASE_URL=postgresql://... python scripts/bench_hot_counters.py --threads 32 --slots 1 4 16
+
+Without DATABASE_URL a temporary SQLite database is used. SQLite serializes all
+writers on one database lock, so slot counts only change throughput on
+PostgreSQL, where each slot is its own row lock.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STOCK = 10 ** 9
+
+
+def seed(db):
+    from app.models.inventory import Inventory
+    from app.models.product import Product
+
+    product = Product(id=str(uuid.uuid4()), name='Flash sale item', category='Bench', price=1,
+                      sku=f'HOT-{uuid.uuid4().hex[:8]}')
+    inventory = Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id='BENCH-HOT',
+                          quantity=STOCK, min_stock=0)
+    db.session.add_all([product, inventory])
+    db.session.commit()
+    return inventory.id, (product.id, 'BENCH-HOT')
+
+
+def row_decrement(db, inventory_id, key):
+    from app.models.inventory import Inventory
+
+    table = Inventory.__table__
+    db.session.execute(
+        db.update(table).where(table.c.id == inventory_id, table.c.quantity >= 1)
+        .values(quantity=table.c.quantity - 1)
+    )
+
+
+def slot_decrement(db, inventory_id, key):
+    from app.services import counters
+
+    counters.adjust(db.session, counters.hot_rows(db.session, [key])[key], *key, -1)
+
+
+def run(app, db, operation, inventory_id, key, threads, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    operation(db, inventory_id, key)
+                    db.session.commit()
+                    latencies.append(time.perf_counter() - started)
+                except Exception as e:  # lock timeouts and deadlocks count as errors
+                    db.session.rollback()
+                    errors.append(type(e).__name__)
+            db.session.remove()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        'ops': len(latencies),
+        'ops_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--slots', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkstemp(suffix=".db")[1]}')
+    from app.main import app, db
+    from app.services import counters
+
+    results = []
+    with app.app_context():
+        inventory_id, key = seed(db)
+        result = run(app, db, row_decrement, inventory_id, key, args.threads, args.seconds)
+        results.append({'mode': 'row', 'slots': None, 'threads': args.threads, **result})
+        for slots in args.slots:
+            counters.enable(db.session, inventory_id, slots)
+            db.session.commit()
+            result = run(app, db, slot_decrement, inventory_id, key, args.threads, args.seconds)
+            results.append({'mode': 'slots', 'slots': slots, 'threads': args.threads, **result})
+        counters.disable(db.session, inventory_id)
+        db.session.commit()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
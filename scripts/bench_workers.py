@@ -0,0 +1,166 @@
+"""Compare gunicorn worker classes: throughput, latency and throughput per CPU second.
+
+Starts gunicorn with gunicorn.conf.py once per worker class, drives read
+endpoints from keep-alive client threads, then stops the server and charges
+the CPU time its processes used. Reports JSON:
+
+    DATABASE_URL=postgresql://... python scripts/bench_workers.py --modes sync gthread gevent --clients 64
+
+``requests_per_cpu_second`` is the throughput per core: the modes differ in
+how much of each core they keep busy while requests wait on the database, so
+compare it together with ``requests_per_second``. Without DATABASE_URL a
+temporary SQLite database is used, which has no network waits to overlap.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+STORES = [f'BENCH-W-{index}' for index in range(4)]
+
+
+def seed(products):
+    from app.main import app, db
+    from app.models.inventory import Inventory
+    from app.models.product import Product
+
+    with app.app_context():
+        for index in range(products):
+            product = Product(id=str(uuid.uuid4()), name=f'Worker bench {index}', category='Bench', price=1,
+                              sku=f'W-{uuid.uuid4().hex[:10]}')
+            db.session.add(product)
+            db.session.add_all([Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id=store_id,
+                                          quantity=index % 20, min_stock=10) for store_id in STORES])
+        db.session.commit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not become ready')
+
+
+def load(port, paths, clients, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        count = offset
+        while time.perf_counter() < deadline:
+            path = paths[count % len(paths)]
+            count += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors.append('connection')
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            if response.status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors.append(response.status)
+
+    pool = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, errors
+
+
+def run_mode(mode, args, paths):
+    port = free_port()
+    env = {**os.environ, 'GUNICORN_WORKER_CLASS': mode, 'GUNICORN_BIND': f'127.0.0.1:{port}',
+           'WEB_CONCURRENCY': str(args.workers), 'GUNICORN_THREADS': str(args.threads),
+           'GUNICORN_WORKER_CONNECTIONS': str(args.clients)}
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server = subprocess.Popen(['gunicorn', '--config', 'gunicorn.conf.py', 'app.main:app'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        latencies, errors = load(port, paths, args.clients, args.seconds)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Includes startup; the workers are reaped by the master, so their time is counted too
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        'mode': mode,
+        'workers': args.workers,
+        'threads': args.threads if mode == 'gthread' else 1,
+        'clients': args.clients,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / args.seconds, 1),
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'errors': len(errors),
+        'cpu_seconds': round(cpu, 2),
+        'requests_per_cpu_second': round(len(latencies) / cpu, 1) if cpu else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gthread', 'gevent'],
+                        choices=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--products', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkstemp(suffix=".db")[1]}')
+    seed(args.products)
+    paths = [f'/api/stores/{store_id}/inventory?fields=product_id,quantity' for store_id in STORES]
+    paths.append('/api/inventory/alerts?fields=product_id,store_id,missing_quantity')
+
+    results = []
+    for mode in args.modes:
+        if mode == 'gevent' and not (importlib.util.find_spec('gevent') and importlib.util.find_spec('psycogreen')):
+            results.append({'mode': mode, 'skipped': 'gevent and psycogreen are not installed'})
+            continue
+        results.append(run_mode(mode, args, paths))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
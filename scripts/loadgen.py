@@ -0,0 +1,325 @@
+"""Drive a running instance with a mixed workload and report latency per endpoint.
+
+Discovers the stores, products and stocked rows of the instance, then runs
+concurrent keep-alive clients for a fixed time. Each client repeatedly picks
+an operation by weight and waits for its response before sending the next:
+
+    python scripts/loadgen.py --url http://127.0.0.1:5000 --clients 64 --seconds 60 \\
+        --mix browse=50,store_inventory=20,alerts=10,transfer=15,create=5
+
+Operations:
+- ``browse``: product listing with a random category, price range or page.
+- ``store_inventory``: the first page of a random store's inventory.
+- ``alerts``: the low-stock alerts.
+- ``transfer``: one unit between two stores. Products are ranked in a random
+  (seeded) order and picked with Zipf weights ``1 / rank ** skew``, so a few
+  hot SKUs get most of the transfers. ``--skew 0`` spreads them evenly.
+- ``create``: a new product with a unique ``LOAD-`` SKU.
+
+Transfers and creates write to the instance, so run it against a disposable
+database such as one filled by ``db/seed.py``. Reports JSON: throughput,
+p50/p95/p99/max latency and error rate per operation. Latencies cover every
+response, errors included. An error is a response other than 2xx, or a
+connection that failed or timed out. Pass ``--seed`` to replay the same
+choices and compare runs.
+"""
+import argparse
+import asyncio
+import json
+import random
+import ssl
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+OPERATIONS = ('browse', 'store_inventory', 'alerts', 'transfer', 'create')
+DEFAULT_MIX = 'browse=50,store_inventory=20,alerts=10,transfer=15,create=5'
+
+# Products and stocked rows read to build the workload
+DISCOVERY_PAGE = 100
+STORE_PAGE = 5000
+
+BROWSE_PAGE = 20
+
+
+class Connection:
+    """One HTTP/1.1 keep-alive connection over asyncio streams."""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.tls = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.tls else 80)
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        """Send one request and return ``(status, body bytes)``. Raises OSError when it fails or times out."""
+        payload = b'' if body is None else json.dumps(body).encode()
+        head = [f'{method} {self.prefix}{path} HTTP/1.1', f'Host: {self.host}:{self.port}',
+                'Accept: application/json', f'Content-Length: {len(payload)}']
+        if body is not None:
+            head.append('Content-Type: application/json')
+        try:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=ssl.create_default_context() if self.tls
+                                            else None), self.timeout)
+            self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+            await self.writer.drain()
+            status, keep_alive, data = await asyncio.wait_for(self._read_response(), self.timeout)
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+            self.close()
+            raise OSError(f'{method} {path}: {e!r}') from e
+        if not keep_alive:
+            self.close()
+        return status, data
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by the server')
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        keep_alive = version == b'HTTP/1.1' and headers.get('connection') != 'close'
+        if 'chunked' in headers.get('transfer-encoding', ''):
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if not size:
+                    while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            data, keep_alive = await self.reader.read(), False
+        return int(status), keep_alive, data
+
+    async def get_json(self, path):
+        status, data = await self.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f'GET {path} returned {status}: {data[:200]!r}')
+        return json.loads(data)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Workload:
+    """Builds the requests of each operation from the instance's data."""
+
+    def __init__(self, store_ids, products, stock, skew, rng):
+        self.store_ids = store_ids
+        self.categories = sorted({product['category'] for product in products})
+        self.max_price = max((product['price'] for product in products), default=100)
+        self.pages = max(1, -(-len(products) // BROWSE_PAGE))
+        # Transfers need a stocked source and another store to send to
+        self.hot = sorted(stock) if len(store_ids) > 1 else []
+        rng.shuffle(self.hot)
+        self.stock = stock
+        self.hot_weights = []
+        total = 0
+        for rank in range(1, len(self.hot) + 1):
+            total += 1 / rank ** skew
+            self.hot_weights.append(total)
+
+    def browse(self, rng):
+        args = {'per_page': BROWSE_PAGE}
+        if self.categories and rng.random() < 0.7:
+            args['category'] = rng.choice(self.categories)
+        if rng.random() < 0.5:
+            low = round(rng.uniform(0, self.max_price), 2)
+            args.update(min_price=low, max_price=round(low + rng.uniform(0, self.max_price), 2))
+        # Pages past the end answer 404, so only unfiltered browsing goes deeper than the first page
+        args['page'] = 1 if len(args) > 1 else rng.randint(1, self.pages)
+        return 'GET', f'/api/products?{urlencode(args)}', None
+
+    def store_inventory(self, rng):
+        return 'GET', f'/api/stores/{rng.choice(self.store_ids)}/inventory?limit=100', None
+
+    def alerts(self, rng):
+        return 'GET', '/api/inventory/alerts', None
+
+    def transfer(self, rng):
+        product_id = rng.choices(self.hot, cum_weights=self.hot_weights)[0]
+        source = rng.choice(self.stock[product_id])
+        target = rng.choice([store_id for store_id in self.store_ids if store_id != source])
+        return 'POST', '/api/inventory/transfer', {'product_id': product_id, 'source_store_id': source,
+                                                   'target_store_id': target, 'quantity': 1}
+
+    def create(self, rng):
+        sku = f'LOAD-{uuid.UUID(int=rng.getrandbits(128)).hex[:12]}'
+        return 'POST', '/api/products', {'name': f'Load test {sku}', 'category': 'Load test',
+                                         'price': round(rng.uniform(1, 100), 2), 'sku': sku}
+
+    def missing(self, mix):
+        """Operations in ``mix`` the instance has no data for."""
+        needs = {'store_inventory': self.store_ids, 'transfer': self.hot}
+        return [name for name in mix if name in needs and not needs[name]]
+
+
+async def discover(url, timeout, products_sample):
+    connection = Connection(url, timeout)
+    try:
+        store_ids = [store['id'] for store in await connection.get_json('/api/stores')]
+        products, page = [], 1
+        while len(products) < products_sample:
+            data = await connection.get_json(
+                f'/api/products?fields=id,category,price&per_page={DISCOVERY_PAGE}&page={page}')
+            products += data['items']
+            if page >= data['pages']:
+                break
+            page += 1
+        stock = {}
+        for store_id in store_ids:
+            rows = await connection.get_json(f'/api/stores/{store_id}/inventory?fields=product_id,quantity'
+                                             f'&limit={STORE_PAGE}')
+            for row in rows:
+                if row['quantity'] > 0:
+                    stock.setdefault(row['product_id'], []).append(store_id)
+        return store_ids, products[:products_sample], stock
+    finally:
+        connection.close()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+
+    def record(self, status, seconds):
+        self.statuses['connection' if status is None else str(status)] += 1
+        if status is not None:
+            self.latencies.append(seconds)
+
+    def report(self, seconds):
+        requests = sum(self.statuses.values())
+        errors = sum(count for status, count in self.statuses.items() if not status.startswith('2'))
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+        return {
+            'requests': requests,
+            'requests_per_second': round(requests / seconds, 1),
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+            'errors': errors,
+            'error_rate': round(errors / requests, 4) if requests else None,
+            'statuses': dict(sorted(self.statuses.items())),
+        }
+
+
+async def client(args, workload, mix, stats, rng, record_from, deadline):
+    names, weights = list(mix), []
+    total = 0
+    for name in names:
+        total += mix[name]
+        weights.append(total)
+    connection = Connection(args.url, args.timeout)
+    try:
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, cum_weights=weights)[0]
+            method, path, body = getattr(workload, name)(rng)
+            started = time.perf_counter()
+            try:
+                status, _ = await connection.request(method, path, body)
+            except OSError:
+                status = None
+            if started >= record_from:
+                stats[name].record(status, time.perf_counter() - started)
+    finally:
+        connection.close()
+
+
+async def run(args, mix):
+    rng = random.Random(args.seed)
+    try:
+        store_ids, products, stock = await discover(args.url, args.timeout, args.products)
+    except (OSError, RuntimeError) as e:
+        raise SystemExit(f'Could not read the dataset from {args.url}: {e}')
+    workload = Workload(store_ids, products, stock, args.skew, rng)
+    missing = workload.missing(mix)
+    if missing:
+        raise SystemExit(f'The instance has no data for {", ".join(missing)}; seed it with db/seed.py')
+
+    stats = {name: Stats() for name in mix}
+    record_from = time.perf_counter() + args.warmup
+    deadline = record_from + args.seconds
+    await asyncio.gather(*(
+        client(args, workload, mix, stats, random.Random(rng.getrandbits(64)), record_from, deadline)
+        for _ in range(args.clients)
+    ))
+
+    totals = Stats()
+    for name in mix:
+        totals.latencies += stats[name].latencies
+        totals.statuses.update(stats[name].statuses)
+    return {
+        'url': args.url,
+        'clients': args.clients,
+        'seconds': args.seconds,
+        'mix': mix,
+        'skew': args.skew,
+        'seed': args.seed,
+        'dataset': {'stores': len(store_ids), 'products': len(products), 'transfer_products': len(workload.hot)},
+        'total': totals.report(args.seconds),
+        'endpoints': {name: stats[name].report(args.seconds) for name in mix},
+    }
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {name!r}; choose from {", ".join(OPERATIONS)}')
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'weight of {name} must be a number')
+        if weight < 0:
+            raise argparse.ArgumentTypeError(f'weight of {name} must not be negative')
+        if weight:
+            mix[name] = weight
+    if not mix:
+        raise argparse.ArgumentTypeError('the mix needs at least one operation with a positive weight')
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=0, help='Seconds of load before recording starts')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='Comma-separated operation=weight')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of transfer SKU popularity')
+    parser.add_argument('--products', type=int, default=1000, help='Products sampled for browsing and transfers')
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args, args.mix)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
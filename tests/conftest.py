@@ -13,7 +13,8 @@ def app():
     test_config = {
         'TESTING': True,
         'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
-        'SQLALCHEMY_TRACK_MODIFICATIONS': False
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'LEDGER_ARCHIVE_DIR': tempfile.mkdtemp()
     }
     app = create_app(test_config)
     init_db(app)
@@ -0,0 +1,65 @@
+import json
+from app.models.inventory import Inventory
+from app.models.movement import Movement, MovementType
+from app.models.rollup import MovementDailyRollup
+
+
+def adjust(client, lines, **options):
+    response = client.post('/api/inventory/adjustments', data=json.dumps({'lines': lines, **options}),
+                           content_type='application/json')
+    return response.status_code, json.loads(response.data)
+
+
+def line(inventory, type_, quantity, store_id=None):
+    return {'product_id': inventory.product_id, 'store_id': store_id or inventory.store_id,
+            'type': type_, 'quantity': quantity}
+
+
+def test_batch_applies_net_change_and_writes_movements(client, database, sample_inventory):
+    status, data = adjust(client, [line(sample_inventory, 'IN', 20), line(sample_inventory, 'OUT', 5),
+                                   line(sample_inventory, 'OUT', 115)])
+    assert status == 201
+    assert data['applied'] == 3
+    assert data['inventory'] == [{'product_id': sample_inventory.product_id, 'store_id': 'STORE-001', 'quantity': 0}]
+
+    database.session.expire_all()
+    assert Inventory.query.get(sample_inventory.id).quantity == 0
+    assert sorted(m.type.value for m in Movement.query) == ['IN', 'OUT', 'OUT']
+    out = MovementDailyRollup.query.filter_by(type=MovementType.OUT).one()
+    assert (out.units_out, out.movement_count) == (120, 2)
+
+
+def test_receipt_creates_missing_inventory_row(client, database, sample_inventory):
+    status, data = adjust(client, [line(sample_inventory, 'IN', 7, store_id='STORE-009')])
+    assert status == 201
+    row = Inventory.query.filter_by(store_id='STORE-009').one()
+    assert (row.quantity, row.min_stock) == (7, 0)
+
+
+def test_atomic_batch_rejects_everything_on_insufficient_stock(client, database, sample_inventory):
+    status, data = adjust(client, [line(sample_inventory, 'IN', 1), line(sample_inventory, 'OUT', 500),
+                                   line(sample_inventory, 'OUT', 1, store_id='STORE-404')])
+    assert status == 409
+    assert data['rejected'] == [{'index': 1, 'error': 'Insufficient stock'},
+                                {'index': 2, 'error': 'Inventory not found'}]
+    database.session.expire_all()
+    assert Inventory.query.get(sample_inventory.id).quantity == 100
+    assert Movement.query.count() == 0
+
+
+def test_non_atomic_batch_applies_valid_lines(client, database, sample_inventory):
+    status, data = adjust(client, [line(sample_inventory, 'OUT', 500), line(sample_inventory, 'OUT', 40)],
+                          atomic=False)
+    assert status == 201
+    assert data['applied'] == 1
+    assert data['rejected'] == [{'index': 0, 'error': 'Insufficient stock'}]
+    assert data['inventory'][0]['quantity'] == 60
+
+
+def test_malformed_lines_are_rejected(client, database, sample_inventory):
+    assert adjust(client, [])[0] == 400
+    assert adjust(client, [line(sample_inventory, 'TRANSFER', 1)])[0] == 400
+    assert adjust(client, [line(sample_inventory, 'IN', 0)])[0] == 400
+    status, data = adjust(client, [{**line(sample_inventory, 'IN', 1), 'product_id': 'missing'}])
+    assert status == 409
+    assert data['rejected'] == [{'index': 0, 'error': 'Product not found'}]
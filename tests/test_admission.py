@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+
+from app.utils.admission import BULK, READS, TRANSFERS, AdmissionController, parse_class_settings
+
+
+def controller(limits, queues=None, max_wait_ms=None, **kwargs):
+    def settings(overrides, default):
+        return {**{TRANSFERS: default, READS: default, BULK: default}, **(overrides or {})}
+
+    return AdmissionController(settings(limits, 10), settings(queues, 10), settings(max_wait_ms, 1000), **kwargs)
+
+
+def test_parse_class_settings_rejects_unknown_classes():
+    assert parse_class_settings('transfers=4, bulk=1', 'ADMISSION_LIMITS') == {TRANSFERS: 4, BULK: 1}
+    for value in ('jobs=1', 'bulk=x', 'bulk=-1'):
+        try:
+            parse_class_settings(value, 'ADMISSION_LIMITS')
+            assert False, f'expected ValueError for {value}'
+        except ValueError:
+            pass
+
+
+def test_excess_requests_are_shed_when_the_queue_is_full():
+    admission = controller({TRANSFERS: 1}, {TRANSFERS: 0})
+    assert admission.acquire(TRANSFERS)
+    assert not admission.acquire(TRANSFERS)
+    admission.release(TRANSFERS)
+    assert admission.acquire(TRANSFERS)
+    metrics = admission.metrics()['classes'][TRANSFERS]
+    assert (metrics['admitted'], metrics['shed'], metrics['in_flight']) == (2, 1, 1)
+
+
+def test_queued_request_waits_for_a_slot_or_times_out():
+    admission = controller({READS: 1}, {READS: 1}, {READS: 2000})
+    assert admission.acquire(READS)
+    threading.Timer(0.05, admission.release, [READS]).start()
+    assert admission.acquire(READS)  # admitted once the first one finished
+
+    admission = controller({READS: 1}, {READS: 1}, {READS: 20})
+    assert admission.acquire(READS)
+    assert not admission.acquire(READS)
+    assert admission.metrics()['classes'][READS]['timed_out'] == 1
+
+
+def test_saturated_pool_throttles_bulk_and_transfers_take_priority():
+    admission = controller({TRANSFERS: 1, BULK: 4}, max_wait_ms={TRANSFERS: 2000, BULK: 2000},
+                           pool_wait_target_ms=10)
+    for _ in range(20):
+        admission.record_pool_wait(100)
+    assert admission.metrics()['pool']['saturated']
+    assert admission.acquire(BULK)
+    assert admission.metrics()['classes'][BULK]['effective_limit'] == 1
+
+    assert admission.acquire(TRANSFERS)
+    order = []
+
+    def queued(name):
+        if admission.acquire(name):
+            order.append(name)
+
+    waiting_transfer = threading.Thread(target=queued, args=[TRANSFERS])
+    waiting_transfer.start()
+    time.sleep(0.05)
+    waiting_bulk = threading.Thread(target=queued, args=[BULK])
+    waiting_bulk.start()
+    time.sleep(0.05)
+
+    admission.release(BULK)  # frees a bulk slot, but a transfer is still queued
+    time.sleep(0.05)
+    assert order == []
+    admission.release(TRANSFERS)
+    waiting_transfer.join()
+    waiting_bulk.join()
+    assert order == [TRANSFERS, BULK]
+
+
+def test_endpoints_shed_with_retry_after(app, client, database, sample_inventory):
+    admission = controller({BULK: 0}, {BULK: 0}, retry_after=3)
+    app.extensions['admission'] = admission
+
+    response = client.get('/api/products')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+
+    response = client.post('/api/inventory/transfer', data=json.dumps({
+        'product_id': sample_inventory.product_id, 'source_store_id': 'STORE-001',
+        'target_store_id': 'STORE-002', 'quantity': 1
+    }), content_type='application/json')
+    assert response.status_code == 201
+
+    metrics = client.get('/metrics/admission').get_json()
+    assert metrics['classes'][BULK]['shed'] == 1
+    assert metrics['classes'][TRANSFERS]['admitted'] == 1
+    assert metrics['classes'][TRANSFERS]['in_flight'] == 0
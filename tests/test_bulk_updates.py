@@ -0,0 +1,91 @@
+import json
+import uuid
+from app.main import db
+from app.models.change import ChangeLog
+from app.models.inventory import Inventory
+from app.models.notification import LowStockOutbox
+from app.models.product import Product
+from app.services import counters
+
+
+def product(sku, category, price):
+    item = Product(id=str(uuid.uuid4()), name=sku, category=category, price=price, sku=sku)
+    db.session.add(item)
+    return item
+
+
+def post(client, url, payload):
+    response = client.post(url, data=json.dumps(payload), content_type='application/json')
+    return response.status_code, json.loads(response.data)
+
+
+def test_multiply_prices_in_category(client, database):
+    a, b, c = product('A', 'Tools', 10), product('B', 'Tools', 3.33), product('C', 'Toys', 5)
+    db.session.commit()
+    before = ChangeLog.query.count()
+    stamp = a.updated_at
+
+    status, data = post(client, '/api/products/bulk-update',
+                        {'filter': {'category': 'Tools'}, 'operation': {'op': 'multiply', 'value': 1.1}})
+    assert (status, data) == (200, {'updated': 2})
+
+    db.session.expire_all()
+    assert [float(p.price) for p in (a, b, c)] == [11.0, 3.66, 5.0]
+    assert a.updated_at > stamp
+    assert {change.entity_id for change in ChangeLog.query.all()[before:]} == {a.id, b.id}
+
+
+def test_add_skips_rows_that_would_go_negative(client, database):
+    a, b = product('A', 'Tools', 10), product('B', 'Tools', 1)
+    db.session.commit()
+    status, data = post(client, '/api/products/bulk-update',
+                        {'filter': {'skus': ['A', 'B']}, 'operation': {'op': 'add', 'value': -2}})
+    assert data == {'updated': 1}
+    db.session.expire_all()
+    assert (float(a.price), float(b.price)) == (8.0, 1.0)
+
+
+def test_set_min_stock_for_category_in_stores(client, database):
+    a, b = product('A', 'Tools', 10), product('B', 'Toys', 1)
+    rows = [Inventory(id=str(uuid.uuid4()), product_id=item.id, store_id=store, quantity=5, min_stock=1)
+            for item in (a, b) for store in ('S1', 'S2')]
+    db.session.add_all(rows)
+    db.session.commit()
+
+    status, data = post(client, '/api/inventory/bulk-update',
+                        {'filter': {'category': 'Tools', 'store_ids': ['S1']}, 'operation': {'op': 'set', 'value': 8}})
+    assert (status, data) == (200, {'updated': 1})
+    db.session.expire_all()
+    assert [(row.store_id, row.min_stock) for row in rows if row.min_stock != 1] == [('S1', 8)]
+    change = ChangeLog.query.order_by(ChangeLog.seq.desc()).first()
+    assert (change.entity, change.store_id) == ('inventory', 'S1')
+
+
+def test_min_stock_crossings_use_hot_row_slot_totals(client, database):
+    item = product('A', 'Tools', 10)
+    db.session.commit()
+    post(client, '/api/stores/STORE-005/inventory', {'product_id': item.id, 'quantity': 100, 'min_stock': 1})
+    inventory = Inventory.query.filter_by(product_id=item.id, store_id='STORE-005').one()
+    counters.enable(db.session, inventory.id, slots=4)
+    db.session.commit()
+    status, _ = post(client, '/api/inventory/adjustments', {'lines': [
+        {'product_id': item.id, 'store_id': 'STORE-005', 'type': 'OUT', 'quantity': 95}
+    ]})
+    assert status == 201
+
+    status, data = post(client, '/api/inventory/bulk-update',
+                        {'filter': {'skus': ['A']}, 'operation': {'op': 'set', 'value': 10}})
+    assert (status, data) == (200, {'updated': 1})
+    event = LowStockOutbox.query.filter_by(product_id=item.id, store_id='STORE-005').one()
+    assert (event.kind, event.quantity, event.min_stock) == ('low', 5, 10)
+    assert client.get('/api/stores/STORE-005/summary').get_json()['low_stock_count'] == 1
+
+
+def test_bulk_update_validation(client, database):
+    operation = {'op': 'set', 'value': 1}
+    assert post(client, '/api/products/bulk-update', {'filter': {}, 'operation': operation})[0] == 400
+    assert post(client, '/api/products/bulk-update', {'filter': {'color': 'red'}, 'operation': operation})[0] == 400
+    assert post(client, '/api/products/bulk-update',
+                {'filter': {'category': 'X'}, 'operation': {'op': 'divide', 'value': 2}})[0] == 400
+    assert post(client, '/api/inventory/bulk-update',
+                {'filter': {'store_ids': ['S1']}, 'operation': {'op': 'add', 'value': 1.5}})[0] == 400
@@ -0,0 +1,103 @@
+import json
+from app.main import db
+from app.models.change import ChangeLog
+from app.models.product import Product
+from app.services import changes
+
+
+def create_product(client, sku):
+    response = client.post('/api/products', data=json.dumps({
+        'name': 'Feed Product', 'category': 'Test', 'price': 5.0, 'sku': sku
+    }), content_type='application/json')
+    return json.loads(response.data)['id']
+
+
+def create_inventory(client, product_id, store_id, quantity=10):
+    client.post(f'/api/stores/{store_id}/inventory', data=json.dumps({
+        'product_id': product_id, 'quantity': quantity, 'min_stock': 2
+    }), content_type='application/json')
+
+
+def test_feed_lists_changes_in_commit_order(client, database):
+    product_id = create_product(client, 'FEED-1')
+    create_inventory(client, product_id, 'STORE-001')
+
+    response = client.get('/api/changes?since=0')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [(c['entity'], c['op']) for c in data['changes']] == [('product', 'upsert'), ('inventory', 'upsert')]
+    assert data['changes'][0]['seq'] < data['changes'][1]['seq']
+    assert data['changes'][1]['quantity'] == 10
+    assert data['next_since'] == data['changes'][1]['seq']
+    assert data['has_more'] is False
+
+    response = client.get(f'/api/changes?since={data["next_since"]}')
+    assert json.loads(response.data)['changes'] == []
+
+
+def test_feed_filters_by_store_and_records_deletes(client, database):
+    product_id = create_product(client, 'FEED-2')
+    create_inventory(client, product_id, 'STORE-001')
+    create_inventory(client, product_id, 'STORE-002')
+    other_id = create_product(client, 'FEED-3')
+    client.delete(f'/api/products/{other_id}')
+
+    data = json.loads(client.get('/api/changes?store_id=STORE-002').data)
+    assert [c['store_id'] for c in data['changes']] == ['STORE-002']
+
+    data = json.loads(client.get(f'/api/changes?product_id={other_id}').data)
+    assert [c['op'] for c in data['changes']] == ['upsert', 'delete']
+
+
+def test_rolled_back_writes_leave_no_changes(database, sample_product):
+    sample_product.price = 99
+    db.session.flush()
+    db.session.rollback()
+    before = ChangeLog.query.count()
+    db.session.add(Product(id='p-2', name='x', category='c', price=1, sku='RB-1'))
+    db.session.commit()
+    assert ChangeLog.query.count() == before + 1
+
+
+def test_bulk_writers_record_changes(client, database, sample_product):
+    create_inventory(client, sample_product.id, 'STORE-001', quantity=50)
+    create_inventory(client, sample_product.id, 'STORE-002', quantity=1)
+    since = json.loads(client.get('/api/changes').data)['next_since']
+    db.session.execute(db.text("UPDATE inventory SET min_stock = 10"))
+    db.session.commit()
+
+    client.post('/api/inventory/rebalance/plan', data=json.dumps({'apply': True}),
+                content_type='application/json')
+    data = json.loads(client.get(f'/api/changes?since={since}').data)
+    assert sorted((c['store_id'], c['quantity']) for c in data['changes']) == [('STORE-001', 41), ('STORE-002', 10)]
+
+
+def test_stream_pushes_changes_as_events(app, client, database):
+    app.config.update(CHANGES_STREAM_MAX_SECONDS=0.2, CHANGES_POLL_INTERVAL=0.05)
+    product_id = create_product(client, 'FEED-4')
+    create_inventory(client, product_id, 'STORE-001')
+
+    response = client.get('/api/changes/stream?store_id=STORE-001')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = [block for block in response.data.decode().split('\n\n') if block.startswith('id:')]
+    assert len(events) == 1
+    payload = json.loads(events[0].split('data: ', 1)[1])
+    assert payload['entity'] == 'inventory'
+    assert payload['store_id'] == 'STORE-001'
+
+
+def test_stream_resumes_from_last_event_id(app, client, database):
+    app.config.update(CHANGES_STREAM_MAX_SECONDS=0.1, CHANGES_POLL_INTERVAL=0.05)
+    create_product(client, 'FEED-5')
+    last = json.loads(client.get('/api/changes').data)['next_since']
+
+    response = client.get('/api/changes/stream', headers={'Last-Event-ID': str(last)})
+    assert 'event: change' not in response.data.decode()
+
+
+def test_notifier_wakes_waiters():
+    notifier = changes.ChangeNotifier()
+    notifier.notify(5)
+    assert notifier.wait(4, timeout=0) is True
+    assert notifier.wait(5, timeout=0.01) is False
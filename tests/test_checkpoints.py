@@ -0,0 +1,58 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from app.main import db
+from app.models.movement import Movement, MovementType
+from app.services import checkpoints
+
+
+def test_as_of_replays_movements_since_checkpoint(client, database, sample_inventory):
+    t0 = datetime(2026, 1, 1, 12, 0)
+    checkpoints.create_checkpoint(db.session, taken_at=t0)
+    db.session.add(Movement(
+        id=str(uuid.uuid4()),
+        product_id=sample_inventory.product_id,
+        source_store_id='STORE-001',
+        target_store_id='STORE-002',
+        quantity=30,
+        timestamp=t0 + timedelta(hours=1),
+        type=MovementType.TRANSFER
+    ))
+    db.session.commit()
+
+    response = client.get('/api/inventory/as-of?timestamp=2026-01-01T12:30:00&store_id=STORE-001')
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert data['checkpoint'] == t0.isoformat()
+    assert data['items'] == [{'product_id': sample_inventory.product_id, 'store_id': 'STORE-001', 'quantity': 100}]
+
+    response = client.get(f'/api/inventory/as-of?timestamp=2026-01-01T14:00:00Z&product_id={sample_inventory.product_id}')
+    data = json.loads(response.data)
+    quantities = {item['store_id']: item['quantity'] for item in data['items']}
+    assert quantities == {'STORE-001': 70, 'STORE-002': 30}
+
+
+def test_as_of_without_checkpoint_replays_initial_receipt(client, database, sample_product):
+    client.post('/api/stores/STORE-009/inventory',
+                data=json.dumps({'product_id': sample_product.id, 'quantity': 12, 'min_stock': 2}),
+                content_type='application/json')
+
+    at = (datetime.utcnow() + timedelta(minutes=1)).isoformat()
+    response = client.get(f'/api/inventory/as-of?timestamp={at}&store_id=STORE-009')
+    data = json.loads(response.data)
+    assert data['checkpoint'] is None
+    assert data['items'][0]['quantity'] == 12
+
+
+def test_prune_keeps_latest_checkpoint(database, sample_inventory):
+    checkpoints.create_checkpoint(db.session, taken_at=datetime(2025, 1, 1))
+    checkpoints.create_checkpoint(db.session, taken_at=datetime(2025, 6, 1))
+    assert checkpoints.prune_checkpoints(db.session, datetime(2030, 1, 1)) == 1
+    assert checkpoints.nearest_checkpoint(db.session, datetime(2030, 1, 1)) == datetime(2025, 6, 1)
+
+
+def test_as_of_requires_scope(client, database):
+    response = client.get('/api/inventory/as-of?timestamp=2026-01-01T00:00:00')
+    assert response.status_code == 400
+    response = client.get('/api/inventory/as-of?store_id=STORE-001')
+    assert response.status_code == 400
@@ -0,0 +1,54 @@
+import gzip
+import json
+import uuid
+import zlib
+from flask import Response
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from app.main import db
+from app.models.inventory import Inventory
+from app.utils.compression import negotiate_encoding
+
+
+def fill_store(product, count):
+    for index in range(count):
+        db.session.add(Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id='STORE-BIG',
+                                 quantity=index, min_stock=5))
+    db.session.commit()
+
+
+def test_large_json_is_gzipped(client, database, sample_product):
+    fill_store(sample_product, 50)
+    response = client.get('/api/stores/STORE-BIG/inventory', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(json.loads(gzip.decompress(response.data))) == 50
+
+
+def test_small_or_unrequested_responses_are_not_compressed(client, database, sample_product):
+    response = client.get('/api/stores/STORE-EMPTY/inventory', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+    fill_store(sample_product, 50)
+    response = client.get('/api/stores/STORE-BIG/inventory')
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_streamed_responses_are_compressed_incrementally(app, client, database):
+    chunks = [json.dumps({'line': index}) + '\n' for index in range(200)]
+
+    @app.route('/stream-test')
+    def stream_test():
+        return Response(iter(chunks), mimetype='application/x-ndjson')
+
+    response = client.get('/stream-test', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert zlib.decompress(response.data, 16 + zlib.MAX_WBITS).decode() == ''.join(chunks)
+
+
+def test_negotiation_honours_quality_values():
+    accept = parse_accept_header('gzip;q=0, br;q=0.5', Accept)
+    assert negotiate_encoding(accept, ['gzip']) is None
+    accept = parse_accept_header('*', Accept)
+    assert negotiate_encoding(accept, ['br', 'gzip']) == 'br'
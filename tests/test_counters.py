@@ -0,0 +1,141 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.inventory_slot import InventorySlot
+from app.models.notification import LowStockOutbox
+from app.services import checkpoints, counters, rebuild
+
+
+def hot_row(inventory):
+    return counters.hot_rows(db.session, [(inventory.product_id, inventory.store_id)])[
+        (inventory.product_id, inventory.store_id)
+    ]
+
+
+def quantity(inventory):
+    return db.session.execute(
+        db.select(counters.current_quantity()).where(Inventory.id == inventory.id)
+    ).scalar()
+
+
+def test_enable_spreads_quantity_and_disable_folds_back(database, sample_inventory):
+    assert counters.enable(db.session, sample_inventory.id, slots=3) == 100
+    db.session.commit()
+    assert sorted(slot.quantity for slot in InventorySlot.query) == [33, 33, 34]
+
+    counters.adjust(db.session, hot_row(sample_inventory), sample_inventory.product_id, 'STORE-001', -10)
+    db.session.commit()
+    assert quantity(sample_inventory) == 90
+    assert counters.disable(db.session, sample_inventory.id) == 90
+    db.session.commit()
+    assert InventorySlot.query.count() == 0
+
+
+def test_decrement_spills_over_slots_but_never_goes_negative(database, sample_inventory):
+    counters.enable(db.session, sample_inventory.id, slots=4)
+    db.session.commit()
+    row = hot_row(sample_inventory)
+
+    counters.adjust(db.session, row, sample_inventory.product_id, 'STORE-001', -60)  # more than any one slot
+    assert quantity(sample_inventory) == 40
+    try:
+        counters.adjust(db.session, row, sample_inventory.product_id, 'STORE-001', -41)
+        assert False, 'expected InsufficientStock'
+    except counters.InsufficientStock:
+        pass
+    assert min(slot.quantity for slot in InventorySlot.query) >= 0
+    assert quantity(sample_inventory) == 40
+
+
+def test_hot_rows_through_endpoints(client, database, sample_inventory):
+    counters.enable(db.session, sample_inventory.id, slots=4)
+    db.session.commit()
+
+    response = client.post('/api/inventory/adjustments', data=json.dumps({'lines': [
+        {'product_id': sample_inventory.product_id, 'store_id': 'STORE-001', 'type': 'OUT', 'quantity': 92}
+    ]}), content_type='application/json')
+    assert response.status_code == 201
+    response = client.post('/api/inventory/transfer', data=json.dumps({
+        'product_id': sample_inventory.product_id, 'source_store_id': 'STORE-001',
+        'target_store_id': 'STORE-002', 'quantity': 9
+    }), content_type='application/json')
+    assert response.status_code == 400
+
+    listing = json.loads(client.get('/api/stores/STORE-001/inventory?fields=quantity').data)
+    assert listing == [{'quantity': 8}]
+    assert LowStockOutbox.query.one().kind == 'low'
+
+    assert counters.fold(db.session) == 1
+    db.session.commit()
+    db.session.expire_all()
+    assert Inventory.query.get(sample_inventory.id).quantity == 8
+
+
+def test_concurrent_decrements_sell_exactly_the_stock(app, database, sample_inventory):
+    counters.enable(db.session, sample_inventory.id, slots=8)
+    db.session.commit()
+    key = (sample_inventory.product_id, sample_inventory.store_id)
+
+    def sell():
+        with app.app_context():
+            try:
+                counters.adjust(db.session, counters.hot_rows(db.session, [key])[key], *key, -1)
+                db.session.commit()
+                return 1
+            except counters.InsufficientStock:
+                db.session.rollback()
+                return 0
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        sold = sum(pool.map(lambda _: sell(), range(120)))
+    assert sold == 100
+    assert quantity(sample_inventory) == 0
+
+
+def hot_stocked_row(client, product):
+    """A hot row received with 50 units, of which 10 were sold past its cached quantity."""
+    client.post('/api/stores/STORE-005/inventory',
+                data=json.dumps({'product_id': product.id, 'quantity': 50, 'min_stock': 5}),
+                content_type='application/json')
+    inventory = Inventory.query.filter_by(product_id=product.id, store_id='STORE-005').one()
+    counters.enable(db.session, inventory.id, slots=4)
+    db.session.commit()
+    response = client.post('/api/inventory/adjustments', data=json.dumps({'lines': [
+        {'product_id': product.id, 'store_id': 'STORE-005', 'type': 'OUT', 'quantity': 10}
+    ]}), content_type='application/json')
+    assert response.status_code == 201
+    db.session.expire_all()
+    assert (inventory.quantity, quantity(inventory)) == (50, 40)
+    return inventory
+
+
+def test_checkpoints_and_product_filters_see_slot_totals(client, database, sample_product):
+    hot_stocked_row(client, sample_product)
+    checkpoints.create_checkpoint(db.session)
+    db.session.commit()
+    at = (datetime.utcnow() + timedelta(minutes=1)).isoformat()
+    items = client.get(f'/api/inventory/as-of?timestamp={at}&store_id=STORE-005').get_json()['items']
+    assert [item['quantity'] for item in items] == [40]
+
+    assert client.get('/api/products?min_stock=40').get_json()['total'] == 1
+    assert client.get('/api/products?min_stock=45').get_json()['total'] == 0
+
+
+def test_rebuild_verifies_and_corrects_slot_totals(app, client, database, sample_product):
+    inventory = hot_stocked_row(client, sample_product)
+    url = db.engine.url.render_as_string(hide_password=False)
+    product_range = (sample_product.id, sample_product.id)
+    assert rebuild.rebuild_range(url, app.config['LEDGER_ARCHIVE_DIR'], product_range)['mismatches'] == 0
+
+    db.session.execute(db.update(InventorySlot).where(InventorySlot.slot == 0)
+                       .values(quantity=InventorySlot.quantity + 7))
+    db.session.commit()
+    report = rebuild.rebuild_range(url, app.config['LEDGER_ARCHIVE_DIR'], product_range, apply=True)
+    assert report['sample'] == [{'product_id': sample_product.id, 'store_id': 'STORE-005', 'stored': 47,
+                                 'ledger': 40, 'anchored': True}]
+    db.session.expire_all()
+    assert (inventory.quantity, quantity(inventory)) == (40, 40)
+    assert InventorySlot.query.filter_by(inventory_id=inventory.id).count() == 4
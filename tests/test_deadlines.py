@@ -0,0 +1,108 @@
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.main import db
+from app.utils import deadlines
+from app.utils.admission import BULK, admit
+
+SLOW_QUERY = text(
+    'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) '
+    'SELECT count(*) FROM (SELECT i FROM n LIMIT 500000000)'
+)
+
+
+@pytest.fixture
+def slow_client(app, database):
+    @app.route('/slow')
+    @admit(BULK)
+    def slow():
+        return {'count': db.session.execute(SLOW_QUERY).scalar()}
+
+    return app.test_client()
+
+
+def timed_get(client, path, **kwargs):
+    started = time.monotonic()
+    response = client.get(path, **kwargs)
+    return response, time.monotonic() - started
+
+
+def test_header_deadline_interrupts_the_statement(slow_client):
+    response, elapsed = timed_get(slow_client, '/slow', headers={'X-Request-Timeout-Ms': '200'})
+    assert response.status_code == 504
+    assert response.get_json() == {'error': 'Request deadline exceeded'}
+    assert elapsed < 5
+
+    # The connection goes back to the pool without the interrupt armed
+    assert slow_client.get('/api/products').status_code == 200
+
+
+def test_route_default_applies_without_header(app, slow_client):
+    app.config['DEADLINE_DEFAULTS_MS'] = {**app.config['DEADLINE_DEFAULTS_MS'], BULK: 150}
+    response, elapsed = timed_get(slow_client, '/slow')
+    assert response.status_code == 504
+    assert elapsed < 5
+
+
+def test_header_is_capped_by_the_maximum(app, slow_client):
+    app.config['DEADLINE_MAX_MS'] = 150
+    response, elapsed = timed_get(slow_client, '/slow', headers={'X-Request-Timeout-Ms': '600000'})
+    assert response.status_code == 504
+    assert elapsed < 5
+
+
+def test_malformed_header_is_rejected(client, database):
+    for value in ('soon', '0', '-5'):
+        response = client.get('/api/products', headers={'X-Request-Timeout-Ms': value})
+        assert response.status_code == 400
+    assert client.get('/api/products', headers={'X-Request-Timeout-Ms': '5000'}).status_code == 200
+
+
+class RecordingCursor:
+    def __init__(self, connection, name=None):
+        self.connection, self.name, self.statements = connection, name, []
+
+    def execute(self, statement):
+        if self.name is not None and self.statements:
+            raise AssertionError('a named cursor executes only once')
+        self.statements.append(statement)
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    """Stands in for a psycopg2 connection and the SQLAlchemy connection around it."""
+
+    def __init__(self):
+        self.dialect = type('Dialect', (), {'name': 'postgresql'})()
+        self.info = {}
+        self.plain = []
+
+    def cursor(self):
+        self.plain.append(RecordingCursor(self))
+        return self.plain[-1]
+
+
+def test_statement_timeout_is_set_outside_server_side_cursors(app, monkeypatch):
+    connection = RecordingConnection()
+    with app.test_request_context('/', headers={'X-Request-Timeout-Ms': '1000'}):
+        deadlines.begin(0)
+        for _ in range(2):
+            named = RecordingCursor(connection, name='c_1')
+            deadlines._apply_deadline(connection, named, 'SELECT 1', {}, None, False)
+            assert named.statements == []
+        # One SET for both statements of the transaction, on a plain cursor
+        assert len(connection.plain) == 1
+        [statement] = connection.plain[0].statements
+        assert statement.startswith('SET LOCAL statement_timeout = ') and 900 < int(statement.split()[-1]) <= 1000
+
+        # Set again in the next transaction, and once the applied timeout has gone stale
+        deadlines._forget_statement_timeout(connection)
+        deadlines._apply_deadline(connection, RecordingCursor(connection, name='c_2'), 'SELECT 1', {}, None, False)
+        clock = time.monotonic() + deadlines.STATEMENT_TIMEOUT_SLACK_MS / 1000 + 0.01
+        monkeypatch.setattr(deadlines.time, 'monotonic', lambda: clock)
+        deadlines._apply_deadline(connection, RecordingCursor(connection, name='c_3'), 'SELECT 1', {}, None, False)
+        assert len(connection.plain) == 3
@@ -0,0 +1,41 @@
+import json
+
+
+def test_store_inventory_sparse_fields_skip_product(client, database, sample_inventory):
+    response = client.get(f'/api/stores/{sample_inventory.store_id}/inventory?fields=product_id,quantity')
+    assert response.status_code == 200
+    assert json.loads(response.data) == [{'product_id': sample_inventory.product_id, 'quantity': 100}]
+
+
+def test_store_inventory_include_product(client, database, sample_inventory):
+    response = client.get(f'/api/stores/{sample_inventory.store_id}/inventory?fields=quantity&include=product')
+    data = json.loads(response.data)
+    assert data == [{'quantity': 100, 'product': {'id': sample_inventory.product_id,
+                                                  'name': 'Test Product', 'sku': 'TEST-SKU-001'}}]
+
+
+def test_store_inventory_include_without_fields_returns_all_columns(client, database, sample_inventory):
+    response = client.get(f'/api/stores/{sample_inventory.store_id}/inventory?include=')
+    item = json.loads(response.data)[0]
+    assert 'product' not in item
+    assert item['updated_at'] and item['min_stock'] == 10
+
+
+def test_alerts_sparse_fields(client, database, sample_inventory):
+    sample_inventory.quantity = 4
+    database.session.commit()
+    response = client.get('/api/inventory/alerts?fields=store_id,missing_quantity')
+    assert json.loads(response.data) == [{'store_id': 'STORE-001', 'missing_quantity': 6}]
+
+
+def test_product_list_sparse_fields(client, database, sample_product):
+    response = client.get('/api/products?fields=sku,price')
+    data = json.loads(response.data)
+    assert data['items'] == [{'sku': 'TEST-SKU-001', 'price': 10.99}]
+    assert data['total'] == 1
+
+
+def test_unknown_fields_are_rejected(client, database):
+    assert client.get('/api/products?fields=secret').status_code == 400
+    assert client.get('/api/inventory/alerts?include=store').status_code == 400
+    assert client.get('/api/stores/STORE-001/inventory?fields=').status_code == 400
@@ -0,0 +1,149 @@
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.movement import Movement, MovementType
+from app.services import adjustments, group_commit
+from app.utils import deadlines
+
+
+@pytest.fixture
+def scheduler(app, monkeypatch):
+    scheduler = group_commit.GroupCommitScheduler(app, window_ms=200, max_batch=64)
+    app.extensions['group_commit'] = scheduler
+    batches = []
+    apply_movements = adjustments.apply_movements
+
+    def recording(session, groups):
+        batches.append(len(groups))
+        return apply_movements(session, groups)
+
+    monkeypatch.setattr(adjustments, 'apply_movements', recording)
+    scheduler.batches = batches
+    return scheduler
+
+
+def transfer(app, product_id, quantity, target='STORE-002'):
+    return app.test_client().post('/api/inventory/transfer', data=json.dumps({
+        'product_id': product_id, 'source_store_id': 'STORE-001', 'target_store_id': target, 'quantity': quantity
+    }), content_type='application/json')
+
+
+def test_concurrent_transfers_share_a_commit(app, database, sample_inventory, scheduler):
+    product_id = sample_inventory.product_id
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        responses = list(pool.map(lambda _: transfer(app, product_id, 10), range(12)))
+
+    codes = sorted(response.status_code for response in responses)
+    assert codes == [201] * 10 + [400] * 2  # 100 units cover ten transfers of 10
+    assert len(scheduler.batches) < 12
+    created = [response.get_json() for response in responses if response.status_code == 201]
+    assert all(body['type'] == 'TRANSFER' and body['quantity'] == 10 for body in created)
+
+    db.session.expire_all()
+    quantities = {row.store_id: row.quantity for row in Inventory.query}
+    assert quantities == {'STORE-001': 0, 'STORE-002': 100}
+    assert Movement.query.count() == 10
+
+
+def test_transfer_errors_match_the_direct_path(app, database, sample_inventory, scheduler):
+    assert transfer(app, str(uuid.uuid4()), 1).status_code == 404
+    response = transfer(app, sample_inventory.product_id, 101)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Insufficient stock in source store'
+
+
+def test_max_batch_caps_each_commit(app, database, sample_inventory):
+    scheduler = group_commit.GroupCommitScheduler(app, window_ms=500, max_batch=3)
+    futures = [scheduler.submit([[{'product_id': sample_inventory.product_id, 'source_store_id': None,
+                                   'target_store_id': 'STORE-001', 'quantity': 1, 'type': MovementType.IN}]])
+               for _ in range(7)]
+    results = [future.result(5) for future in futures]
+    assert all(not own[0]['errors'] for own, _ in results)
+    # Every request sees the balance its own batch committed
+    assert max(balances[(sample_inventory.product_id, 'STORE-001')] for _, balances in results) == 107
+
+
+def test_failed_batch_is_retried_per_request(app, database, sample_inventory, monkeypatch):
+    scheduler = group_commit.GroupCommitScheduler(app, window_ms=200, max_batch=64)
+    apply_movements = adjustments.apply_movements
+    poison = threading.Event()
+
+    def failing(session, groups):
+        if any(movement['quantity'] == 13 for group in groups for movement in group):
+            poison.set()
+            raise adjustments.ConcurrentUpdateError('Inventory changed while the batch was applied')
+        return apply_movements(session, groups)
+
+    monkeypatch.setattr(adjustments, 'apply_movements', failing)
+
+    def movement(quantity):
+        return [[{'product_id': sample_inventory.product_id, 'source_store_id': 'STORE-001',
+                  'target_store_id': None, 'quantity': quantity, 'type': MovementType.OUT}]]
+
+    good, bad = scheduler.submit(movement(5)), scheduler.submit(movement(13))
+    with pytest.raises(adjustments.ConcurrentUpdateError):
+        bad.result(5)
+    own, balances = good.result(5)
+    assert poison.is_set() and not own[0]['errors']
+    assert balances == {(sample_inventory.product_id, 'STORE-001'): 95}
+
+
+def test_adjustments_endpoint_through_scheduler(app, client, database, sample_inventory, scheduler):
+    response = client.post('/api/inventory/adjustments', data=json.dumps({'atomic': False, 'lines': [
+        {'product_id': sample_inventory.product_id, 'store_id': 'STORE-001', 'type': 'OUT', 'quantity': 30},
+        {'product_id': sample_inventory.product_id, 'store_id': 'STORE-001', 'type': 'OUT', 'quantity': 80},
+    ]}), content_type='application/json')
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['applied'] == 1
+    assert body['rejected'] == [{'index': 1, 'error': 'Insufficient stock'}]
+    assert body['inventory'][0]['quantity'] == 70
+
+
+def test_request_cancelled_at_its_deadline_is_never_applied(app, database, sample_inventory, monkeypatch):
+    scheduler = group_commit.GroupCommitScheduler(app, window_ms=0, max_batch=64)
+    app.extensions['group_commit'] = scheduler
+    apply_movements = adjustments.apply_movements
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(session, groups):
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+        return apply_movements(session, groups)
+
+    monkeypatch.setattr(adjustments, 'apply_movements', blocking)
+    first = scheduler.submit([[{'product_id': sample_inventory.product_id, 'source_store_id': 'STORE-001',
+                                'target_store_id': None, 'quantity': 5, 'type': MovementType.OUT}]])
+    assert started.wait(5)
+
+    response = app.test_client().post('/api/inventory/transfer', data=json.dumps({
+        'product_id': sample_inventory.product_id, 'source_store_id': 'STORE-001',
+        'target_store_id': 'STORE-002', 'quantity': 10
+    }), content_type='application/json', headers={deadlines.HEADER: '100'})
+    assert response.status_code == 504
+    assert 'before the request was applied' in response.get_json()['error']
+
+    release.set()
+    first.result(5)
+    scheduler.submit([]).result(5)  # the cancelled request has been drained by now
+    db.session.expire_all()
+    assert Movement.query.filter_by(type=MovementType.TRANSFER).count() == 0
+    assert {row.store_id: row.quantity for row in Inventory.query} == {'STORE-001': 95}
+
+
+def test_database_error_in_batch_answers_503(app, database, sample_inventory, scheduler, monkeypatch):
+    def failing(session, groups):
+        raise OperationalError('UPDATE inventory', {}, Exception('connection reset'))
+
+    monkeypatch.setattr(adjustments, 'apply_movements', failing)
+    response = transfer(app, sample_inventory.product_id, 10)
+    assert response.status_code == 503
+    assert Movement.query.count() == 0
@@ -0,0 +1,156 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.job import Job
+from app.services import adjustments, jobs
+
+
+def submit(client, kind, params):
+    return client.post('/api/jobs', data=json.dumps({'kind': kind, 'params': params}),
+                       content_type='application/json')
+
+
+def worker(app, **kwargs):
+    return jobs.Worker(app, processes=0, **kwargs)
+
+
+def expire_leases():
+    db.session.execute(db.update(Job).values(lease_until=datetime.utcnow() - timedelta(seconds=1)))
+    db.session.commit()
+
+
+def test_import_job_is_queued_and_run_by_a_worker(app, client, sample_inventory):
+    product_id = sample_inventory.product_id
+    response = submit(client, 'inventory_import', {'lines': [
+        {'product_id': product_id, 'store_id': 'STORE-001', 'type': 'OUT', 'quantity': 30},
+        {'product_id': product_id, 'store_id': 'STORE-001', 'type': 'OUT', 'quantity': 500},
+        {'product_id': product_id, 'store_id': 'STORE-009', 'type': 'IN', 'quantity': 5},
+    ]})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['state'] == jobs.QUEUED
+    assert response.headers['Location'].endswith(f'/api/jobs/{job["id"]}')
+
+    assert worker(app, chunk_size=2).run_once() == (job['id'], jobs.SUCCEEDED)
+    assert worker(app).run_once() is None
+
+    job = client.get(f'/api/jobs/{job["id"]}').get_json()
+    assert job['state'] == jobs.SUCCEEDED
+    assert job['params'] == {'lines': {'count': 3}}
+    assert job['progress'] == {'done': 3, 'total': 3}
+    assert job['result'] == {'lines': 3, 'applied': 2, 'rejected': 1,
+                             'rejected_sample': [{'index': 1, 'error': 'Insufficient stock'}]}
+    db.session.expire_all()
+    assert db.session.get(Inventory, sample_inventory.id).quantity == 70
+
+
+def test_invalid_jobs_are_rejected(client, database):
+    assert submit(client, 'defragment', {}).status_code == 400
+    response = submit(client, 'inventory_import', {'lines': [{'store_id': 'STORE-001'}]})
+    assert response.status_code == 400
+    assert 'line 0' in response.get_json()['error']
+    assert submit(client, 'rollup_rebuild', {'since': '2024-02-01', 'until': '2024-01-01'}).status_code == 400
+    assert client.get(f'/api/jobs/{uuid.uuid4()}').status_code == 404
+
+
+def test_claim_skips_leased_jobs_and_reclaims_expired_ones(app, client, database):
+    job_id = submit(client, 'rollup_rebuild', {'since': '2024-01-01', 'until': '2024-01-03'}).get_json()['id']
+    with db.engine.begin() as connection:
+        assert jobs.claim(connection, 'a', 60) == (job_id, 1)
+        assert jobs.claim(connection, 'b', 60) is None
+
+    expire_leases()
+    with db.engine.begin() as connection:
+        assert jobs.claim(connection, 'b', 60) == (job_id, 2)
+
+    # The first worker's writes are fenced off once its job was claimed again
+    stale = jobs.JobContext(db.session, job_id, 1, None, 60, 1000)
+    try:
+        stale.save({'next': 1}, 1)
+        assert False, 'expected LeaseLost'
+    except jobs.LeaseLost:
+        pass
+    assert jobs.run_job(db.session, job_id, 2, 60, 3, 1000) == jobs.SUCCEEDED
+    assert db.session.get(Job, job_id).result == {'since': '2024-01-01', 'until': '2024-01-03', 'days': 2,
+                                                  'rows': 0}
+
+
+class Crash(BaseException):
+    """Stands in for a worker process dying mid-job."""
+
+
+def test_interrupted_job_resumes_from_its_checkpoint(app, client, sample_inventory, monkeypatch):
+    product_id = sample_inventory.product_id
+    lines = [{'product_id': product_id, 'store_id': 'STORE-001', 'type': 'IN', 'quantity': 1} for _ in range(5)]
+    job_id = submit(client, 'inventory_import', {'lines': lines}).get_json()['id']
+
+    apply = adjustments.apply_adjustments
+    calls = []
+
+    def crash_on_second_chunk(session, parsed, atomic=True):
+        calls.append(len(parsed))
+        if len(calls) == 2:
+            raise Crash()
+        return apply(session, parsed, atomic)
+
+    monkeypatch.setattr(adjustments, 'apply_adjustments', crash_on_second_chunk)
+    try:
+        worker(app, chunk_size=2).run_once()
+        assert False, 'expected the worker to crash'
+    except Crash:
+        pass
+    db.session.rollback()
+    job = client.get(f'/api/jobs/{job_id}').get_json()
+    assert (job['state'], job['progress']) == (jobs.RUNNING, {'done': 2, 'total': 5})
+
+    # Still leased: nobody else picks it up until the lease runs out
+    assert worker(app, chunk_size=2).run_once() is None
+    expire_leases()
+    assert worker(app, chunk_size=2).run_once() == (job_id, jobs.SUCCEEDED)
+    assert calls == [2, 2, 2, 1]
+
+    job = client.get(f'/api/jobs/{job_id}').get_json()
+    assert job['attempts'] == 2
+    assert job['result']['applied'] == 5
+    db.session.expire_all()
+    assert db.session.get(Inventory, sample_inventory.id).quantity == 105
+
+
+def test_failing_and_abandoned_jobs_fail(app, client, database, monkeypatch):
+    def broken(session, *args, **kwargs):
+        raise RuntimeError('rollups table is gone')
+
+    monkeypatch.setattr(jobs.rollups, 'rebuild_rollups', broken)
+    job_id = submit(client, 'rollup_rebuild', {'since': '2024-01-01', 'until': '2024-01-02'}).get_json()['id']
+    assert worker(app).run_once() == (job_id, jobs.FAILED)
+    assert client.get(f'/api/jobs/{job_id}').get_json()['error'] == 'rollups table is gone'
+
+    job_id = submit(client, 'rollup_rebuild', {'since': '2024-01-01'}).get_json()['id']
+    for _ in range(2):
+        with db.engine.begin() as connection:
+            jobs.claim(connection, 'lost', 60)
+        expire_leases()
+    assert worker(app, max_attempts=2).run_once() == (job_id, jobs.FAILED)
+    assert client.get(f'/api/jobs/{job_id}').get_json()['error'] == 'Gave up after 2 attempts'
+
+
+def test_reconcile_job_corrects_the_count(app, client, sample_inventory):
+    assert submit(client, 'reconcile', {'store_id': 'STORE-001', 'counts': [
+        {'sku': 'B', 'quantity': 1}, {'sku': 'A', 'quantity': 1}
+    ]}).status_code == 400
+
+    response = submit(client, 'reconcile', {'store_id': 'STORE-001', 'apply': True, 'counts': [
+        {'sku': 'TEST-SKU-001', 'quantity': 97}, {'sku': 'ZZ-UNKNOWN', 'quantity': 2}
+    ]})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert worker(app).run_once() == (job_id, jobs.SUCCEEDED)
+
+    result = client.get(f'/api/jobs/{job_id}').get_json()['result']
+    assert (result['differences'], result['unknown_skus'], result['units_out']) == (1, 1, 3)
+    assert [item['status'] for item in result['sample']] == ['mismatch', 'unknown_sku']
+    db.session.expire_all()
+    assert db.session.get(Inventory, sample_inventory.id).quantity == 97
@@ -0,0 +1,189 @@
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import inspect
+from app.main import db
+from app.models.movement import Movement, MovementType
+from app.services import ledger
+
+
+def add_movement(product, timestamp, quantity=5):
+    movement = Movement(
+        id=str(uuid.uuid4()),
+        product_id=product.id,
+        source_store_id='STORE-001',
+        target_store_id='STORE-002',
+        quantity=quantity,
+        timestamp=timestamp,
+        type=MovementType.TRANSFER
+    )
+    db.session.add(movement)
+    db.session.commit()
+    return movement.id
+
+
+def test_month_arithmetic():
+    assert ledger.add_months(datetime(2025, 11, 1), 3) == datetime(2026, 2, 1)
+    assert ledger.add_months(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+    assert ledger.period_name(datetime(2026, 3, 1)) == 'movement_2026_03'
+
+
+def test_rotate_moves_old_rows_to_period_tables(database, sample_product):
+    old_id = add_movement(sample_product, datetime(2024, 5, 10))
+    recent_id = add_movement(sample_product, datetime.utcnow())
+
+    with db.engine.begin() as connection:
+        moved = ledger.rotate(connection, ledger.hot_cutoff())
+        assert moved == 1
+        assert 'movement_2024_05' in inspect(connection).get_table_names()
+        rows = list(ledger.iter_movements(connection, product_id=sample_product.id))
+
+    assert [row['id'] for row in rows] == [old_id, recent_id]
+    assert Movement.query.count() == 1
+
+
+def test_history_defaults_to_hot_period(client, database, sample_product):
+    add_movement(sample_product, datetime(2024, 5, 10))
+    recent_id = add_movement(sample_product, datetime.utcnow())
+
+    response = client.get('/api/inventory/movements')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [row['id'] for row in data] == [recent_id]
+
+
+def test_archive_keeps_movements_readable(app, client, database, sample_product):
+    old_id = add_movement(sample_product, datetime(2024, 5, 10), quantity=7)
+    add_movement(sample_product, datetime.utcnow() - timedelta(seconds=1))
+
+    with db.engine.connect() as connection:
+        archived = ledger.archive_periods(connection, datetime(2024, 6, 1), app.config['LEDGER_ARCHIVE_DIR'])
+        assert 'movement_2024_05' not in inspect(connection).get_table_names()
+    assert archived[0]['period'] == '2024-05'
+    assert archived[0]['rows'] == 1
+    assert os.path.exists(archived[0]['path'])
+
+    response = client.get('/api/inventory/movements/export?until=2024-06-01T00:00:00')
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert len(lines) == 1
+    assert lines[0]['id'] == old_id
+    assert lines[0]['quantity'] == 7
+    assert lines[0]['type'] == 'TRANSFER'
+
+
+def test_failed_archive_run_leaves_each_movement_in_one_place(app, client, database, sample_product, monkeypatch):
+    archive_dir = app.config['LEDGER_ARCHIVE_DIR']
+    may_id = add_movement(sample_product, datetime(2024, 5, 10))
+    july_id = add_movement(sample_product, datetime(2024, 7, 10))
+    stage_archive = ledger.stage_archive
+
+    def fail_for_july(archive_dir, month, rows):
+        staged, count = stage_archive(archive_dir, month, rows)
+        if month == datetime(2024, 7, 1):
+            raise OSError('disk full')
+        return staged, count
+
+    monkeypatch.setattr(ledger, 'stage_archive', fail_for_july)
+    with db.engine.connect() as connection:
+        try:
+            ledger.archive_periods(connection, datetime(2024, 8, 1), archive_dir)
+        except OSError:
+            pass
+        assert 'movement_2024_07' in inspect(connection).get_table_names()
+        assert [row['id'] for row in ledger.iter_movements(connection)] == [may_id, july_id]
+    assert os.path.exists(os.path.join(archive_dir, 'movement_2024_07.json.gz.tmp'))
+
+    monkeypatch.setattr(ledger, 'stage_archive', stage_archive)
+    with db.engine.connect() as connection:
+        archived = ledger.archive_periods(connection, datetime(2024, 8, 1), archive_dir)
+        assert [row['id'] for row in ledger.iter_movements(connection)] == [may_id, july_id]
+    assert {entry['period']: entry['rows'] for entry in archived}['2024-07'] == 1
+    assert not [name for name in os.listdir(archive_dir) if name.endswith('.tmp')]
+
+
+def test_archiving_a_period_again_replaces_rows_with_the_same_id(app, database, sample_product):
+    archive_dir = app.config['LEDGER_ARCHIVE_DIR']
+    movement_id = add_movement(sample_product, datetime(2024, 5, 10))
+    with db.engine.connect() as connection:
+        ledger.archive_periods(connection, datetime(2024, 6, 1), archive_dir)
+    movement = {'id': movement_id, 'product_id': sample_product.id, 'source_store_id': 'STORE-001',
+                'target_store_id': 'STORE-002', 'quantity': 5, 'timestamp': datetime(2024, 5, 10),
+                'type': MovementType.TRANSFER}
+
+    staged, count = ledger.stage_archive(archive_dir, datetime(2024, 5, 1), [movement])
+    with gzip.open(staged, 'rt', encoding='utf-8') as handle:
+        data = json.load(handle)
+    assert count == 1
+    assert data['rows'] == 1
+    assert data['columns']['id'] == [movement_id]
+
+
+def test_history_rejects_invalid_timestamp(client, database):
+    response = client.get('/api/inventory/movements?since=yesterday')
+    assert response.status_code == 400
+
+
+class RecordedResult:
+    def __init__(self, value=None, rowcount=0):
+        self.value, self.rowcount = value, rowcount
+
+    def scalar(self):
+        return self.value
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.value
+
+
+class PartitionedConnection:
+    """Answers the catalog queries of the partition helpers as PostgreSQL would, recording every statement."""
+
+    dialect = type('Dialect', (), {'name': 'postgresql'})
+
+    def __init__(self, partitions, stranded):
+        self.partitions, self.stranded, self.statements = set(partitions), dict(stranded), []
+
+    def execute(self, statement, parameters=None):
+        sql = str(statement)
+        self.statements.append(sql.split(' (')[0] if sql.startswith('WITH') else sql)
+        if 'to_regclass(:name)' in sql:
+            return RecordedResult(parameters['name'] in self.partitions)
+        if sql.startswith('SELECT EXISTS'):
+            return RecordedResult(any(f"'{month:%Y-%m-%d}'" in sql for month in self.stranded))
+        if 'date_trunc' in sql:
+            return RecordedResult(sorted(self.stranded))
+        if sql.startswith('CREATE TABLE movement_2'):
+            self.partitions.add(sql.split()[2])
+        if sql.startswith('WITH moved'):
+            month = next(month for month in self.stranded if f"timestamp >= '{month:%Y-%m-%d}'" in sql)
+            return RecordedResult(rowcount=self.stranded.pop(month))
+        return RecordedResult()
+
+
+def test_partition_for_a_month_in_the_default_partition_takes_its_rows():
+    current = ledger.month_start(datetime.utcnow())
+    upcoming = ledger.add_months(current, 1)
+    connection = PartitionedConnection([ledger.period_name(current)], {upcoming: 3})
+
+    assert ledger.ensure_partitions(connection, months_ahead=1) == [
+        ledger.period_name(current), ledger.period_name(upcoming)
+    ]
+    statements = [sql for sql in connection.statements if not sql.startswith('SELECT')]
+    assert statements[1:] == [
+        'ALTER TABLE movement DETACH PARTITION movement_default',
+        f"CREATE TABLE {ledger.period_name(upcoming)} PARTITION OF movement "
+        f"FOR VALUES FROM ('{upcoming:%Y-%m-%d}') TO ('{ledger.add_months(upcoming, 1):%Y-%m-%d}')",
+        'WITH moved AS',
+        'ALTER TABLE movement ATTACH PARTITION movement_default DEFAULT',
+    ]
+    assert connection.stranded == {}
+
+
+def test_rotate_gives_stranded_months_their_partitions():
+    connection = PartitionedConnection([], {datetime(2024, 5, 1): 4, datetime(2024, 7, 1): 2})
+    assert ledger.rotate(connection, ledger.hot_cutoff()) == 6
+    assert {'movement_2024_05', 'movement_2024_07'} <= connection.partitions
@@ -0,0 +1,41 @@
+import json
+
+
+def test_product_lookup_by_ids_is_keyed_by_input(client, database, sample_product):
+    response = client.post('/api/products/lookup', json={'ids': [sample_product.id, 'nope', sample_product.id]})
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert list(data['items']) == [sample_product.id, 'nope']
+    assert data['items'][sample_product.id]['sku'] == 'TEST-SKU-001'
+    assert data['items']['nope'] is None
+    assert data['missing'] == ['nope']
+
+
+def test_product_lookup_by_skus(client, database, sample_product):
+    response = client.post('/api/products/lookup', json={'skus': ['TEST-SKU-001']})
+    assert json.loads(response.data)['items']['TEST-SKU-001']['id'] == sample_product.id
+
+
+def test_product_lookup_validation(client, database):
+    assert client.post('/api/products/lookup', json={}).status_code == 400
+    assert client.post('/api/products/lookup', json={'ids': ['a'], 'skus': ['b']}).status_code == 400
+    assert client.post('/api/products/lookup', json={'ids': 'a'}).status_code == 400
+    assert client.post('/api/products/lookup', json={'ids': ['x'] * 1001}).status_code == 400
+
+
+def test_inventory_lookup_returns_items_in_input_order(client, database, sample_inventory):
+    pairs = [{'product_id': sample_inventory.product_id, 'store_id': 'STORE-404'},
+             {'product_id': sample_inventory.product_id, 'store_id': 'STORE-001'}]
+    response = client.post('/api/inventory/lookup?include=product', json={'pairs': pairs})
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [item['store_id'] for item in data['items']] == ['STORE-404', 'STORE-001']
+    assert data['items'][0]['inventory'] is None
+    assert data['items'][1]['inventory']['quantity'] == 100
+    assert data['items'][1]['inventory']['product']['sku'] == 'TEST-SKU-001'
+    assert data['missing'] == 1
+
+
+def test_inventory_lookup_validation(client, database):
+    assert client.post('/api/inventory/lookup', json={'pairs': [{'product_id': 'p'}]}).status_code == 400
+    assert client.post('/api/inventory/lookup', json={'pairs': []}).status_code == 200
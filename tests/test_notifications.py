@@ -0,0 +1,116 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.main import db
+from app.models.notification import LowStockOutbox
+from app.services.notifications import Dispatcher
+
+
+class Receiver:
+    """Local webhook stub that records batches and answers with queued statuses."""
+
+    def __init__(self):
+        self.batches = []
+        self.responses = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                status, headers = receiver.responses.pop(0) if receiver.responses else (200, {})
+                if status == 200:
+                    receiver.batches.append(json.loads(body)['events'])
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/hooks/low-stock'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def receiver():
+    stub = Receiver()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def sell(client, inventory, quantity):
+    return client.post('/api/inventory/adjustments', data=json.dumps({'lines': [
+        {'product_id': inventory.product_id, 'store_id': inventory.store_id, 'type': 'OUT', 'quantity': quantity}
+    ]}), content_type='application/json')
+
+
+def receive(client, inventory, quantity):
+    return client.post('/api/inventory/adjustments', data=json.dumps({'lines': [
+        {'product_id': inventory.product_id, 'store_id': inventory.store_id, 'type': 'IN', 'quantity': quantity}
+    ]}), content_type='application/json')
+
+
+def test_transfer_crossing_is_delivered(client, database, sample_inventory, receiver):
+    client.post('/api/inventory/transfer', data=json.dumps({
+        'product_id': sample_inventory.product_id, 'source_store_id': 'STORE-001',
+        'target_store_id': 'STORE-002', 'quantity': 95
+    }), content_type='application/json')
+    row = LowStockOutbox.query.one()
+    assert (row.kind, row.store_id, row.quantity) == ('low', 'STORE-001', 5)
+
+    dispatcher = Dispatcher(db.engine, [receiver.url])
+    assert dispatcher.run_once() == 1
+    assert [event['kind'] for event in receiver.batches[0]] == ['low']
+    assert LowStockOutbox.query.count() == 0
+
+
+def test_repeat_crossings_coalesce(client, database, sample_inventory):
+    sell(client, sample_inventory, 95)
+    receive(client, sample_inventory, 50)
+    sell(client, sample_inventory, 50)
+    sell(client, sample_inventory, 1)  # already low: no new crossing
+    row = LowStockOutbox.query.one()
+    assert (row.kind, row.quantity, row.occurrences) == ('low', 5, 3)
+
+
+def test_failed_delivery_backs_off(client, database, sample_inventory, receiver):
+    sell(client, sample_inventory, 95)
+    receiver.responses.append((500, {}))
+    dispatcher = Dispatcher(db.engine, [receiver.url], backoff_base=60)
+
+    assert dispatcher.run_once() == 0
+    database.session.expire_all()
+    row = LowStockOutbox.query.one()
+    assert row.attempts == 1 and row.next_attempt_at > datetime.utcnow()
+    assert 'answered 500' in row.last_error
+    assert dispatcher.run_once() == 0  # not due yet
+
+
+def test_retry_after_pauses_dispatcher(client, database, sample_inventory, receiver):
+    sell(client, sample_inventory, 95)
+    receiver.responses.append((429, {'Retry-After': '30'}))
+    dispatcher = Dispatcher(db.engine, [receiver.url])
+
+    assert dispatcher.run_once() == 0
+    LowStockOutbox.query.update({'next_attempt_at': datetime.utcnow()})
+    db.session.commit()
+    assert dispatcher.run_once() == 0 and receiver.batches == []
+    dispatcher.paused_until = 0
+    assert dispatcher.run_once() == 1
+
+
+def test_threshold_update_records_crossings(client, database, sample_inventory):
+    response = client.post('/api/inventory/bulk-update', data=json.dumps({
+        'filter': {'store_ids': ['STORE-001']}, 'operation': {'op': 'set', 'value': 150}
+    }), content_type='application/json')
+    assert json.loads(response.data) == {'updated': 1}
+    row = LowStockOutbox.query.one()
+    assert (row.kind, row.quantity, row.min_stock) == ('low', 100, 150)
@@ -0,0 +1,69 @@
+import json
+import uuid
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.movement import Movement
+from app.services import rebalance
+
+
+def stock(product, store_id, quantity, min_stock):
+    db.session.add(Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id=store_id,
+                             quantity=quantity, min_stock=min_stock))
+
+
+def test_plan_prefers_single_covering_donor():
+    rows = [
+        ('P', 'A', 30, 10),   # surplus 20
+        ('P', 'B', 16, 10),   # surplus 6
+        ('P', 'C', 0, 5),     # short 5
+        ('P', 'D', 2, 20),    # short 18
+    ]
+    transfers, unresolved = rebalance.plan_product('P', rows)
+    assert unresolved == []
+    assert sorted((t['source_store_id'], t['target_store_id'], t['quantity']) for t in transfers) == [
+        ('A', 'D', 18), ('B', 'C', 5)
+    ]
+
+
+def test_plan_reports_unresolved_shortage():
+    transfers, unresolved = rebalance.plan_product('P', [('P', 'A', 13, 10), ('P', 'B', 0, 8)])
+    assert [t['quantity'] for t in transfers] == [3]
+    assert unresolved == [{'product_id': 'P', 'store_id': 'B', 'missing_quantity': 5}]
+
+
+def test_rebalance_endpoint_plans_without_applying(client, database, sample_product):
+    stock(sample_product, 'STORE-001', 50, 10)
+    stock(sample_product, 'STORE-002', 1, 10)
+    db.session.commit()
+
+    response = client.post('/api/inventory/rebalance/plan', data=json.dumps({}), content_type='application/json')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['applied'] is False
+    assert data['moves'] == 1
+    assert data['transfers'][0]['quantity'] == 9
+    assert Movement.query.count() == 0
+
+
+def test_rebalance_endpoint_applies_plan(client, database, sample_product):
+    stock(sample_product, 'STORE-001', 50, 10)
+    stock(sample_product, 'STORE-002', 1, 10)
+    stock(sample_product, 'STORE-003', 4, 6)
+    db.session.commit()
+
+    response = client.post('/api/inventory/rebalance/plan', data=json.dumps({'apply': True}),
+                           content_type='application/json')
+    data = json.loads(response.data)
+    assert data['applied'] is True
+    assert data['units'] == 11
+
+    db.session.expire_all()
+    quantities = {row.store_id: row.quantity for row in Inventory.query}
+    assert quantities == {'STORE-001': 39, 'STORE-002': 10, 'STORE-003': 6}
+    assert Movement.query.count() == 2
+
+
+def test_rebalance_validates_filters(client, database):
+    response = client.post('/api/inventory/rebalance/plan', data=json.dumps({'store_ids': 'STORE-001'}),
+                           content_type='application/json')
+    assert response.status_code == 400
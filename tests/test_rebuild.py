@@ -0,0 +1,118 @@
+import json
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.product import Product
+from app.services import rebuild
+import uuid
+
+
+def seed_ledger(client, database):
+    products = []
+    for index in range(4):
+        product = Product(id=str(uuid.uuid4()), name=f'Product {index}', category='Test',
+                          price=1.0, sku=f'REB-{index}')
+        database.session.add(product)
+        products.append(product)
+    database.session.commit()
+    for product in products:
+        client.post('/api/stores/STORE-001/inventory',
+                    data=json.dumps({'product_id': product.id, 'quantity': 20, 'min_stock': 1}),
+                    content_type='application/json')
+    client.post('/api/inventory/transfer',
+                data=json.dumps({'product_id': products[0].id, 'source_store_id': 'STORE-001',
+                                 'target_store_id': 'STORE-002', 'quantity': 5}),
+                content_type='application/json')
+    return products
+
+
+def run(app, workers, apply=False):
+    with db.engine.connect() as connection:
+        ranges = rebuild.product_ranges(connection, 2)
+    url = db.engine.url.render_as_string(hide_password=False)
+    return rebuild.rebuild(url, app.config['LEDGER_ARCHIVE_DIR'], ranges, workers=workers, apply=apply)
+
+
+def test_product_ranges_cover_all_products(client, database):
+    products = seed_ledger(client, database)
+    with db.engine.connect() as connection:
+        ranges = rebuild.product_ranges(connection, 3)
+    ids = sorted(product.id for product in products)
+    assert ranges[0][0] == ids[0]
+    assert ranges[-1][1] == ids[-1]
+    assert len(ranges) == 3
+
+
+def test_verify_reports_no_mismatch_for_consistent_ledger(app, client, database):
+    seed_ledger(client, database)
+    report = run(app, workers=1)
+    assert report['mismatches'] == 0
+    assert report['pairs'] == 5
+    assert report['movements'] == 5
+
+
+def test_rebuild_detects_and_corrects_drift(app, client, database):
+    products = seed_ledger(client, database)
+    drifted = Inventory.query.filter_by(product_id=products[0].id, store_id='STORE-002').first()
+    drifted.quantity = 99
+    database.session.commit()
+
+    report = run(app, workers=2)
+    assert report['mismatches'] == 1
+    assert report['corrected'] == 0
+    assert report['sample'][0]['ledger'] == 5
+
+    report = run(app, workers=2, apply=True)
+    assert report['corrected'] == 1
+    database.session.expire_all()
+    assert Inventory.query.filter_by(product_id=products[0].id, store_id='STORE-002').first().quantity == 5
+
+
+def test_rows_without_an_opening_movement_are_left_alone(app, client, database):
+    products = seed_ledger(client, database)
+    # Stocked without a movement, like the rows db/seed.py writes
+    database.session.add(Inventory(id=str(uuid.uuid4()), product_id=products[1].id, store_id='STORE-SEEDED',
+                                   quantity=30, min_stock=1))
+    database.session.commit()
+
+    report = run(app, workers=1, apply=True)
+    assert (report['mismatches'], report['unanchored'], report['corrected']) == (1, 1, 0)
+    assert report['sample'][0]['anchored'] is False
+    seeded = Inventory.query.filter_by(store_id='STORE-SEEDED').one()
+    assert seeded.quantity == 30
+
+    with db.engine.connect() as connection:
+        ranges = rebuild.product_ranges(connection, 2)
+    url = db.engine.url.render_as_string(hide_password=False)
+    report = rebuild.rebuild(url, app.config['LEDGER_ARCHIVE_DIR'], ranges, apply=True, include_unanchored=True)
+    assert report['corrected'] == 1
+    database.session.expire_all()
+    assert seeded.quantity == 0
+
+
+def test_writes_committed_after_the_snapshot_are_kept(app, client, database, monkeypatch):
+    products = seed_ledger(client, database)
+    drifted = Inventory.query.filter_by(product_id=products[0].id, store_id='STORE-001').one()
+    drifted.quantity = 99
+    database.session.commit()
+
+    verify_range = rebuild.verify_range
+
+    def transfer_after_the_read(connection, archive_dir, product_range, *args, **kwargs):
+        result = verify_range(connection, archive_dir, product_range, *args, **kwargs)
+        if not product_range[0] <= products[0].id <= product_range[1]:
+            return result
+        response = client.post('/api/inventory/transfer',
+                               data=json.dumps({'product_id': products[0].id, 'source_store_id': 'STORE-001',
+                                                'target_store_id': 'STORE-002', 'quantity': 4}),
+                               content_type='application/json')
+        assert response.status_code == 201
+        return result
+
+    monkeypatch.setattr(rebuild, 'verify_range', transfer_after_the_read)
+    report = run(app, workers=1, apply=True)
+    assert report['corrected'] == 1
+    database.session.expire_all()
+    # The ledger says 20 - 5 - 4; an absolute write of the snapshot's 15 would have lost the transfer
+    assert drifted.quantity == 11
+    monkeypatch.undo()
+    assert run(app, workers=1)['mismatches'] == 0
@@ -0,0 +1,76 @@
+import json
+import math
+import uuid
+from datetime import datetime, timedelta
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.movement import Movement, MovementType
+from app.services import recommendations
+
+
+def ship(product, store_id, quantity, days_ago, now):
+    db.session.add(Movement(
+        id=str(uuid.uuid4()),
+        product_id=product.id,
+        source_store_id=store_id,
+        quantity=quantity,
+        timestamp=now - timedelta(days=days_ago),
+        type=MovementType.OUT
+    ))
+
+
+def test_recommend_uses_mean_and_variability(database, sample_inventory, sample_product):
+    now = datetime(2026, 6, 1, 12)
+    for days_ago in range(1, 11):
+        ship(sample_product, 'STORE-001', 4 if days_ago % 2 else 2, days_ago, now)
+    db.session.commit()
+
+    result = recommendations.recommend(db.session, window_days=10, lead_time_days=4, z=2.0, as_of=now)
+    assert result['daily_demand'][0] == 3.0
+    assert result['demand_std'][0] == 1.0
+    assert result['recommended'][0] == math.ceil(3.0 * 4 + 2.0 * 1.0 * 2)
+
+
+def test_pairs_without_observed_demand_keep_their_min_stock(database, sample_inventory, sample_product):
+    result = recommendations.recommend(db.session)
+    assert list(result['recommended']) == [10]
+    assert list(result['observed_days']) == [0]
+    assert recommendations.apply_recommendations(db.session, result) == 0
+
+    now = datetime(2026, 6, 1, 12)
+    for days_ago in (1, 2):
+        ship(sample_product, 'STORE-001', 50, days_ago, now)
+    db.session.commit()
+    result = recommendations.recommend(db.session, window_days=10, as_of=now, min_observed_days=3)
+    assert (result['observed_days'][0], result['recommended'][0]) == (2, 10)
+    result = recommendations.recommend(db.session, window_days=10, as_of=now, min_observed_days=2)
+    assert result['recommended'][0] != 10
+
+
+def test_apply_recommendations_updates_min_stock(database, sample_inventory, sample_product):
+    now = datetime(2026, 6, 1, 12)
+    for days_ago in range(1, 31):
+        ship(sample_product, 'STORE-001', 5, days_ago, now)
+    db.session.commit()
+
+    result = recommendations.recommend(db.session, window_days=30, lead_time_days=7, as_of=now)
+    assert recommendations.apply_recommendations(db.session, result) == 1
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Inventory, sample_inventory.id).min_stock == 35
+
+
+def test_recommendations_endpoint(client, database, sample_inventory, sample_product):
+    now = datetime.utcnow()
+    ship(sample_product, 'STORE-001', 9, 1, now)
+    db.session.commit()
+
+    response = client.get('/api/inventory/recommendations?store_id=STORE-001&window_days=3&lead_time_days=1&z=0')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data[0]['product_id'] == sample_product.id
+    assert data[0]['daily_demand'] == 3.0
+    assert data[0]['recommended_min_stock'] == 3
+
+    response = client.get('/api/inventory/recommendations?window_days=0')
+    assert response.status_code == 400
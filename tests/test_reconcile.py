@@ -0,0 +1,67 @@
+import json
+import uuid
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.movement import Movement
+from app.models.product import Product
+from app.services import reconcile
+
+
+def stock(sku, quantity, store_id='STORE-001'):
+    product = Product(id=str(uuid.uuid4()), name=sku, category='C', price=1, sku=sku)
+    db.session.add(product)
+    if quantity is not None:
+        db.session.add(Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id=store_id,
+                                 quantity=quantity, min_stock=0))
+    return product
+
+
+def post(client, body, apply=False, content_type='text/csv'):
+    response = client.post(f'/api/stores/STORE-001/reconcile?apply={str(apply).lower()}',
+                           data=body, content_type=content_type)
+    if response.status_code != 200:
+        return response.status_code, json.loads(response.data)
+    return 200, [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def test_merge_yields_both_sides_in_order():
+    counts = iter([('A', 1), ('C', 3)])
+    stock_rows = iter([('B', 'pb', 2), ('C', 'pc', 4)])
+    assert list(reconcile.merge(counts, stock_rows)) == [
+        ('A', None, None, 1), ('B', 'pb', 2, None), ('C', 'pc', 4, 3)
+    ]
+
+
+def test_reconcile_reports_differences(client, database):
+    stock('A', 5), stock('B', 7), stock('C', 2), stock('D', None)
+    db.session.commit()
+
+    status, lines = post(client, 'sku,quantity\nA,5\nB,4\nD,3\nZ,1\n')
+    assert status == 200
+    *differences, summary = lines
+    assert [(d['sku'], d['status'], d['difference']) for d in differences] == [
+        ('B', 'mismatch', -3), ('C', 'not_counted', -2), ('D', 'not_stocked', 3), ('Z', 'unknown_sku', 1)
+    ]
+    assert summary['summary'] == {'store_id': 'STORE-001', 'counted': 4, 'matched': 1, 'differences': 3,
+                                  'unknown_skus': 1, 'units_in': 3, 'units_out': 5, 'applied': False}
+    assert Movement.query.count() == 0
+
+
+def test_reconcile_applies_corrections(client, database):
+    a, b = stock('A', 5), stock('B', None)
+    db.session.commit()
+
+    status, lines = post(client, '\n'.join(json.dumps({'sku': sku, 'quantity': q}) for sku, q in [('A', 2), ('B', 4)]),
+                         apply=True, content_type='application/x-ndjson')
+    assert status == 200
+    assert lines[-1]['summary']['applied'] is True
+    db.session.expire_all()
+    quantities = {row.product_id: row.quantity for row in Inventory.query}
+    assert quantities == {a.id: 2, b.id: 4}
+    assert sorted((m.type.value, m.quantity) for m in Movement.query) == [('IN', 4), ('OUT', 3)]
+
+
+def test_unsorted_or_malformed_count_is_rejected(client, database):
+    assert post(client, 'B,1\nA,1\n')[0] == 400
+    assert post(client, 'A,x\n')[0] == 400
+    assert post(client, '{"sku": "A"}', content_type='application/x-ndjson')[0] == 400
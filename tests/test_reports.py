@@ -0,0 +1,76 @@
+import json
+import uuid
+from datetime import date, datetime
+from app.main import db
+from app.models.movement import Movement, MovementType
+from app.models.rollup import MovementDailyRollup
+from app.services import rollups
+
+
+def add_movement(product, timestamp, quantity, movement_type=MovementType.TRANSFER,
+                 source='STORE-001', target='STORE-002'):
+    db.session.add(Movement(
+        id=str(uuid.uuid4()),
+        product_id=product.id,
+        source_store_id=source,
+        target_store_id=target,
+        quantity=quantity,
+        timestamp=timestamp,
+        type=movement_type
+    ))
+    db.session.commit()
+
+
+def test_rollups_follow_orm_writes(database, sample_product):
+    add_movement(sample_product, datetime(2026, 3, 2, 9), 5)
+    add_movement(sample_product, datetime(2026, 3, 2, 17), 3)
+
+    source = db.session.get(MovementDailyRollup, (date(2026, 3, 2), sample_product.id, 'STORE-001',
+                                                  MovementType.TRANSFER))
+    target = db.session.get(MovementDailyRollup, (date(2026, 3, 2), sample_product.id, 'STORE-002',
+                                                  MovementType.TRANSFER))
+    assert (source.units_in, source.units_out, source.movement_count) == (0, 8, 2)
+    assert (target.units_in, target.units_out, target.movement_count) == (8, 0, 2)
+
+
+def test_rebuild_rollups_matches_incremental(database, sample_product):
+    add_movement(sample_product, datetime(2026, 3, 2, 9), 5)
+    add_movement(sample_product, datetime(2026, 3, 3, 9), 4, MovementType.IN, source=None)
+    before = sorted(row.to_dict().items() for row in MovementDailyRollup.query)
+
+    db.session.query(MovementDailyRollup).delete()
+    assert rollups.rebuild_rollups(db.session, date(2026, 3, 1)) == 3
+    db.session.commit()
+    assert sorted(row.to_dict().items() for row in MovementDailyRollup.query) == before
+
+
+def test_movement_report_by_week(client, database, sample_product):
+    add_movement(sample_product, datetime(2026, 3, 2, 9), 5)   # Monday
+    add_movement(sample_product, datetime(2026, 3, 6, 9), 2)   # Friday, same week
+    add_movement(sample_product, datetime(2026, 3, 9, 9), 1)   # next Monday
+
+    response = client.get('/api/reports/movements?granularity=week&store_id=STORE-001')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [(row['period'], row['units_out']) for row in data] == [('2026-03-02', 7), ('2026-03-09', 1)]
+    assert data[0]['store_id'] == 'STORE-001'
+    assert data[0]['type'] == 'TRANSFER'
+
+
+def test_movement_report_by_month_and_product(client, database, sample_product):
+    add_movement(sample_product, datetime(2026, 3, 2, 9), 5)
+    add_movement(sample_product, datetime(2026, 4, 1, 9), 2)
+
+    response = client.get('/api/reports/movements?granularity=month&group_by=product_id&since=2026-03-01')
+    data = json.loads(response.data)
+    assert data == [
+        {'period': '2026-03-01', 'product_id': sample_product.id, 'store_id': None, 'type': None,
+         'units_in': 5, 'units_out': 5, 'movement_count': 2},
+        {'period': '2026-04-01', 'product_id': sample_product.id, 'store_id': None, 'type': None,
+         'units_in': 2, 'units_out': 2, 'movement_count': 2},
+    ]
+
+
+def test_movement_report_validates_granularity(client, database):
+    response = client.get('/api/reports/movements?granularity=hour')
+    assert response.status_code == 400
@@ -0,0 +1,266 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.main import create_app, init_db
+from app.models.inventory import Inventory
+from app.models.movement import Movement, MovementType
+from app.models.product import Product
+from app.models.shard_transfer import AppliedTransfer, ShardTransfer
+from app.services import notifications, shards
+from app.utils import sharding
+
+
+@pytest.fixture
+def sharded_app():
+    paths = [tempfile.mkstemp(suffix='.db')[1] for _ in range(3)]
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{paths[0]}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'LEDGER_ARCHIVE_DIR': tempfile.mkdtemp(),
+        'SHARD_DATABASE_URLS': ','.join(f'sqlite:///{path}' for path in paths[1:]),
+        'SHARD_MAP': 'NORTH-1=0,NORTH-2=0,SOUTH-1=1',
+    })
+    init_db(app)
+    yield app
+    for path in paths:
+        os.unlink(path)
+
+
+@pytest.fixture
+def sharded_client(sharded_app):
+    return sharded_app.test_client()
+
+
+def post(client, url, body):
+    return client.post(url, data=json.dumps(body), content_type='application/json')
+
+
+def on_shard(app, key, query):
+    with app.app_context(), sharding.shard_session(key) as session:
+        return query(session)
+
+
+@pytest.fixture
+def stocked(sharded_app, sharded_client):
+    product = post(sharded_client, '/api/products', {
+        'name': 'Sharded Product', 'category': 'Test', 'price': 5, 'sku': 'SHARD-001'
+    }).get_json()
+    for store_id in ('NORTH-1', 'SOUTH-1'):
+        response = post(sharded_client, f'/api/stores/{store_id}/inventory',
+                        {'product_id': product['id'], 'quantity': 50, 'min_stock': 10})
+        assert response.status_code == 201
+    return product
+
+
+def quantities(app, product_id):
+    found = {}
+    for key in ('shard0', 'shard1'):
+        rows = on_shard(app, key, lambda session: session.query(Inventory.store_id, Inventory.quantity)
+                        .filter_by(product_id=product_id).all())
+        found[key] = dict(rows)
+    return found
+
+
+def test_products_replicate_and_inventory_routes_by_store(sharded_app, sharded_client, stocked):
+    for key in ('shard0', 'shard1'):
+        assert on_shard(sharded_app, key, lambda session: session.get(Product, stocked['id']).sku) == 'SHARD-001'
+    assert quantities(sharded_app, stocked['id']) == {'shard0': {'NORTH-1': 50}, 'shard1': {'SOUTH-1': 50}}
+
+    response = sharded_client.put(f'/api/products/{stocked["id"]}', data=json.dumps({'name': 'Renamed'}),
+                                  content_type='application/json')
+    assert response.status_code == 200
+    assert on_shard(sharded_app, 'shard1', lambda session: session.get(Product, stocked['id']).name) == 'Renamed'
+
+    listing = sharded_client.get('/api/stores/SOUTH-1/inventory').get_json()
+    assert [(item['store_id'], item['quantity']) for item in listing] == [('SOUTH-1', 50)]
+
+
+def test_same_shard_transfer_is_local(sharded_app, sharded_client, stocked):
+    response = post(sharded_client, '/api/inventory/transfer', {
+        'product_id': stocked['id'], 'source_store_id': 'NORTH-1', 'target_store_id': 'NORTH-2', 'quantity': 5
+    })
+    assert response.status_code == 201
+    assert quantities(sharded_app, stocked['id'])['shard0'] == {'NORTH-1': 45, 'NORTH-2': 5}
+    assert on_shard(sharded_app, 'shard1',
+                    lambda session: session.query(Movement).filter_by(type=MovementType.TRANSFER).count()) == 0
+
+
+def test_cross_shard_transfer_reserves_then_commits(sharded_app, sharded_client, stocked):
+    response = post(sharded_client, '/api/inventory/transfer', {
+        'product_id': stocked['id'], 'source_store_id': 'NORTH-1', 'target_store_id': 'SOUTH-1', 'quantity': 20
+    })
+    assert response.status_code == 201
+    movement = response.get_json()
+    assert (movement['source_store_id'], movement['target_store_id']) == ('NORTH-1', 'SOUTH-1')
+    assert quantities(sharded_app, stocked['id']) == {'shard0': {'NORTH-1': 30}, 'shard1': {'SOUTH-1': 70}}
+    for key in ('shard0', 'shard1'):
+        row = on_shard(sharded_app, key, lambda session: session.get(Movement, movement['id']).to_dict())
+        assert (row['source_store_id'], row['target_store_id']) == ('NORTH-1', 'SOUTH-1')
+    assert on_shard(sharded_app, 'shard0',
+                    lambda session: session.get(ShardTransfer, movement['id']).state) == shards.COMMITTED
+
+    response = post(sharded_client, '/api/inventory/transfer', {
+        'product_id': stocked['id'], 'source_store_id': 'NORTH-1', 'target_store_id': 'SOUTH-1', 'quantity': 31
+    })
+    assert response.status_code == 400
+    assert quantities(sharded_app, stocked['id'])['shard0'] == {'NORTH-1': 30}
+
+
+def test_rejected_target_releases_the_reservation(sharded_app, stocked):
+    def drop_replica(session):
+        session.query(Inventory).delete()
+        session.query(Product).delete()
+        session.commit()
+
+    on_shard(sharded_app, 'shard1', drop_replica)
+    with sharded_app.test_request_context():
+        movement, state, error = shards.transfer(stocked['id'], 'NORTH-1', 'SOUTH-1', 10)
+    assert (state, error) == (shards.RELEASED, 'Product not found')
+    assert quantities(sharded_app, stocked['id'])['shard0'] == {'NORTH-1': 50}
+    states = on_shard(sharded_app, 'shard0', lambda session: [row.state for row in session.query(ShardTransfer)])
+    assert states == [shards.RELEASED]
+
+
+def test_recover_rolls_reserved_transfers_forward(sharded_app, stocked):
+    with sharded_app.app_context():
+        transfer_id, error = shards.reserve(stocked['id'], 'NORTH-1', 'SOUTH-1', 15)
+        assert error is None
+
+        def age(session):
+            session.execute(update(ShardTransfer).values(created_at=datetime.utcnow() - timedelta(minutes=5)))
+            session.commit()
+
+        on_shard(sharded_app, 'shard0', age)
+        assert quantities(sharded_app, stocked['id']) == {'shard0': {'NORTH-1': 35}, 'shard1': {'SOUTH-1': 50}}
+
+        assert shards.recover(older_than=60) == {shards.COMMITTED: 1, shards.RELEASED: 0, shards.RESERVED: 0}
+        assert shards.recover(older_than=60) == {shards.COMMITTED: 0, shards.RELEASED: 0, shards.RESERVED: 0}
+    assert quantities(sharded_app, stocked['id']) == {'shard0': {'NORTH-1': 35}, 'shard1': {'SOUTH-1': 65}}
+
+
+def test_target_applies_each_transfer_once(sharded_app, stocked):
+    with sharded_app.app_context():
+        applied, error = shards.reserve(stocked['id'], 'NORTH-1', 'SOUTH-1', 5)
+        rejected, error = shards.reserve(stocked['id'], 'NORTH-1', 'SOUTH-1', 7)
+
+        def record_first_runs(session):
+            # As if another run of step 2 committed first, before any movement was visible
+            session.add_all([AppliedTransfer(id=applied), AppliedTransfer(id=rejected, error='Product not found')])
+            session.commit()
+
+        on_shard(sharded_app, 'shard1', record_first_runs)
+        for transfer_id, quantity in ((applied, 5), (rejected, 7)):
+            pending = {'id': transfer_id, 'product_id': stocked['id'], 'source_store_id': 'NORTH-1',
+                       'target_store_id': 'SOUTH-1', 'quantity': quantity}
+            assert shards.apply_target(pending) == (None if transfer_id == applied else 'Product not found')
+        assert quantities(sharded_app, stocked['id'])['shard1'] == {'SOUTH-1': 50}
+        assert shards.complete(rejected, 'NORTH-1', 'Product not found')[1] == shards.RELEASED
+    assert quantities(sharded_app, stocked['id'])['shard0'] == {'NORTH-1': 45}
+
+
+def test_failed_release_keeps_the_transfer_reserved(sharded_app, stocked):
+    with sharded_app.app_context():
+        transfer_id, _ = shards.reserve(stocked['id'], 'NORTH-1', 'SOUTH-1', 10)
+
+        def drop_source(session):
+            session.query(Inventory).delete()
+            session.query(Product).delete()
+            session.commit()
+
+        on_shard(sharded_app, 'shard0', drop_source)
+        _, state = shards.complete(transfer_id, 'NORTH-1', 'Product not found')
+    assert state == shards.RESERVED
+    assert on_shard(sharded_app, 'shard0', lambda session: session.get(ShardTransfer, transfer_id).state) == \
+        shards.RESERVED
+
+
+def test_alerts_fan_out_across_shards(sharded_app, sharded_client, stocked):
+    for store_id in ('NORTH-1', 'SOUTH-1'):
+        response = post(sharded_client, '/api/inventory/adjustments', {'lines': [
+            {'product_id': stocked['id'], 'store_id': store_id, 'type': 'OUT', 'quantity': 45}
+        ]})
+        assert response.status_code == 201
+    response = post(sharded_client, '/api/inventory/adjustments', {'lines': [
+        {'product_id': stocked['id'], 'store_id': 'NORTH-1', 'type': 'IN', 'quantity': 1},
+        {'product_id': stocked['id'], 'store_id': 'SOUTH-1', 'type': 'IN', 'quantity': 1},
+    ]})
+    assert response.status_code == 400
+
+    alerts = sharded_client.get('/api/inventory/alerts').get_json()
+    assert sorted((alert['store_id'], alert['missing_quantity']) for alert in alerts) == [
+        ('NORTH-1', 5), ('SOUTH-1', 5)
+    ]
+
+
+def test_cross_store_endpoints_need_a_store(sharded_app, sharded_client, stocked):
+    moved = post(sharded_client, '/api/inventory/transfer', {
+        'product_id': stocked['id'], 'source_store_id': 'NORTH-1', 'target_store_id': 'SOUTH-1', 'quantity': 5
+    }).get_json()
+    for url in ('/api/inventory/movements', '/api/inventory/movements/export',
+                f'/api/inventory/as-of?timestamp=2030-01-01T00:00:00Z&product_id={stocked["id"]}',
+                '/api/inventory/recommendations', '/api/reports/movements', '/api/changes'):
+        response = sharded_client.get(url)
+        assert response.status_code == 400, url
+        assert response.get_json() == {'error': 'store_id is required while sharding is on'}
+
+    listed = sharded_client.get('/api/inventory/movements?store_id=SOUTH-1').get_json()
+    assert listed[-1]['id'] == moved['id']
+    assert all('SOUTH-1' in (movement['source_store_id'], movement['target_store_id']) for movement in listed)
+    assert sharded_client.get('/api/products?min_stock=1').status_code == 400
+    assert post(sharded_client, '/api/jobs', {'kind': 'recommendations', 'params': {}}).status_code == 400
+    assert post(sharded_client, '/api/inventory/rebalance/plan', {}).status_code == 400
+
+    pairs = [{'product_id': stocked['id'], 'store_id': store_id} for store_id in ('NORTH-1', 'SOUTH-1')]
+    assert post(sharded_client, '/api/inventory/lookup', {'pairs': pairs}).status_code == 400
+    found = post(sharded_client, '/api/inventory/lookup', {'pairs': pairs[1:]}).get_json()
+    assert found['items'][0]['inventory']['quantity'] == 55
+
+
+def test_maintenance_commands_run_on_every_shard(sharded_app, sharded_client, stocked, monkeypatch):
+    for store_id in ('NORTH-1', 'SOUTH-1'):
+        post(sharded_client, '/api/inventory/adjustments', {'lines': [
+            {'product_id': stocked['id'], 'store_id': store_id, 'type': 'OUT', 'quantity': 45}
+        ]})
+    sharded_app.config['NOTIFY_WEBHOOK_URLS'] = 'http://hooks.example/low-stock'
+    delivered = []
+    monkeypatch.setattr(notifications, 'post_batch', lambda url, events, timeout: delivered.extend(events))
+    runner = sharded_app.test_cli_runner()
+
+    result = runner.invoke(args=['notifications', 'dispatch', '--once'])
+    assert [json.loads(line) for line in result.output.splitlines()] == [
+        {'shard': 'shard0', 'delivered': 1}, {'shard': 'shard1', 'delivered': 1}
+    ]
+    assert sorted(event['store_id'] for event in delivered) == ['NORTH-1', 'SOUTH-1']
+
+    result = runner.invoke(args=['ledger', 'checkpoint'])
+    assert [(line['shard'], line['rows']) for line in map(json.loads, result.output.splitlines())] == [
+        ('shard0', 1), ('shard1', 1)
+    ]
+    result = runner.invoke(args=['stores', 'refresh', 'SOUTH-1'])
+    assert [json.loads(line) for line in result.output.splitlines()] == [{'shard': 'shard1', 'refreshed': 1}]
+
+    result = runner.invoke(args=['jobs', 'work', '--once'])
+    assert result.exit_code != 0
+    assert 'not available while sharding is on' in result.output
+
+
+def test_rebuild_sums_only_the_shards_own_stores(sharded_app, sharded_client, stocked):
+    response = post(sharded_client, '/api/inventory/transfer', {
+        'product_id': stocked['id'], 'source_store_id': 'NORTH-1', 'target_store_id': 'SOUTH-1', 'quantity': 20
+    })
+    assert response.status_code == 201
+
+    result = sharded_app.test_cli_runner().invoke(args=['ledger', 'rebuild', '--apply', '--workers', '1'])
+    reports = [json.loads(line) for line in result.output.splitlines()]
+    assert [(report['shard'], report['mismatches'], report['corrected']) for report in reports] == [
+        ('shard0', 0, 0), ('shard1', 0, 0)
+    ]
+    assert quantities(sharded_app, stocked['id']) == {'shard0': {'NORTH-1': 30}, 'shard1': {'SOUTH-1': 70}}
+    listed = sorted(store['id'] for store in sharded_client.get('/api/stores').get_json())
+    assert listed == ['NORTH-1', 'SOUTH-1']
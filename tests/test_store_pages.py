@@ -0,0 +1,76 @@
+import json
+import uuid
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.product import Product
+
+
+def stock_store(count):
+    for index in range(count):
+        product = Product(id=str(uuid.uuid4()), name=f'Product {index}', category='Paging', price=index + 1,
+                          sku=f'PAGE-{index:03d}')
+        db.session.add(product)
+        db.session.add(Inventory(id=str(uuid.uuid4()), product_id=product.id, store_id='STORE-PAGE',
+                                 quantity=index, min_stock=1))
+    db.session.commit()
+
+
+def test_keyset_pages_cover_the_store_once(client, database):
+    stock_store(7)
+    everything = client.get('/api/stores/STORE-PAGE/inventory').get_json()
+
+    pages, url = [], '/api/stores/STORE-PAGE/inventory?limit=3'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        url = cursor and f'/api/stores/STORE-PAGE/inventory?limit=3&cursor={cursor}'
+        if cursor:
+            assert f'cursor={cursor}' in response.headers['Link']
+            assert response.headers['Link'].endswith('; rel="next"')
+    assert [len(page) for page in pages] == [3, 3, 1]
+    paged = [row for page in pages for row in page]
+    assert [row['product_id'] for row in paged] == sorted(row['product_id'] for row in everything)
+    assert sorted(paged, key=lambda row: row['id']) == sorted(everything, key=lambda row: row['id'])
+
+
+def test_sparse_pages_keep_their_cursor(client, database):
+    stock_store(4)
+    response = client.get('/api/stores/STORE-PAGE/inventory?fields=quantity&limit=2')
+    assert len(response.get_json()) == 2
+    assert all(set(row) == {'quantity'} for row in response.get_json())
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/api/stores/STORE-PAGE/inventory?fields=quantity&limit=2&cursor={cursor}')
+    assert len(response.get_json()) == 2
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_invalid_paging_arguments_are_rejected(client, database):
+    for query in ('cursor=not-a-cursor', 'cursor=WzFd', 'stream=csv', 'stream=json&limit=5', 'limit=abc', 'limit=0',
+                  'limit=-3'):
+        response = client.get(f'/api/stores/STORE-PAGE/inventory?{query}')
+        assert response.status_code == 400, query
+        assert 'error' in response.get_json()
+
+
+def test_json_stream_matches_the_full_listing(client, database):
+    stock_store(5)
+    listing = client.get('/api/stores/STORE-PAGE/inventory').get_json()
+    response = client.get('/api/stores/STORE-PAGE/inventory?stream=json')
+    assert response.is_streamed
+    assert response.mimetype == 'application/json'
+    streamed = json.loads(response.get_data())
+    assert sorted(streamed, key=lambda row: row['id']) == sorted(listing, key=lambda row: row['id'])
+    assert json.loads(client.get('/api/stores/STORE-EMPTY/inventory?stream=json').get_data()) == []
+
+
+def test_ndjson_stream_resumes_after_a_cursor(client, database):
+    stock_store(5)
+    cursor = client.get('/api/stores/STORE-PAGE/inventory?limit=2').headers['X-Next-Cursor']
+    response = client.get(f'/api/stores/STORE-PAGE/inventory?stream=ndjson&fields=id,quantity&cursor={cursor}')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 3
+    assert all(set(line) == {'id', 'quantity'} for line in lines)
@@ -0,0 +1,114 @@
+import json
+import uuid
+
+from app.main import db
+from app.models.inventory import Inventory
+from app.models.product import Product
+from app.models.store import Store
+from app.services import counters, stores
+
+
+def post(client, url, payload):
+    response = client.post(url, data=json.dumps(payload), content_type='application/json')
+    return response.status_code, json.loads(response.data)
+
+
+def summary(client, store_id):
+    data = client.get(f'/api/stores/{store_id}/summary').get_json()
+    return data['sku_count'], data['total_units'], data['total_value'], data['low_stock_count']
+
+
+def assert_matches_recompute(client):
+    """The incrementally maintained totals equal a recomputation from the inventory."""
+    maintained = {store['id']: store for store in client.get('/api/stores').get_json()}
+    with db.engine.begin() as connection:
+        stores.refresh(connection)
+    recomputed = {store['id']: store for store in client.get('/api/stores').get_json()}
+    for totals in (maintained, recomputed):
+        for store in totals.values():
+            store.pop('updated_at')
+    assert maintained == recomputed
+
+
+def test_summary_follows_orm_writes(client, sample_inventory):
+    assert summary(client, 'STORE-001') == (1, 100, 1099.0, 0)
+
+    status, _ = post(client, '/api/inventory/transfer', {
+        'product_id': sample_inventory.product_id, 'source_store_id': 'STORE-001',
+        'target_store_id': 'STORE-002', 'quantity': 95
+    })
+    assert status == 201
+    assert summary(client, 'STORE-001') == (1, 5, 54.95, 1)
+    assert summary(client, 'STORE-002') == (1, 95, 1044.05, 0)
+    assert [store['id'] for store in client.get('/api/stores').get_json()] == ['STORE-001', 'STORE-002']
+
+    db.session.delete(db.session.get(Inventory, sample_inventory.id))
+    db.session.commit()
+    assert summary(client, 'STORE-001') == (0, 0, 0.0, 0)
+    assert client.get('/api/stores/STORE-404/summary').status_code == 404
+    assert_matches_recompute(client)
+
+
+def test_price_changes_revalue_every_store(client, sample_inventory):
+    db.session.add(Inventory(id=str(uuid.uuid4()), product_id=sample_inventory.product_id, store_id='STORE-002',
+                             quantity=10, min_stock=0))
+    db.session.commit()
+
+    response = client.put(f'/api/products/{sample_inventory.product_id}', data=json.dumps({'price': 2}),
+                          content_type='application/json')
+    assert response.status_code == 200
+    assert summary(client, 'STORE-001')[2] == 200.0
+    assert summary(client, 'STORE-002')[2] == 20.0
+
+    status, _ = post(client, '/api/products/bulk-update',
+                     {'filter': {'skus': ['TEST-SKU-001']}, 'operation': {'op': 'multiply', 'value': 1.5}})
+    assert status == 200
+    assert summary(client, 'STORE-001')[2] == 300.0
+    assert summary(client, 'STORE-002')[2] == 30.0
+    assert_matches_recompute(client)
+
+
+def test_bulk_writers_keep_totals_current(client, sample_inventory):
+    other = Product(id=str(uuid.uuid4()), name='Other', category='Test Category', price=4, sku='OTHER')
+    db.session.add(other)
+    db.session.commit()
+
+    status, _ = post(client, '/api/inventory/adjustments', {'lines': [
+        {'product_id': sample_inventory.product_id, 'store_id': 'STORE-001', 'type': 'OUT', 'quantity': 40},
+        {'product_id': other.id, 'store_id': 'STORE-001', 'type': 'IN', 'quantity': 5},
+    ]})
+    assert status == 201
+    # The new row starts with min_stock 0, so it is not low
+    assert summary(client, 'STORE-001') == (2, 65, 679.4, 0)
+
+    status, _ = post(client, '/api/inventory/bulk-update',
+                     {'filter': {'store_ids': ['STORE-001']}, 'operation': {'op': 'set', 'value': 60}})
+    assert status == 200
+    assert summary(client, 'STORE-001')[3] == 2
+    assert_matches_recompute(client)
+
+
+def test_hot_rows_report_their_slot_totals(client, sample_inventory):
+    counters.enable(db.session, sample_inventory.id, slots=4)
+    db.session.commit()
+
+    status, _ = post(client, '/api/inventory/adjustments', {'lines': [
+        {'product_id': sample_inventory.product_id, 'store_id': 'STORE-001', 'type': 'OUT', 'quantity': 92},
+    ]})
+    assert status == 201
+    assert summary(client, 'STORE-001') == (1, 8, 87.92, 1)
+
+    db.session.get(Product, sample_inventory.product_id).price = 1
+    db.session.commit()
+    assert summary(client, 'STORE-001')[2] == 8.0
+    assert_matches_recompute(client)
+
+
+def test_refresh_command_repairs_totals(app, client, sample_inventory):
+    db.session.get(Store, 'STORE-001').total_units = 7
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['stores', 'refresh', 'STORE-001'])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output) == {'refreshed': 1}
+    assert summary(client, 'STORE-001') == (1, 100, 1099.0, 0)
@@ -0,0 +1,64 @@
+import json
+
+
+def create_product(client, sku):
+    response = client.post('/api/products', data=json.dumps({
+        'name': 'Sync Product', 'category': 'Test', 'price': 5.0, 'sku': sku
+    }), content_type='application/json')
+    return json.loads(response.data)['id']
+
+
+def sync_all(client, url, token=None, limit=2):
+    items, deleted = [], []
+    while True:
+        query = f'{url}?limit={limit}' + (f'&since={token}' if token else '')
+        data = json.loads(client.get(query).data)
+        items += data['items']
+        deleted += data['deleted']
+        token = data['next_token']
+        if not data['has_more']:
+            return items, deleted, token
+
+
+def test_product_snapshot_then_delta(client, database):
+    ids = [create_product(client, f'SYNC-{i}') for i in range(3)]
+    items, deleted, token = sync_all(client, '/api/sync/products')
+    assert sorted(item['id'] for item in items) == sorted(ids)
+    assert deleted == []
+    assert ':' not in token
+
+    items, deleted, token = sync_all(client, '/api/sync/products', token)
+    assert items == [] and deleted == []
+
+    client.put(f'/api/products/{ids[0]}', data=json.dumps({'price': 7.5}), content_type='application/json')
+    client.delete(f'/api/products/{ids[1]}')
+    new_id = create_product(client, 'SYNC-NEW')
+
+    items, deleted, token = sync_all(client, '/api/sync/products', token)
+    assert sorted(item['id'] for item in items) == sorted([ids[0], new_id])
+    assert [item['price'] for item in items if item['id'] == ids[0]] == [7.5]
+    assert deleted == [ids[1]]
+
+
+def test_store_sync_only_returns_that_store(client, database, sample_product):
+    for store_id in ('STORE-001', 'STORE-002'):
+        client.post(f'/api/stores/{store_id}/inventory', data=json.dumps({
+            'product_id': sample_product.id, 'quantity': 10, 'min_stock': 1
+        }), content_type='application/json')
+    items, _, token = sync_all(client, '/api/stores/STORE-001/sync')
+    assert [item['store_id'] for item in items] == ['STORE-001']
+
+    client.post('/api/inventory/transfer', data=json.dumps({
+        'product_id': sample_product.id, 'source_store_id': 'STORE-002',
+        'target_store_id': 'STORE-003', 'quantity': 4
+    }), content_type='application/json')
+    items, _, token = sync_all(client, '/api/stores/STORE-001/sync', token)
+    assert items == []
+
+    items, _, _ = sync_all(client, '/api/stores/STORE-002/sync', token)
+    assert [(item['store_id'], item['quantity']) for item in items] == [('STORE-002', 6)]
+
+
+def test_sync_rejects_invalid_token(client, database):
+    assert client.get('/api/sync/products?since=abc').status_code == 400
+    assert client.get('/api/stores/STORE-001/sync?since=-1').status_code == 400